@@ -0,0 +1,68 @@
+import argparse
+
+from app.db import SessionLocal
+from app.services import archive, routing, session_tokens, usage
+
+
+def backfill_telegram_fingerprints(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        updated = routing.backfill_telegram_fingerprints(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"telegram fingerprints backfilled: {updated}")
+
+
+def backfill_ai_usage(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        tenants = usage.backfill_ai_usage(db, period=args.period)
+    finally:
+        db.close()
+    print(f"ai usage counters rebuilt for {tenants} tenants")
+
+
+def purge_tokens(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        deleted = session_tokens.purge(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"expired/revoked refresh tokens deleted: {deleted['refresh_tokens']}, spent reset tokens deleted: {deleted['password_reset_tokens']}")
+
+
+def archive_old_rows(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        archived = archive.archive_all(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"archived messages: {archived['messages']}, system logs: {archived['system_logs']}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill-telegram-fingerprints", help="Fill token_fingerprint for existing Telegram integrations")
+    backfill.add_argument("--batch-size", type=int, default=500)
+    backfill.set_defaults(func=backfill_telegram_fingerprints)
+
+    usage_backfill = commands.add_parser("backfill-ai-usage", help="Rebuild AI usage counters of a period from stored messages")
+    usage_backfill.add_argument("--period", help="YYYY-MM, defaults to the current month")
+    usage_backfill.set_defaults(func=backfill_ai_usage)
+
+    purge = commands.add_parser("purge-tokens", help="Delete expired or revoked refresh tokens and spent password reset tokens")
+    purge.add_argument("--batch-size", type=int, default=1000)
+    purge.set_defaults(func=purge_tokens)
+
+    archiver = commands.add_parser("archive", help="Move messages and system logs past their plan's retention to ARCHIVE_DIR")
+    archiver.add_argument("--batch-size", type=int, default=2000)
+    archiver.set_defaults(func=archive_old_rows)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,21 +8,122 @@ class Settings(BaseSettings):
     api_prefix: str = "/api"
 
     database_url: str = "sqlite:///./core_ai_hub.db"
+    # Derived from database_url (asyncpg / aiosqlite) when not set.
+    async_database_url: str | None = None
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_pre_ping: bool = True
+    db_pool_recycle_seconds: int = 1800
+    # Run pending migrations on startup instead of refusing to boot; meant for local development.
+    db_auto_migrate: bool = False
 
     jwt_secret: str = "change-me-in-production"
     jwt_algorithm: str = "HS256"
     access_token_minutes: int = 30
     refresh_token_minutes: int = 60 * 24 * 7
+    # A rotated token presented again within this window is refused without revoking its family.
+    refresh_token_reuse_grace_seconds: int = 30
+    # Rotated and logged-out tokens are kept this long so a replay is still recognised as reuse.
+    refresh_token_revoked_retention_minutes: int = 60 * 24
+    # 0 disables the background purge; `python -m app.cli purge-tokens` does the same on demand.
+    token_purge_interval_seconds: float = 3600.0
+    token_purge_batch_size: int = 1000
+
+    # Messages and system logs older than their plan's retention move here as gzipped NDJSON.
+    archive_dir: str = "archive"
+    archive_batch_size: int = 2000
+    # 0 runs the archiver only through `python -m app.cli archive`; enable it in a single process only.
+    archive_interval_seconds: float = 0.0
 
     encryption_key: str = "dev-encryption-key"
 
+    # Raising the cost re-hashes each password on its next successful login.
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
+    # Hashes running or queued before login/register/reset answer 429.
+    password_hash_max_pending: int = 16
+
     openai_api_key: str | None = None
     openai_model: str = "gpt-4o-mini"
 
+    ai_provider: str = "openai"  # openai | fake
+    ai_max_concurrency: int = 32
+    # AI calls a tenant may have waiting (rate limit + fair queue) before further ones get a holding reply.
+    ai_tenant_queue_limit: int = 50
+    ai_timeout_seconds: float = 30.0
+    fake_ai_latency_ms: int = 0
+    webhook_reply_concurrency: int = 8
+    # Recently seen update/message ids; older re-deliveries are still caught by messages.dedup_key.
+    webhook_dedup_size: int = 100000
+    webhook_dedup_ttl_seconds: int = 3600
+    # Stream completions token by token to dashboard viewers of the conversation (SSE).
+    ai_streaming: bool = True
+    # Approximate token budget for conversation history in the prompt; older turns are folded into a rolling summary.
+    ai_context_tokens: int = 1200
+    ai_context_max_messages: int = 40
+    ai_summary_tokens: int = 250
+    # Opt-in: reuse replies to repeated opening questions per tenant instead of calling the provider again.
+    ai_reply_cache: bool = False
+    ai_reply_cache_ttl_seconds: int = 3600
+    ai_reply_cache_per_tenant: int = 200
+    ai_reply_cache_tenants: int = 1000
+    ai_reply_cache_max_chars: int = 200
+
+    event_queue_size: int = 100
+    sse_keepalive_seconds: float = 15.0
+
+    # 1 writes every increment through; larger values buffer increments in memory until the batch fills.
+    ai_usage_batch_size: int = 1
+    ai_usage_flush_seconds: float = 5.0
+
+    db_thread_pool_size: int = 16
+
+    log_sink_mode: str = "sync"  # sync | buffered
+    log_sink_batch_size: int = 200
+    log_sink_max_pending: int = 5000
+    log_sink_flush_seconds: float = 1.0
+
+    # Sends AI and agent replies to the customer's channel; point the API URLs at app.fake_platforms for local runs.
+    delivery_enabled: bool = True
+    delivery_workers: int = 8
+    delivery_queue_size: int = 10000
+    delivery_max_attempts: int = 5
+    delivery_backoff_seconds: float = 0.5
+    delivery_backoff_max_seconds: float = 30.0
+    delivery_timeout_seconds: float = 10.0
+    delivery_max_connections: int = 100
+    # Replies still pending this long after being stored are resubmitted (queue was full, worker restarted, ...).
+    delivery_sweep_interval_seconds: float = 60.0
+    delivery_pending_grace_seconds: float = 60.0
+    delivery_sweep_batch_size: int = 500
+    # Longer than a delivery with all its retries can take.
+    delivery_claim_seconds: float = 300.0
+    telegram_api_url: str = "https://api.telegram.org"
+    graph_api_url: str = "https://graph.facebook.com/v20.0"
+
     webhook_base_url: str = "http://localhost:8000"
     frontend_url: str = "https://app.seudominio.com"
 
     meta_app_secret: str = "change-me-meta-secret"
 
+    routing_cache_size: int = 10000
+    routing_cache_ttl_seconds: int = 300
+    tenant_cache_size: int = 5000
+    tenant_cache_ttl_seconds: int = 60
+    ai_client_pool_size: int = 1000
+    auth_cache_size: int = 20000
+    auth_cache_ttl_seconds: int = 60
+
+    # Before /api/ready reports ready: open the DB pools, configure mappers, fill the tenant and route caches and create HTTP clients.
+    warmup_enabled: bool = True
+    warmup_tenants: int = 1000
+
+    metrics_enabled: bool = True
+    # GET /api/metrics is served only when this is set, and requires "Authorization: Bearer <token>".
+    metrics_token: str | None = None
+    # Tenants beyond this many distinct ids are reported as tenant="other"; false drops the tenant label.
+    metrics_per_tenant: bool = True
+    metrics_max_tenants: int = 500
+
 
 settings = Settings()
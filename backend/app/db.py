@@ -1,14 +1,39 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from app.config import settings
 
-connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
+is_sqlite = settings.database_url.startswith("sqlite")
+connect_args = {"check_same_thread": False} if is_sqlite else {}
+
+
+def pool_options() -> dict:
+    options = {"pool_pre_ping": settings.db_pool_pre_ping, "pool_recycle": settings.db_pool_recycle_seconds}
+    if not is_sqlite:
+        options.update(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow)
+    return options
+
+
+def async_database_url() -> str:
+    if settings.async_database_url:
+        return settings.async_database_url
+    url = make_url(settings.database_url)
+    driver = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}.get(url.get_backend_name())
+    return url.set(drivername=driver).render_as_string(hide_password=False) if driver else settings.database_url
+
 
 engine = create_engine(
     settings.database_url,
     future=True,
     connect_args=connect_args,
+    **pool_options(),
 )
 
 SessionLocal = sessionmaker(
@@ -17,12 +42,60 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
+async_engine = create_async_engine(async_database_url(), **pool_options())
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
 
+def dialect_insert(bind):
+    """Returns the dialect's ``insert`` construct when it supports ON CONFLICT upserts, else None."""
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def on_commit(session, key: str) -> list:
+    """The list ``key`` of work that this module's after_commit listeners hand off once ``session`` commits.
+
+    Begins the transaction if none is open: a rollback of a session that never started one fires no event,
+    and the queued work would otherwise leak into the next commit.
+    """
+    session = getattr(session, "sync_session", session)
+    if not session.in_transaction():
+        session.begin()
+    return session.info.setdefault(key, [])
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Sync sessions must never run on the event loop; async routes hop through this bounded pool instead.
+db_executor = ThreadPoolExecutor(max_workers=settings.db_thread_pool_size, thread_name_prefix="db")
+
+
+async def run_db(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context variables into the thread, like asyncio.to_thread does.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(context.run, fn, *args, **kwargs))
@@ -0,0 +1,78 @@
+"""Local stand-in for the Telegram Bot API and the Meta Graph API, for tests and load runs.
+
+    uvicorn app.fake_platforms:app --port 9100
+    TELEGRAM_API_URL=http://localhost:9100 GRAPH_API_URL=http://localhost:9100 uvicorn app.main:app
+
+Every accepted send is kept in memory (GET /_sent). POST /_fail with {"codes": [429, 500]} makes the
+next requests fail with those statuses, to exercise rate limiting and retries. FAKE_PLATFORM_LATENCY_MS
+delays every send, to stand in for the real APIs' response time.
+"""
+import asyncio
+import os
+from typing import Any
+
+from fastapi import Body, FastAPI
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Fake messaging platforms")
+
+sent: list[dict[str, Any]] = []
+failures: list[int] = []
+latency = float(os.environ.get("FAKE_PLATFORM_LATENCY_MS", "0")) / 1000
+
+
+def _failure() -> JSONResponse | None:
+    if not failures:
+        return None
+    code = failures.pop(0)
+    if code == 429:
+        return JSONResponse(
+            {"ok": False, "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 1}},
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+    return JSONResponse({"ok": False, "error_code": code, "description": "Fake failure"}, status_code=code)
+
+
+@app.post("/bot{token}/sendMessage")
+async def telegram_send(token: str, payload: dict = Body(...)):
+    if latency:
+        await asyncio.sleep(latency)
+    failure = _failure()
+    if failure:
+        return failure
+    sent.append({"platform": "telegram", "account": token, "to": str(payload.get("chat_id")), "text": payload.get("text")})
+    return {"ok": True, "result": {"message_id": len(sent), "chat": {"id": payload.get("chat_id")}, "text": payload.get("text")}}
+
+
+@app.post("/{account_id}/messages")
+async def graph_send(account_id: str, payload: dict = Body(...)):
+    if latency:
+        await asyncio.sleep(latency)
+    failure = _failure()
+    if failure:
+        return failure
+    if payload.get("messaging_product") == "whatsapp":
+        sent.append({"platform": "whatsapp", "account": account_id, "to": payload.get("to"), "text": payload.get("text", {}).get("body")})
+        return {"messaging_product": "whatsapp", "contacts": [{"wa_id": payload.get("to")}], "messages": [{"id": f"wamid.{len(sent)}"}]}
+    recipient = payload.get("recipient", {}).get("id")
+    sent.append({"platform": "instagram", "account": account_id, "to": recipient, "text": payload.get("message", {}).get("text")})
+    return {"recipient_id": recipient, "message_id": f"mid.{len(sent)}"}
+
+
+@app.get("/_sent")
+def list_sent():
+    return sent
+
+
+@app.post("/_fail")
+def fail_next(payload: dict = Body(...)):
+    failures.extend(int(code) for code in payload.get("codes", []))
+    return {"pending_failures": len(failures)}
+
+
+@app.delete("/_sent")
+def reset():
+    sent.clear()
+    failures.clear()
+    return {"ok": True}
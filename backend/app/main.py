@@ -1,18 +1,23 @@
-from datetime import datetime, timedelta, timezone
+import asyncio
+from datetime import datetime, timedelta
 import hashlib
 import hmac
+import json
 import secrets
 from typing import Any
 
-from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import and_, func, or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
 
-from app.routes import integrations, telegram
 from app.config import settings
-from app.db import Base, SessionLocal, engine, get_db
+from app.db import AsyncSessionLocal, SessionLocal, async_engine, dialect_insert, engine, get_async_db, get_db, run_db
 from app.models import (
+    AIConfig,
     Client,
     Conversation,
     Integration,
@@ -20,11 +25,12 @@ from app.models import (
     Notification,
     PasswordResetToken,
     Plan,
-    RefreshToken,
     SystemLog,
     User,
     Workspace,
 )
+from .pagination import decode_cursor, decode_score_cursor, encode_cursor, encode_score_cursor
+from .schema_version import ensure_schema_current
 from .schemas import (
     AIConfigIn,
     ForgotPasswordIn,
@@ -37,12 +43,9 @@ from .schemas import (
     TelegramIn,
     WhatsappIn,
 )
-from .security import create_token, decode_token, decrypt_secret, encrypt_secret, hash_password, verify_password
-
-try:
-    from openai import OpenAI
-except Exception:  # pragma: no cover
-    OpenAI = None
+from .security import create_token, decode_token, encrypt_secret
+from .services import ai_provider, ai_scheduler, archive, auth_cache, conversation_context, dedup, delivery, events, log_sink, metrics, passwords, reply_cache, routing, search, session_tokens, tenant_context, usage, warmup
+from .services.auth_cache import UserSnapshot
 
 
 app = FastAPI(title=settings.app_name)
@@ -52,42 +55,120 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+if settings.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument(engine)
+    metrics.instrument(async_engine.sync_engine)
 
-app.include_router(integrations.router, prefix="/api")
-app.include_router(telegram.router, prefix="/api")
 
 @app.on_event("startup")
 def startup() -> None:
-    Base.metadata.create_all(bind=engine)
+    ensure_schema_current(engine)
     db = SessionLocal()
     try:
         if not db.query(Plan).count():
             db.add_all(
                 [
-                    Plan(name="starter", max_users=3, max_channels=1, max_ai_messages=300, max_storage_mb=200),
-                    Plan(name="growth", max_users=15, max_channels=3, max_ai_messages=5000, max_storage_mb=2000),
-                    Plan(name="enterprise", max_users=200, max_channels=10, max_ai_messages=100000, max_storage_mb=15000),
+                    Plan(
+                        name="starter", max_users=3, max_channels=1, max_ai_messages=300, max_storage_mb=200, message_retention_days=90, log_retention_days=30,
+                        ai_requests_per_minute=30, ai_burst=10, ai_weight=1,
+                    ),
+                    Plan(
+                        name="growth", max_users=15, max_channels=3, max_ai_messages=5000, max_storage_mb=2000, message_retention_days=365, log_retention_days=90,
+                        ai_requests_per_minute=120, ai_burst=30, ai_weight=2,
+                    ),
+                    Plan(
+                        name="enterprise", max_users=200, max_channels=10, max_ai_messages=100000, max_storage_mb=15000, message_retention_days=730, log_retention_days=365,
+                        ai_requests_per_minute=600, ai_burst=100, ai_weight=4,
+                    ),
                 ]
             )
             db.commit()
     finally:
         db.close()
+    if log_sink.sink:
+        log_sink.sink.start()
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    if log_sink.sink:
+        log_sink.sink.stop()
+    db = SessionLocal()
+    try:
+        usage.batcher.flush(db)
+        db.commit()
+    finally:
+        db.close()
 
 
-def write_log(db: Session, client_id: int, category: str, action: str, details: str, level: str = "info"):
+@app.on_event("startup")
+async def start_delivery() -> None:
+    if settings.delivery_enabled:
+        delivery.dispatcher.start()
+    passwords.hasher.start()
+    session_tokens.start_purge(settings.token_purge_interval_seconds)
+    archive.start(settings.archive_interval_seconds)
+    warmup.start()
+
+
+@app.on_event("shutdown")
+async def dispose_async_engine() -> None:
+    await warmup.stop()
+    passwords.hasher.shutdown()
+    await session_tokens.stop_purge()
+    await archive.stop()
+    await delivery.dispatcher.stop()
+    await ai_provider.get_provider().aclose()
+    await async_engine.dispose()
+
+
+# Logs in these categories are always written inside the request transaction, even with the buffered sink.
+# Other rows go to the sink only once the request transaction commits.
+AUDIT_CATEGORIES = {"auth", "billing", "config", "integration"}
+
+
+def write_log(db: Session, client_id: int, category: str, action: str, details: str, level: str = "info", audit: bool | None = None):
+    if audit is None:
+        audit = category in AUDIT_CATEGORIES
+    if log_sink.sink and not audit:
+        log_sink.submit_after_commit(db, SystemLog, client_id=client_id, category=category, action=action, details=details, level=level)
+        return
     db.add(SystemLog(client_id=client_id, category=category, action=action, details=details, level=level))
 
 
-def notify(db: Session, client_id: int, kind: str, content: str, user_id: int | None = None):
-    db.add(Notification(client_id=client_id, user_id=user_id, type=kind, content=content))
+def notify(db: Session, client_id: int, kind: str, content: str, user_id: int | None = None, audit: bool = False):
+    event = {"type": "notification", "kind": kind, "content": content, "user_id": user_id, "created_at": datetime.utcnow().isoformat()}
+    if log_sink.sink and not audit:
+        log_sink.submit_after_commit(db, Notification, client_id=client_id, user_id=user_id, type=kind, content=content, read=False)
+    else:
+        db.add(Notification(client_id=client_id, user_id=user_id, type=kind, content=content))
+    events.publish_after_commit(db, events.client_topic(client_id), event)
+
+
+def publish_message(db: Session, client_id: int, conversation_id: int, message: Message) -> dict[str, Any]:
+    # Callers flush first so the payload carries the stored timestamp.
+    payload = to_message_payload(message)
+    events.publish_after_commit(db, events.client_topic(client_id), {"type": "message", "conversation_id": conversation_id, "message": payload})
+    return payload
 
 
-def current_user(authorization: str = Header(default=""), db: Session = Depends(get_db)) -> User:
+def publish_conversation(db: Session, client_id: int, conversation_id: int, **changes: Any) -> None:
+    events.publish_after_commit(db, events.client_topic(client_id), {"type": "conversation", "conversation_id": conversation_id, **changes})
+
+
+def current_user(authorization: str = Header(default=""), db: Session = Depends(get_db)) -> UserSnapshot:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing bearer token")
 
     token = authorization.split(" ", 1)[1]
+    cached = auth_cache.get(token)
+    if cached:
+        metrics.set_tenant(cached.client_id)
+        return cached
+
     try:
         payload = decode_token(token)
     except ValueError as exc:
@@ -106,61 +187,242 @@ def current_user(authorization: str = Header(default=""), db: Session = Depends(
     if user.status != "active":
         raise HTTPException(status_code=403, detail="User inactive")
 
-    return user
+    snapshot = UserSnapshot.of(user)
+    auth_cache.put(token, payload, snapshot)
+    metrics.set_tenant(snapshot.client_id)
+    return snapshot
 
 
-def require_role(user: User, roles: list[str]):
+def stream_user(authorization: str = Header(default=""), access_token: str = Query(default=""), db: Session = Depends(get_db)) -> UserSnapshot:
+    # EventSource can't send headers, so streaming endpoints also take the access token as a query parameter.
+    if not authorization and access_token:
+        authorization = f"Bearer {access_token}"
+    return current_user(authorization, db)
+
+
+def require_role(user: UserSnapshot, roles: list[str]):
     if user.role not in roles:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
 
 
-def get_plan(db: Session, client_id: int) -> Plan:
-    client = db.query(Client).filter(Client.id == client_id).first()
-    return db.query(Plan).filter(Plan.id == client.plan_id).first()
+def to_message_payload(m: Message) -> dict[str, Any]:
+    return {
+        "message": m.content,
+        "timestamp": m.created_at.isoformat(),
+        "from": "user" if m.sender == "customer" else m.sender,
+    }
 
 
-def to_chat_payload(conv: Conversation) -> dict[str, Any]:
+def to_chat_payload(conv: Conversation, messages: list[Message], window: int) -> dict[str, Any]:
     return {
         "name": conv.external_user_id,
         "platform": conv.channel,
         "status": conv.status,
-        "messages": [
-            {
-                "message": m.content,
-                "timestamp": m.created_at.isoformat(),
-                "from": "user" if m.sender == "customer" else m.sender,
-            }
-            for m in conv.messages
-        ],
+        "messages": [to_message_payload(m) for m in messages[-window:]] if window else [],
+        "last_message": to_message_payload(messages[-1]) if messages else None,
     }
 
 
-def generate_ai_reply(db: Session, client_id: int, incoming_text: str) -> str:
-    config = db.query(AIConfig).filter(AIConfig.client_id == client_id).first()
-    if not config:
+def load_message_windows(db: Session, conversation_ids: list[int], window: int) -> dict[int, list[Message]]:
+    """Loads the newest ``window`` messages of every conversation in one query, oldest first."""
+    if not conversation_ids:
+        return {}
+    ranked = (
+        db.query(
+            Message,
+            func.row_number()
+            .over(partition_by=Message.conversation_id, order_by=(Message.created_at.desc(), Message.id.desc()))
+            .label("rn"),
+        )
+        .filter(Message.conversation_id.in_(conversation_ids))
+        .subquery()
+    )
+    recent = aliased(Message, ranked)
+    rows = (
+        db.query(recent)
+        .filter(ranked.c.rn <= window)
+        .order_by(ranked.c.conversation_id, ranked.c.created_at, ranked.c.id)
+        .all()
+    )
+    windows: dict[int, list[Message]] = {cid: [] for cid in conversation_ids}
+    for m in rows:
+        windows[m.conversation_id].append(m)
+    return windows
+
+
+def keyset_before(created_col, id_col, cursor: str):
+    created_at, row_id = decode_cursor(cursor)
+    return or_(created_col < created_at, and_(created_col == created_at, id_col < row_id))
+
+
+def _prepare_ai_request(db: Session, client_id: int, incoming_text: str, conversation_id: int | None = None, message_id: int | None = None) -> dict[str, Any] | str:
+    """Returns the provider request for this message, or a canned reply when the provider can't be called."""
+    ctx = tenant_context.get_tenant_context(db, client_id)
+    if not ctx:
         return "Obrigado pela mensagem! Em breve retornaremos."
 
-    key = decrypt_secret(config.api_key_encrypted) if config.api_key_encrypted else settings.openai_api_key
-    if not key or OpenAI is None:
+    if not ai_provider.get_provider().ready(ctx.api_key):
         return "Recebemos sua mensagem e estamos processando seu atendimento."
 
-    plan = get_plan(db, client_id)
-    usage = db.query(Message).join(Conversation).filter(and_(Conversation.client_id == client_id, Message.sender == "ai")).count()
-    if usage >= plan.max_ai_messages:
+    if usage.get_ai_usage(db, client_id) >= ctx.max_ai_messages:
         notify(db, client_id, "plan_limit", "Limite de mensagens IA atingido para o plano atual.")
         return "Seu plano atingiu o limite de IA. Contate o administrador."
 
-    client = OpenAI(api_key=key)
-    completion = client.responses.create(
-        model=settings.openai_model,
-        input=[
-            {"role": "system", "content": config.base_prompt},
-            {"role": "user", "content": incoming_text},
-        ],
-        temperature=float(config.temperature),
-    )
+    system = ctx.base_prompt
+    turns = [{"role": "user", "content": incoming_text}]
+    if conversation_id:
+        context = conversation_context.load_context(db, conversation_id, message_id)
+        if context.summary:
+            system = f"{system}\n\nResumo da conversa até aqui:\n{context.summary}"
+        turns = context.turns or turns
+        if context.overflow:
+            conversation_context.schedule_refresh(client_id, conversation_id)
+
+    return {
+        "api_key": ctx.api_key,
+        "model": settings.openai_model,
+        "messages": [{"role": "system", "content": system}, *turns],
+        "temperature": ctx.temperature,
+    }
+
+
+class DeferredReply(str):
+    """Canned reply sent when the tenant's AI queue refused the call; stored without counting as an AI answer."""
+
+
+async def generate_ai_reply(
+    db: AsyncSession, client_id: int, incoming_text: str, conversation_id: int | None = None, message_id: int | None = None
+) -> str:
+    request = await db.run_sync(_prepare_ai_request, client_id, incoming_text, conversation_id, message_id)
+    if isinstance(request, str):
+        return request
+
+    ctx = tenant_context.contexts.get(client_id) or await db.run_sync(tenant_context.get_tenant_context, client_id)
+    cache_key = reply_cache.replies.key_for(request, ctx.base_prompt) if settings.ai_reply_cache and ctx else None
+    if cache_key:
+        cached = reply_cache.replies.get(client_id, cache_key)
+        if cached is not None:
+            write_log(db, client_id, "ai", "ai_cached", "Resposta reaproveitada do cache")
+            return cached
+
+    policy = ai_scheduler.Policy(ctx.ai_requests_per_minute, ctx.ai_burst, ctx.ai_weight) if ctx else ai_scheduler.Policy(None, None, 1)
+    provider = ai_provider.get_provider()
+    topic = events.conversation_topic(conversation_id) if conversation_id else None
+    try:
+        async with ai_scheduler.scheduler.slot(client_id, policy):
+            if settings.ai_streaming and topic and events.bus.has_subscribers(topic):
+                # Someone is watching this conversation: forward tokens as they arrive instead of waiting for the full reply.
+                events.bus.publish(topic, {"type": "ai_start", "conversation_id": conversation_id})
+                parts, finished = [], False
+                try:
+                    async for delta in provider.stream(**request):
+                        parts.append(delta)
+                        events.bus.publish(topic, {"type": "ai_delta", "conversation_id": conversation_id, "delta": delta})
+                    finished = True
+                finally:
+                    if not finished:
+                        # Viewers already got ai_start; without a terminal event they would wait on the partial reply forever.
+                        events.bus.publish(topic, {"type": "ai_error", "conversation_id": conversation_id})
+                reply = "".join(parts)
+            else:
+                reply = await provider.complete(**request)
+    except ai_scheduler.Deferred:
+        write_log(db, client_id, "ai", "ai_deferred", "Fila de IA do cliente cheia, mensagem sem resposta automática", level="warning")
+        return DeferredReply("Recebemos muitas mensagens ao mesmo tempo. Aguarde um instante e envie sua pergunta novamente, por favor.")
     write_log(db, client_id, "ai", "ai_triggered", "Resposta gerada pela OpenAI")
-    return completion.output_text or "Posso ajudar em mais alguma coisa?"
+    if cache_key and reply:
+        reply_cache.replies.set(client_id, cache_key, reply)
+    return reply or "Posso ajudar em mais alguma coisa?"
+
+
+CHANNEL_LABELS = {"telegram": "Telegram", "whatsapp": "WhatsApp", "instagram": "Instagram"}
+
+
+def _record_inbound(
+    db: Session, client_id: int, channel: str, external_user_id: str, text: str, dedup_key: str | None = None
+) -> tuple[int, int] | None:
+    """Stores the customer's message; returns None when ``dedup_key`` shows it was already stored and answered."""
+    # Committed before the AI call so no write transaction stays open while the provider is thinking.
+    conversation_id = _upsert_conversations(db, channel, {(client_id, external_user_id)})[(client_id, external_user_id)]
+    message = Message(conversation_id=conversation_id, sender="customer", content=text, dedup_key=dedup_key)
+    db.add(message)
+    try:
+        db.flush()
+    except IntegrityError:
+        if not dedup_key:
+            raise
+        db.rollback()
+        unanswered = _unanswered(db, [dedup_key]).get(dedup_key)
+        if unanswered:
+            return unanswered[1], unanswered[2]
+        dedup.webhooks.count(dedup_key, "database")
+        return None
+    publish_message(db, client_id, conversation_id, message)
+    write_log(db, client_id, "message", "message_received", f"{CHANNEL_LABELS[channel]} msg em conversa {conversation_id}")
+    db.commit()
+    return conversation_id, message.id
+
+
+def _unanswered(db: Session, keys: list[str]) -> dict[str, tuple[int, int, int, str]]:
+    """Stored inbound messages among ``keys`` that never got a reply, as (client_id, conversation_id, message_id, text).
+
+    A re-delivery of one of these is the platform retrying after the provider or the reply store failed,
+    so it is answered instead of being dropped as a duplicate.
+    """
+    reply = aliased(Message)
+    answered = select(reply.id).where(reply.conversation_id == Message.conversation_id, reply.id > Message.id, reply.sender != "customer").exists()
+    rows = (
+        db.query(Message.dedup_key, Conversation.client_id, Message.conversation_id, Message.id, Message.content)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .filter(Message.dedup_key.in_(keys), ~answered)
+        .order_by(Message.id)
+    )
+    return {key: (client_id, conversation_id, message_id, text) for key, client_id, conversation_id, message_id, text in rows}
+
+
+def outbound_status() -> str | None:
+    return "pending" if settings.delivery_enabled else None
+
+
+def _store_ai_reply(db: Session, client_id: int, conversation_id: int, reply: str) -> int:
+    if isinstance(reply, DeferredReply):
+        # The customer still gets the notice, but no AI call was made: it is neither billed nor announced.
+        message = Message(conversation_id=conversation_id, sender="system", content=reply, delivery_status=outbound_status())
+        db.add(message)
+        db.flush()
+        publish_message(db, client_id, conversation_id, message)
+        db.commit()
+        return message.id
+    message = Message(conversation_id=conversation_id, sender="ai", content=reply, delivery_status=outbound_status())
+    db.add(message)
+    db.flush()
+    payload = publish_message(db, client_id, conversation_id, message)
+    events.publish_after_commit(db, events.conversation_topic(conversation_id), {"type": "ai_done", "conversation_id": conversation_id, "message": payload})
+    usage.record_ai_message(db, client_id)
+    notify(db, client_id, "ai_response", "IA respondeu uma mensagem")
+    db.commit()
+    return message.id
+
+
+async def _reply_to(db: AsyncSession, client_id: int, channel: str, external_user_id: str, text: str, dedup_key: str | None = None) -> str | None:
+    """Stores the message and replies to it; returns None for a re-delivery, which gets neither."""
+    metrics.set_tenant(client_id)
+    if dedup_key and not dedup.webhooks.claim(dedup_key):
+        return None
+    try:
+        recorded = await db.run_sync(_record_inbound, client_id, channel, external_user_id, text, dedup_key)
+        if recorded is None:
+            return None
+        conversation_id, message_id = recorded
+        reply = await generate_ai_reply(db, client_id, text, conversation_id, message_id)
+        reply_id = await db.run_sync(_store_ai_reply, client_id, conversation_id, reply)
+    except Exception:
+        # Unanswered: the platform's retry must get through the in-memory check and be answered.
+        if dedup_key:
+            dedup.webhooks.forget(dedup_key)
+        raise
+    delivery.dispatcher.submit(reply_id, conversation_id)
+    return reply
 
 
 @app.get(f"{settings.api_prefix}/health")
@@ -168,11 +430,61 @@ def health():
     return {"status": "ok"}
 
 
+@app.get(f"{settings.api_prefix}/ready")
+def ready():
+    return JSONResponse(warmup.state.report(), status_code=200 if warmup.state.ready else 503)
+
+
+@app.get(f"{settings.api_prefix}/metrics")
+def prometheus_metrics(authorization: str = Header(default="")):
+    # Tenant ids and traffic per route are not public: without a token there is no endpoint at all.
+    if not settings.metrics_enabled or not settings.metrics_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(authorization, f"Bearer {settings.metrics_token}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _process_stats() -> dict[str, dict | None]:
+    # Covers every tenant, so it is only exported through the token-protected /api/metrics.
+    return {
+        "auth": auth_cache.verified_tokens.stats(),
+        "tenant_context": tenant_context.contexts.stats(),
+        "telegram_routes": routing.telegram_routes.stats(),
+        "meta_routes": routing.meta_routes.stats(),
+        "log_sink": log_sink.sink.stats() if log_sink.sink else None,
+        "events": events.bus.stats(),
+        "delivery": delivery.dispatcher.stats(),
+        "webhook_dedup": dedup.webhooks.stats(),
+        "password_hashing": passwords.hasher.stats(),
+        "ai_replies": reply_cache.replies.stats(),
+        "ai_scheduler": ai_scheduler.scheduler.stats(),
+    }
+
+
+metrics.register_stats(_process_stats)
+
+
+@app.get(f"{settings.api_prefix}/cache-stats")
+def cache_stats(user: UserSnapshot = Depends(current_user)):
+    require_role(user, ["admin"])
+    return {
+        "ai_replies": reply_cache.replies.tenant_stats(user.client_id),
+        "ai_scheduler": ai_scheduler.scheduler.tenant_stats(user.client_id),
+    }
+
+
 @app.post(f"{settings.api_prefix}/register")
-def register(payload: RegisterIn, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == payload.email).first():
+async def register(payload: RegisterIn, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User.id).where(User.email == payload.email)):
         raise HTTPException(status_code=400, detail="Email already in use")
 
+    password_hash = await passwords.hasher.hash(payload.password)
+    await db.run_sync(_create_account, payload, password_hash)
+    return {"message": "Account created"}
+
+
+def _create_account(db: Session, payload: RegisterIn, password_hash: str) -> None:
     starter = db.query(Plan).filter(Plan.name == "starter").first()
     company_name = payload.company_name or f"{payload.name.split(' ')[0]} Company"
 
@@ -184,7 +496,7 @@ def register(payload: RegisterIn, db: Session = Depends(get_db)):
         client_id=client.id,
         name=payload.name,
         email=payload.email,
-        password_hash=hash_password(payload.password),
+        password_hash=password_hash,
         role="admin",
         status="active",
     )
@@ -195,25 +507,23 @@ def register(payload: RegisterIn, db: Session = Depends(get_db)):
     notify(db, client.id, "user_created", f"Usuário administrador {payload.name} criado", admin.id)
     db.commit()
 
-    return {"message": "Account created"}
-
 
 @app.post(f"{settings.api_prefix}/login")
-def login(payload: LoginIn, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == payload.email).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+async def login(payload: LoginIn, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == payload.email))
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, upgraded_hash = await passwords.hasher.verify(payload.password, user.password_hash)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if upgraded_hash:
+        user.password_hash = upgraded_hash
+    return await db.run_sync(_start_session, user)
 
-    access_payload = {"user_id": user.id, "client_id": user.client_id, "role": user.role}
-    access = create_token(access_payload, settings.access_token_minutes)
-    refresh = create_token(access_payload, settings.refresh_token_minutes)
-    db.add(
-        RefreshToken(
-            user_id=user.id,
-            token=refresh,
-            expires_at=datetime.now(timezone.utc) + timedelta(minutes=settings.refresh_token_minutes),
-        )
-    )
+
+def _start_session(db: Session, user: User) -> dict[str, Any]:
+    access = create_token({"user_id": user.id, "client_id": user.client_id, "role": user.role}, settings.access_token_minutes)
+    refresh = session_tokens.issue(db, user.id)
     user.last_login = datetime.utcnow()
     write_log(db, user.client_id, "auth", "login", f"Login efetuado por {user.email}")
     db.commit()
@@ -227,20 +537,20 @@ def login(payload: LoginIn, db: Session = Depends(get_db)):
 
 @app.post(f"{settings.api_prefix}/refresh")
 def refresh(payload: RefreshIn, db: Session = Depends(get_db)):
-    token_row = db.query(RefreshToken).filter(RefreshToken.token == payload.refresh_token, RefreshToken.revoked.is_(False)).first()
-    if not token_row or token_row.expires_at < datetime.now(timezone.utc):
+    rotated = session_tokens.rotate(db, payload.refresh_token)
+    user = db.get(User, rotated[0]) if rotated else None
+    if not user or user.status != "active":
+        db.rollback()
         raise HTTPException(status_code=401, detail="Invalid refresh token")
+    db.commit()
 
-    claims = decode_token(payload.refresh_token)
-    new_access = create_token({"user_id": claims["user_id"], "client_id": claims["client_id"], "role": claims["role"]}, settings.access_token_minutes)
-    return {"access_token": new_access, "refresh_token": payload.refresh_token}
+    new_access = create_token({"user_id": user.id, "client_id": user.client_id, "role": user.role}, settings.access_token_minutes)
+    return {"access_token": new_access, "refresh_token": rotated[1]}
 
 
 @app.post(f"{settings.api_prefix}/logout")
-def logout(payload: RefreshIn, user: User = Depends(current_user), db: Session = Depends(get_db)):
-    row = db.query(RefreshToken).filter(RefreshToken.token == payload.refresh_token).first()
-    if row:
-        row.revoked = True
+def logout(payload: RefreshIn, user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
+    session_tokens.revoke(db, payload.refresh_token)
     write_log(db, user.client_id, "auth", "logout", f"Logout de {user.email}")
     db.commit()
     return {"message": "logged out"}
@@ -261,20 +571,21 @@ def forgot_password(payload: ForgotPasswordIn, db: Session = Depends(get_db)):
 
 
 @app.post(f"{settings.api_prefix}/reset-password")
-def reset_password(payload: ResetPasswordIn, db: Session = Depends(get_db)):
-    token = db.query(PasswordResetToken).filter(PasswordResetToken.token == payload.token, PasswordResetToken.used.is_(False)).first()
+async def reset_password(payload: ResetPasswordIn, db: AsyncSession = Depends(get_async_db)):
+    token = await db.scalar(select(PasswordResetToken).where(PasswordResetToken.token == payload.token, PasswordResetToken.used.is_(False)))
     if not token or token.expires_at < datetime.utcnow():
         raise HTTPException(status_code=400, detail="invalid or expired token")
-    user = db.query(User).filter(User.id == token.user_id).first()
-    user.password_hash = hash_password(payload.new_password)
+    password_hash = await passwords.hasher.hash(payload.new_password)
+    user = await db.get(User, token.user_id)
+    user.password_hash = password_hash
     token.used = True
     write_log(db, user.client_id, "auth", "password_reset", f"Senha alterada para {user.email}")
-    db.commit()
+    await db.commit()
     return {"message": "password updated"}
 
 
 @app.get(f"{settings.api_prefix}/integrations/status")
-def integration_status(user: User = Depends(current_user), db: Session = Depends(get_db)):
+def integration_status(user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
     rows = db.query(Integration).filter(Integration.client_id == user.client_id).all()
     mapped = {"telegram": False, "whatsapp": False, "instagram": False}
     for row in rows:
@@ -290,20 +601,38 @@ def _save_integration(db: Session, client_id: int, platform: str, config: dict):
     else:
         row.config = config
         row.status = "connected"
+    db.flush()
+    try:
+        routing.sync_routes(db, row)
+    except routing.RouteConflict:
+        raise HTTPException(status_code=409, detail="Account already connected to another client")
     write_log(db, client_id, "integration", "connected", f"{platform} conectado")
     notify(db, client_id, "integration_connected", f"Integração {platform} conectada")
+    return row
+
+
+def _invalidate_integration(client_id: int) -> None:
+    # Only after commit: a request reloading the tenant in between would cache the old credentials again.
+    tenant_context.invalidate_tenant(client_id)
+    delivery.invalidate_credentials(client_id)
 
 
 @app.post(f"{settings.api_prefix}/integrations/telegram")
-def save_telegram(payload: TelegramIn, user: User = Depends(current_user), db: Session = Depends(get_db)):
-    _save_integration(db, user.client_id, "telegram", {"token": encrypt_secret(payload.token), "secret": payload.secret_token})
+def save_telegram(payload: TelegramIn, user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
+    row = _save_integration(db, user.client_id, "telegram", {"token": encrypt_secret(payload.token), "secret": payload.secret_token})
+    try:
+        previous_fingerprint = routing.claim_telegram(db, row, payload.token)
+    except routing.RouteConflict:
+        raise HTTPException(status_code=409, detail="Account already connected to another client")
     db.commit()
+    _invalidate_integration(user.client_id)
+    routing.invalidate_telegram(previous_fingerprint, row.id)
     return {"message": "telegram saved"}
 
 
 @app.post(f"{settings.api_prefix}/integrations/whatsapp")
-def save_whatsapp(payload: WhatsappIn, user: User = Depends(current_user), db: Session = Depends(get_db)):
-    _save_integration(
+def save_whatsapp(payload: WhatsappIn, user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
+    row = _save_integration(
         db,
         user.client_id,
         "whatsapp",
@@ -315,89 +644,224 @@ def save_whatsapp(payload: WhatsappIn, user: User = Depends(current_user), db: S
         },
     )
     db.commit()
+    _invalidate_integration(user.client_id)
+    routing.invalidate_meta(row.id)
     return {"message": "whatsapp saved"}
 
 
 @app.post(f"{settings.api_prefix}/integrations/instagram")
-def save_instagram(payload: InstagramIn, user: User = Depends(current_user), db: Session = Depends(get_db)):
-    _save_integration(db, user.client_id, "instagram", {"page_id": payload.page_id, "access_token": encrypt_secret(payload.access_token)})
+def save_instagram(payload: InstagramIn, user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
+    row = _save_integration(db, user.client_id, "instagram", {"page_id": payload.page_id, "access_token": encrypt_secret(payload.access_token)})
     db.commit()
+    _invalidate_integration(user.client_id)
+    routing.invalidate_meta(row.id)
     return {"message": "instagram saved"}
 
 
 @app.delete(f"{settings.api_prefix}/integrations/{{platform}}")
-def delete_integration(platform: str, user: User = Depends(current_user), db: Session = Depends(get_db)):
+def delete_integration(platform: str, user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
     row = db.query(Integration).filter(Integration.client_id == user.client_id, Integration.platform == platform).first()
+    fingerprint = row.token_fingerprint if row else None
     if row:
         row.status = "disconnected"
+        # Frees the bot for whichever integration connects it next.
+        row.token_fingerprint = None
+        routing.sync_routes(db, row)
     write_log(db, user.client_id, "integration", "disconnected", f"{platform} desconectado")
     notify(db, user.client_id, "integration_disconnected", f"Integração {platform} desconectada")
     db.commit()
+    _invalidate_integration(user.client_id)
+    if row and platform == "telegram":
+        routing.invalidate_telegram(fingerprint, row.id)
+    elif row:
+        routing.invalidate_meta(row.id)
     return {"message": "integration disconnected"}
 
 
 @app.post(f"{settings.api_prefix}/integrations/telegram/start")
-def start_telegram(user: User = Depends(current_user), db: Session = Depends(get_db)):
+def start_telegram(user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
     write_log(db, user.client_id, "integration", "webhook_set", "Webhook Telegram configurado")
     db.commit()
     return {"message": "telegram webhook configured"}
 
 
 @app.get(f"{settings.api_prefix}/conversations")
-def list_conversations(
-    user: User = Depends(current_user),
-    db: Session = Depends(get_db),
+async def list_conversations(
+    response: Response,
+    user: UserSnapshot = Depends(current_user),
+    db: AsyncSession = Depends(get_async_db),
     limit: int = Query(default=50, ge=1, le=200),
-    offset: int = Query(default=0, ge=0),
+    cursor: str | None = Query(default=None),
+    messages: int = Query(default=20, ge=0, le=200),
 ):
-    conversations = (
-        db.query(Conversation)
-        .filter(Conversation.client_id == user.client_id)
-        .order_by(Conversation.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
+    query = select(Conversation).where(Conversation.client_id == user.client_id)
+    if cursor:
+        query = query.where(keyset_before(Conversation.created_at, Conversation.id, cursor))
+    conversations = (await db.scalars(query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(limit + 1))).all()
+
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(conversations[-1].created_at, conversations[-1].id)
+
+    windows = await db.run_sync(load_message_windows, [c.id for c in conversations], max(messages, 1))
+    return {str(c.id): to_chat_payload(c, windows[c.id], messages) for c in conversations}
+
+
+@app.get(f"{settings.api_prefix}/conversations/{{conversation_id}}/messages")
+async def conversation_messages(
+    conversation_id: int,
+    user: UserSnapshot = Depends(current_user),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(default=50, ge=1, le=200),
+    before: str | None = Query(default=None),
+):
+    conv = await _get_conversation(db, user, conversation_id)
+    query = select(Message).where(Message.conversation_id == conv.id)
+    if before:
+        query = query.where(keyset_before(Message.created_at, Message.id, before))
+    rows = (await db.scalars(query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return {"messages": [to_message_payload(m) for m in reversed(rows)], "next_cursor": next_cursor}
+
+
+@app.get(f"{settings.api_prefix}/search/messages")
+async def search_messages(
+    q: str = Query(min_length=1, max_length=200),
+    user: UserSnapshot = Depends(current_user),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = Query(default=None),
+    channel: str | None = Query(default=None),
+    conversation_id: int | None = Query(default=None),
+):
+    words = search.terms(q)
+    if not words:
+        raise HTTPException(status_code=400, detail="Search query has no words")
+    after = decode_score_cursor(cursor) if cursor else None
+    hits = await db.run_sync(search.search_messages, user.client_id, words, limit + 1, after, channel, conversation_id)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_score_cursor(hits[-1].score, hits[-1].message_id)
+    return {
+        "results": [
+            {
+                "id": hit.message_id,
+                "conversation_id": hit.conversation_id,
+                "platform": hit.channel,
+                "name": hit.external_user_id,
+                "from": "user" if hit.sender == "customer" else hit.sender,
+                "timestamp": hit.created_at.isoformat(),
+                "score": hit.score,
+                "snippet": hit.snippet,
+            }
+            for hit in hits
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+@app.get(f"{settings.api_prefix}/conversations/{{conversation_id}}/archive")
+async def conversation_archive(conversation_id: int, user: UserSnapshot = Depends(current_user), db: AsyncSession = Depends(get_async_db)):
+    """Streams the conversation's messages that retention moved out of the database, oldest first, as NDJSON."""
+    conv = await _get_conversation(db, user, conversation_id)
+    paths = await db.run_sync(archive.conversation_segments, conv.id)
+    lines = (
+        json.dumps({"message": row["content"], "timestamp": row["created_at"], "from": "user" if row["sender"] == "customer" else row["sender"]}, ensure_ascii=False) + "\n"
+        for row in archive.read_conversation(paths, conv.id)
     )
-    return {str(c.id): to_chat_payload(c) for c in conversations}
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
 
-@app.post(f"{settings.api_prefix}/conversations/{{conversation_id}}/assume")
-def assume(conversation_id: str, user: User = Depends(current_user), db: Session = Depends(get_db)):
-    conv = db.query(Conversation).filter(Conversation.id == int(conversation_id), Conversation.client_id == user.client_id).first()
+@app.get(f"{settings.api_prefix}/conversations/{{conversation_id}}/stream")
+async def conversation_stream(conversation_id: int, request: Request, user: UserSnapshot = Depends(stream_user)):
+    # Own short-lived session: a dependency session would keep its connection for the whole stream.
+    async with AsyncSessionLocal() as db:
+        await _get_conversation(db, user, conversation_id)
+    return events.sse_response(request, events.bus.subscribe(events.conversation_topic(conversation_id)))
+
+
+@app.get(f"{settings.api_prefix}/events")
+async def client_events(request: Request, user: UserSnapshot = Depends(stream_user)):
+    """Pushes new messages, conversation changes and notifications of the user's client as they happen."""
+    return events.sse_response(request, events.bus.subscribe(events.client_topic(user.client_id)))
+
+
+def _socket_user(access_token: str) -> UserSnapshot:
+    db = SessionLocal()
+    try:
+        return current_user(f"Bearer {access_token}", db)
+    finally:
+        db.close()
+
+
+@app.websocket(f"{settings.api_prefix}/ws")
+async def client_events_socket(websocket: WebSocket, access_token: str = Query(default="")):
+    try:
+        user = await run_db(_socket_user, access_token)
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+    await websocket.accept()
+    subscription = events.bus.subscribe(events.client_topic(user.client_id))
+    try:
+        while True:
+            event = await subscription.get(timeout=settings.sse_keepalive_seconds)
+            await websocket.send_json(event or {"type": "keepalive"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
+
+
+async def _get_conversation(db: AsyncSession, user: UserSnapshot, conversation_id: int | str) -> Conversation:
+    conv = await db.scalar(select(Conversation).where(Conversation.id == int(conversation_id), Conversation.client_id == user.client_id))
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
+    return conv
+
+
+@app.post(f"{settings.api_prefix}/conversations/{{conversation_id}}/assume")
+async def assume(conversation_id: str, user: UserSnapshot = Depends(current_user), db: AsyncSession = Depends(get_async_db)):
+    conv = await _get_conversation(db, user, conversation_id)
     conv.status = "human"
     conv.assigned_user_id = user.id
+    publish_conversation(db, user.client_id, conv.id, status="human", assigned_user_id=user.id)
     write_log(db, user.client_id, "conversation", "assume", f"Conversa {conv.id} assumida")
-    db.commit()
+    await db.commit()
     return {"message": "ok"}
 
 
 @app.post(f"{settings.api_prefix}/conversations/{{conversation_id}}/bot")
-def back_to_bot(conversation_id: str, user: User = Depends(current_user), db: Session = Depends(get_db)):
-    conv = db.query(Conversation).filter(Conversation.id == int(conversation_id), Conversation.client_id == user.client_id).first()
-    if not conv:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+async def back_to_bot(conversation_id: str, user: UserSnapshot = Depends(current_user), db: AsyncSession = Depends(get_async_db)):
+    conv = await _get_conversation(db, user, conversation_id)
     conv.status = "bot"
+    publish_conversation(db, user.client_id, conv.id, status="bot")
     write_log(db, user.client_id, "conversation", "bot_mode", f"Conversa {conv.id} retornou ao bot")
-    db.commit()
+    await db.commit()
     return {"message": "ok"}
 
 
 @app.post(f"{settings.api_prefix}/send/{{conversation_id}}")
-def send_message(conversation_id: str, payload: SendMessageIn, user: User = Depends(current_user), db: Session = Depends(get_db)):
-    conv = db.query(Conversation).filter(Conversation.id == int(conversation_id), Conversation.client_id == user.client_id).first()
-    if not conv:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-
-    db.add(Message(conversation_id=conv.id, sender="human", content=payload.message))
+async def send_message(conversation_id: str, payload: SendMessageIn, user: UserSnapshot = Depends(current_user), db: AsyncSession = Depends(get_async_db)):
+    conv = await _get_conversation(db, user, conversation_id)
+    message = Message(conversation_id=conv.id, sender="human", content=payload.message, delivery_status=outbound_status())
+    db.add(message)
+    await db.flush()
+    publish_message(db, user.client_id, conv.id, message)
     write_log(db, user.client_id, "message", "message_sent", f"Mensagem enviada na conversa {conv.id}")
-    db.commit()
+    await db.commit()
+    delivery.dispatcher.submit(message.id, conv.id)
     return {"message": "sent"}
 
 
 @app.post(f"{settings.api_prefix}/ai/config")
-def save_ai_config(payload: AIConfigIn, user: User = Depends(current_user), db: Session = Depends(get_db)):
+def save_ai_config(payload: AIConfigIn, user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
     require_role(user, ["admin", "manager"])
     cfg = db.query(AIConfig).filter(AIConfig.client_id == user.client_id).first()
     cfg.base_prompt = payload.base_prompt
@@ -407,11 +871,13 @@ def save_ai_config(payload: AIConfigIn, user: User = Depends(current_user), db:
         cfg.api_key_encrypted = encrypt_secret(payload.api_key)
     write_log(db, user.client_id, "config", "ai_updated", "Configuração de IA atualizada")
     db.commit()
+    tenant_context.invalidate_tenant(user.client_id)
+    reply_cache.replies.invalidate_tenant(user.client_id)
     return {"message": "updated"}
 
 
 @app.get(f"{settings.api_prefix}/notifications")
-def notifications(user: User = Depends(current_user), db: Session = Depends(get_db)):
+def notifications(user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
     rows = db.query(Notification).filter(Notification.client_id == user.client_id).order_by(Notification.created_at.desc()).limit(50).all()
     return [
         {"id": n.id, "type": n.type, "content": n.content, "read": n.read, "created_at": n.created_at.isoformat()}
@@ -420,7 +886,7 @@ def notifications(user: User = Depends(current_user), db: Session = Depends(get_
 
 
 @app.get(f"{settings.api_prefix}/logs")
-def logs(user: User = Depends(current_user), db: Session = Depends(get_db)):
+def logs(user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
     require_role(user, ["admin", "manager"])
     rows = db.query(SystemLog).filter(SystemLog.client_id == user.client_id).order_by(SystemLog.created_at.desc()).limit(100).all()
     return [
@@ -437,57 +903,38 @@ def logs(user: User = Depends(current_user), db: Session = Depends(get_db)):
 
 
 @app.post(f"{settings.api_prefix}/webhook/telegram")
-async def telegram_webhook(request: Request, db: Session = Depends(get_db), x_telegram_bot_api_secret_token: str | None = Header(default=None)):
+async def telegram_webhook(request: Request, db: AsyncSession = Depends(get_async_db), x_telegram_bot_api_secret_token: str | None = Header(default=None)):
     payload = await request.json()
-    return _handle_telegram(payload, x_telegram_bot_api_secret_token, db)
-
-
-def _handle_telegram(payload: Any, secret_header: str | None, db: Session):
-    update = payload if isinstance(payload, dict) else {}
-    message = update.get("message", {})
-    text = message.get("text")
-    if not text:
-        return {"ok": True}
+    return await _handle_telegram(payload, x_telegram_bot_api_secret_token, db)
 
-    token = update.get("token")
-    integrations = db.query(Integration).filter(Integration.platform == "telegram", Integration.status == "connected").all()
-    integration = None
-    for candidate in integrations:
-        try:
-            if decrypt_secret(candidate.config.get("token", "")) == token:
-                integration = candidate
-                break
-        except Exception:
-            continue
 
+def _resolve_telegram(db: Session, update: dict, secret_header: str | None) -> routing.TelegramRoute:
+    integration = routing.resolve_telegram(db, update.get("token"))
     if not integration:
         raise HTTPException(status_code=404, detail="Integration not found")
 
-    expected_secret = integration.config.get("secret")
+    expected_secret = integration.secret
     if expected_secret and secret_header != expected_secret:
         write_log(db, integration.client_id, "webhook", "telegram_failed", "Secret token inválido", level="warning")
         db.commit()
         raise HTTPException(status_code=401, detail="Invalid secret token")
+    return integration
 
-    external_user_id = str(message.get("from", {}).get("id", "unknown"))
-    conv = (
-        db.query(Conversation)
-        .filter(Conversation.client_id == integration.client_id, Conversation.channel == "telegram", Conversation.external_user_id == external_user_id)
-        .first()
-    )
-    if not conv:
-        conv = Conversation(client_id=integration.client_id, channel="telegram", external_user_id=external_user_id, status="bot")
-        db.add(conv)
-        db.flush()
-        notify(db, integration.client_id, "new_conversation", "Nova conversa criada via Telegram")
 
-    db.add(Message(conversation_id=conv.id, sender="customer", content=text))
-    write_log(db, integration.client_id, "message", "message_received", f"Telegram msg em conversa {conv.id}")
+async def _handle_telegram(payload: Any, secret_header: str | None, db: AsyncSession):
+    update = payload if isinstance(payload, dict) else {}
+    message = update.get("message", {})
+    text = message.get("text")
+    if not text:
+        return {"ok": True}
 
-    reply = generate_ai_reply(db, integration.client_id, text)
-    db.add(Message(conversation_id=conv.id, sender="ai", content=reply))
-    notify(db, integration.client_id, "ai_response", "IA respondeu uma mensagem")
-    db.commit()
+    integration = await db.run_sync(_resolve_telegram, update, secret_header)
+    external_user_id = str(message.get("from", {}).get("id", "unknown"))
+    update_id = update.get("update_id")
+    dedup_key = f"telegram:{integration.integration_id}:{update_id}" if update_id is not None else None
+    reply = await _reply_to(db, integration.client_id, "telegram", external_user_id, text, dedup_key)
+    if reply is None:
+        return {"ok": True, "duplicate": True}
     return {"ok": True, "reply": reply}
 
 
@@ -503,71 +950,175 @@ async def verify_meta_signature(request: Request, app_secret: str) -> None:
 
 
 @app.get(f"{settings.api_prefix}/webhook/whatsapp")
-def whatsapp_verify(mode: str = Query(default=""), challenge: str = Query(default=""), verify_token: str = Query(alias="hub.verify_token", default=""), db: Session = Depends(get_db)):
+async def whatsapp_verify(mode: str = Query(default=""), challenge: str = Query(default=""), verify_token: str = Query(alias="hub.verify_token", default=""), db: AsyncSession = Depends(get_async_db)):
     if mode != "subscribe":
         raise HTTPException(status_code=400, detail="invalid mode")
-    rows = db.query(Integration).filter(Integration.platform == "whatsapp", Integration.status == "connected").all()
-    if not any(r.config.get("verify_token") == verify_token for r in rows):
+    if not await db.run_sync(routing.whatsapp_verify_token_known, verify_token):
         raise HTTPException(status_code=403, detail="verify token mismatch")
     return int(challenge) if challenge.isdigit() else challenge
 
 
 @app.post(f"{settings.api_prefix}/webhook/whatsapp")
-async def whatsapp_webhook(request: Request, db: Session = Depends(get_db)):
+async def whatsapp_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     await verify_meta_signature(request, settings.meta_app_secret)
     payload = await request.json()
 
-    phone_number_id = (
-        payload.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("metadata", {})
-        .get("phone_number_id")
-    )
-    if not phone_number_id:
+    phone_number_ids, inbound = _whatsapp_messages(payload)
+    if not phone_number_ids:
         raise HTTPException(status_code=400, detail="Missing phone_number_id")
+    if not inbound:
+        return {"ok": True}
 
-    phone_field = Integration.config["phone_number_id"]
-    phone_filter = phone_field.astext if hasattr(phone_field, "astext") else phone_field.as_string()
-    integration = (
-        db.query(Integration)
-        .filter(
-            Integration.platform == "whatsapp",
-            Integration.status == "connected",
-            phone_filter == phone_number_id,
-        )
-        .first()
-    )
-    if not integration:
+    fresh = [m for m in inbound if not m[3] or dedup.webhooks.claim(m[3])]
+    if not fresh:
+        return {"ok": True, "processed": 0, "duplicates": len(inbound)}
+    try:
+        stored = await db.run_sync(_ingest_whatsapp_batch, fresh)
+        await _reply_batch(stored)
+    except Exception:
+        # Messages that did get a reply are still caught on the retry by their stored dedup_key.
+        for m in fresh:
+            if m[3]:
+                dedup.webhooks.forget(m[3])
+        raise
+    return {"ok": True, "processed": len(stored), "duplicates": len(inbound) - len(stored)}
+
+
+def _whatsapp_messages(payload: dict) -> tuple[set[str], list[tuple[str, str, str, str | None]]]:
+    """Flattens every entry/change of a Meta delivery into (phone_number_id, sender, text, dedup_key) tuples."""
+    phone_number_ids: set[str] = set()
+    inbound: list[tuple[str, str, str, str | None]] = []
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            phone_number_id = (value.get("metadata") or {}).get("phone_number_id")
+            if not phone_number_id:
+                continue
+            phone_number_ids.add(phone_number_id)
+            for msg in value.get("messages") or []:
+                text = (msg.get("text") or {}).get("body", "")
+                if text:
+                    dedup_key = f"whatsapp:{phone_number_id}:{msg['id']}" if msg.get("id") else None
+                    inbound.append((phone_number_id, msg.get("from", "unknown"), text, dedup_key))
+    return phone_number_ids, inbound
+
+
+def _ingest_whatsapp_batch(db: Session, inbound: list[tuple[str, str, str, str | None]]) -> list[tuple[int, int, int, str]]:
+    try:
+        return _store_whatsapp_batch(db, inbound)
+    except IntegrityError:
+        # A concurrent delivery stored some of these first; on the retry the dedup lookup filters them out.
+        db.rollback()
+        return _store_whatsapp_batch(db, inbound)
+
+
+def _store_whatsapp_batch(db: Session, inbound: list[tuple[str, str, str, str | None]]) -> list[tuple[int, int, int, str]]:
+    routes = {pid: routing.resolve_meta(db, "whatsapp", pid) for pid in {m[0] for m in inbound}}
+    routed = [(routes[pid].client_id, sender, text, key) for pid, sender, text, key in inbound if routes[pid]]
+    if not routed:
         raise HTTPException(status_code=404, detail="Integration not found")
 
-    entry = (payload.get("entry") or [{}])[0]
-    changes = (entry.get("changes") or [{}])[0]
-    value = changes.get("value") or {}
-    msgs = value.get("messages") or []
-    for msg in msgs:
-        external_user_id = msg.get("from", "unknown")
-        text = (msg.get("text") or {}).get("body", "")
-        conv = (
-            db.query(Conversation)
-            .filter(Conversation.client_id == integration.client_id, Conversation.channel == "whatsapp", Conversation.external_user_id == external_user_id)
-            .first()
-        )
-        if not conv:
-            conv = Conversation(client_id=integration.client_id, channel="whatsapp", external_user_id=external_user_id)
-            db.add(conv)
-            db.flush()
-            notify(db, integration.client_id, "new_conversation", "Nova conversa via WhatsApp")
-        db.add(Message(conversation_id=conv.id, sender="customer", content=text))
-        ai = generate_ai_reply(db, integration.client_id, text)
-        db.add(Message(conversation_id=conv.id, sender="ai", content=ai))
-        write_log(db, integration.client_id, "message", "message_received", f"WhatsApp msg em conversa {conv.id}")
+    keys = [key for *_, key in routed if key]
+    retried = []
+    if keys:
+        stored_keys = {key for (key,) in db.query(Message.dedup_key).filter(Message.dedup_key.in_(keys))}
+        unanswered = _unanswered(db, list(stored_keys)) if stored_keys else {}
+        retried = list(unanswered.values())
+        for key in stored_keys - unanswered.keys():
+            dedup.webhooks.count(key, "database")
+        routed = [m for m in routed if m[3] not in stored_keys]
+        if not routed:
+            return retried
+
+    conversations = _upsert_conversations(db, "whatsapp", {(client_id, sender) for client_id, sender, *_ in routed})
+    messages = []
+    for client_id, sender, text, key in routed:
+        conversation_id = conversations[(client_id, sender)]
+        message = Message(conversation_id=conversation_id, sender="customer", content=text, dedup_key=key)
+        db.add(message)
+        messages.append((client_id, conversation_id, message))
+        write_log(db, client_id, "message", "message_received", f"WhatsApp msg em conversa {conversation_id}")
+    db.flush()
+    stored = retried
+    for client_id, conversation_id, message in messages:
+        publish_message(db, client_id, conversation_id, message)
+        stored.append((client_id, conversation_id, message.id, message.content))
     db.commit()
-    return {"ok": True}
+    return stored
+
+
+def _find_conversations(db: Session, channel: str, keys) -> dict[tuple[int, str], int]:
+    rows = db.query(Conversation.id, Conversation.client_id, Conversation.external_user_id).filter(
+        Conversation.channel == channel, tuple_(Conversation.client_id, Conversation.external_user_id).in_(keys)
+    )
+    return {(client_id, external_user_id): conversation_id for conversation_id, client_id, external_user_id in rows}
+
+
+def _upsert_conversations(db: Session, channel: str, keys: set[tuple[int, str]]) -> dict[tuple[int, str], int]:
+    """Resolves (client_id, external_user_id) pairs to conversation ids with one lookup and one batched insert.
+
+    The insert relies on uq_conversations_client_channel_user, so concurrent deliveries for the same new
+    sender end up on a single conversation instead of racing to create two.
+    """
+    found = _find_conversations(db, channel, keys)
+    missing = [key for key in keys if key not in found]
+    if not missing:
+        return found
+
+    values = [
+        {"client_id": client_id, "channel": channel, "external_user_id": external_user_id, "status": "bot", "created_at": datetime.utcnow()}
+        for client_id, external_user_id in missing
+    ]
+    insert = dialect_insert(db.get_bind())
+    if insert is not None:
+        stmt = (
+            insert(Conversation)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=["client_id", "channel", "external_user_id"])
+            .returning(Conversation.id, Conversation.client_id, Conversation.external_user_id)
+        )
+        created = {(client_id, external_user_id): conversation_id for conversation_id, client_id, external_user_id in db.execute(stmt)}
+    else:
+        rows = [Conversation(**v) for v in values]
+        db.add_all(rows)
+        db.flush()
+        created = {(conv.client_id, conv.external_user_id): conv.id for conv in rows}
+
+    for (client_id, external_user_id), conversation_id in created.items():
+        publish_conversation(db, client_id, conversation_id, status="bot", platform=channel, name=external_user_id)
+        notify(db, client_id, "new_conversation", f"Nova conversa via {CHANNEL_LABELS[channel]}")
+    found.update(created)
+    if len(found) < len(keys):
+        # Lost the race for some senders: another request inserted them between our lookup and insert.
+        found.update(_find_conversations(db, channel, [key for key in keys if key not in found]))
+    return found
+
+
+async def _reply_batch(stored: list[tuple[int, int, int, str]]) -> None:
+    """Replies to a batch concurrently across conversations (capped), in order within each conversation."""
+    threads: dict[int, list[tuple[int, int, str]]] = {}
+    for client_id, conversation_id, message_id, text in stored:
+        threads.setdefault(conversation_id, []).append((client_id, message_id, text))
+    slots = asyncio.Semaphore(settings.webhook_reply_concurrency)
+
+    async def reply_thread(conversation_id: int, items: list[tuple[int, int, str]]) -> None:
+        async with slots:
+            # Each thread gets its own session: sessions must not be shared between concurrent tasks.
+            async with AsyncSessionLocal() as db:
+                for client_id, message_id, text in items:
+                    metrics.set_tenant(client_id)
+                    # message_id caps the history so earlier messages of the batch don't see later ones.
+                    reply = await generate_ai_reply(db, client_id, text, conversation_id, message_id)
+                    delivery.dispatcher.submit(await db.run_sync(_store_ai_reply, client_id, conversation_id, reply), conversation_id)
+
+    results = await asyncio.gather(*(reply_thread(cid, items) for cid, items in threads.items()), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        raise errors[0]
 
 
 @app.post(f"{settings.api_prefix}/webhook/instagram")
-async def instagram_webhook(request: Request, db: Session = Depends(get_db)):
+async def instagram_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     await verify_meta_signature(request, settings.meta_app_secret)
     payload = await request.json()
 
@@ -576,18 +1127,8 @@ async def instagram_webhook(request: Request, db: Session = Depends(get_db)):
         if not page_id:
             continue
 
-        page_field = Integration.config["page_id"]
-        page_filter = page_field.astext if hasattr(page_field, "astext") else page_field.as_string()
-        integration = (
-            db.query(Integration)
-            .filter(
-                Integration.platform == "instagram",
-                Integration.status == "connected",
-                page_filter == str(page_id),
-            )
-            .first()
-        )
-        if not integration:
+        route = await db.run_sync(routing.resolve_meta, "instagram", str(page_id))
+        if not route:
             raise HTTPException(status_code=404, detail="Integration not found")
 
         for messaging in entry.get("messaging", []):
@@ -595,26 +1136,14 @@ async def instagram_webhook(request: Request, db: Session = Depends(get_db)):
             text = messaging.get("message", {}).get("text", "")
             if not text:
                 continue
-            conv = (
-                db.query(Conversation)
-                .filter(Conversation.client_id == integration.client_id, Conversation.channel == "instagram", Conversation.external_user_id == sender_id)
-                .first()
-            )
-            if not conv:
-                conv = Conversation(client_id=integration.client_id, channel="instagram", external_user_id=sender_id)
-                db.add(conv)
-                db.flush()
-                notify(db, integration.client_id, "new_conversation", "Nova conversa via Instagram")
-            db.add(Message(conversation_id=conv.id, sender="customer", content=text))
-            ai = generate_ai_reply(db, integration.client_id, text)
-            db.add(Message(conversation_id=conv.id, sender="ai", content=ai))
-            write_log(db, integration.client_id, "message", "message_received", f"Instagram msg em conversa {conv.id}")
-    db.commit()
+            mid = messaging.get("message", {}).get("mid")
+            dedup_key = f"instagram:{page_id}:{mid}" if mid else None
+            await _reply_to(db, route.client_id, "instagram", sender_id, text, dedup_key)
     return {"ok": True}
 
 
 @app.get(f"{settings.api_prefix}/integrations/manuals")
-def integration_manuals(user: User = Depends(current_user)):
+def integration_manuals(user: UserSnapshot = Depends(current_user)):
     return {
         "telegram": {
             "title": "Configuração Telegram",
@@ -660,7 +1189,7 @@ def integration_manuals(user: User = Depends(current_user)):
 
 
 @app.post(f"{settings.api_prefix}/billing/plan/{{plan_name}}")
-def change_plan(plan_name: str, user: User = Depends(current_user), db: Session = Depends(get_db)):
+def change_plan(plan_name: str, user: UserSnapshot = Depends(current_user), db: Session = Depends(get_db)):
     require_role(user, ["admin"])
     plan = db.query(Plan).filter(Plan.name == plan_name).first()
     if not plan:
@@ -670,4 +1199,13 @@ def change_plan(plan_name: str, user: User = Depends(current_user), db: Session
     notify(db, user.client_id, "plan_changed", f"Plano alterado para {plan.name}")
     write_log(db, user.client_id, "billing", "plan_changed", f"Plano alterado para {plan.name}")
     db.commit()
-    return {"message": "plan updated", "plan": plan.name}
+    tenant_context.invalidate_tenant(user.client_id)
+    return {
+        "message": "plan updated",
+        "plan": plan.name,
+        "usage": {
+            "period": usage.current_period(),
+            "ai_messages": usage.get_ai_usage(db, user.client_id),
+            "max_ai_messages": plan.max_ai_messages,
+        },
+    }
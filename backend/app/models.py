@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import JSON, Boolean, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import JSON, Boolean, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -15,6 +15,13 @@ class Plan(Base):
     max_channels: Mapped[int] = mapped_column(Integer, default=1)
     max_ai_messages: Mapped[int] = mapped_column(Integer, default=300)
     max_storage_mb: Mapped[int] = mapped_column(Integer, default=100)
+    # Days messages and system logs stay in the database before being archived; NULL keeps them forever.
+    message_retention_days: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    log_retention_days: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Token bucket for AI calls (NULL: unlimited) and the tenant's share of provider slots under contention.
+    ai_requests_per_minute: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    ai_burst: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    ai_weight: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
 
 
 class Client(Base):
@@ -63,8 +70,22 @@ class AIConfig(Base):
     language: Mapped[str] = mapped_column(String(10), default="pt-BR")
 
 
+class AIUsageCounter(Base):
+    __tablename__ = "ai_usage_counters"
+    __table_args__ = (UniqueConstraint("client_id", "period", name="uq_ai_usage_client_period"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), index=True)
+    period: Mapped[str] = mapped_column(String(7))  # YYYY-MM
+    ai_messages: Mapped[int] = mapped_column(Integer, default=0)
+
+
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("uq_conversations_client_channel_user", "client_id", "channel", "external_user_id", unique=True),
+        Index("ix_conversations_client_created", "client_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), index=True)
@@ -73,18 +94,43 @@ class Conversation(Base):
     status: Mapped[str] = mapped_column(String(20), default="bot")
     assigned_user_id: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Rolling summary of the turns up to and including summary_through_id, which no longer go into the prompt verbatim.
+    summary: Mapped[str | None] = mapped_column(Text, nullable=True)
+    summary_through_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     messages: Mapped[list["Message"]] = relationship(back_populates="conversation", cascade="all, delete-orphan")
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+        Index("ix_messages_sender_created", "sender", "created_at"),
+        Index("uq_messages_dedup_key", "dedup_key", unique=True),
+        # Only the few undelivered replies, for the dispatcher's sweep.
+        Index(
+            "ix_messages_pending_delivery",
+            "created_at",
+            sqlite_where=text("delivery_status = 'pending'"),
+            postgresql_where=text("delivery_status = 'pending'"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     conversation_id: Mapped[int] = mapped_column(ForeignKey("conversations.id"), index=True)
     sender: Mapped[str] = mapped_column(String(20), index=True)
     content: Mapped[str] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Outbound replies only: pending -> sent | failed. Inbound messages keep NULL.
+    delivery_status: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    delivery_attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    delivery_error: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    delivered_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    external_id: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    # Set by the worker that is sending it; a claim older than DELIVERY_CLAIM_SECONDS can be taken over.
+    delivery_claimed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Inbound only: platform-scoped id of the delivery (Telegram update_id, Meta message id), unique so re-deliveries are rejected.
+    dedup_key: Mapped[str | None] = mapped_column(String(150), nullable=True)
 
     conversation: Mapped[Conversation] = relationship(back_populates="messages")
 
@@ -97,11 +143,28 @@ class Integration(Base):
     platform: Mapped[str] = mapped_column(String(20), index=True)
     status: Mapped[str] = mapped_column(String(20), default="disconnected")
     config: Mapped[dict] = mapped_column(JSON, default={})
+    # Keyed hash of the Telegram bot token while connected; unique, so one bot routes to one integration.
+    token_fingerprint: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True, unique=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
+# (platform, sending account) -> integration, for webhooks that only carry the account id.
+class ChannelRoute(Base):
+    __tablename__ = "channel_routes"
+    __table_args__ = (Index("uq_channel_routes_platform_external", "platform", "external_id", unique=True),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    platform: Mapped[str] = mapped_column(String(20))
+    external_id: Mapped[str] = mapped_column(String(200))
+    integration_id: Mapped[int] = mapped_column(ForeignKey("integrations.id"), index=True)
+    client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"))
+    # WhatsApp only: keyed fingerprint of the verify token, for the subscription handshake.
+    verify_token_hash: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+
+
 class SystemLog(Base):
     __tablename__ = "system_logs"
+    __table_args__ = (Index("ix_system_logs_client_created", "client_id", "created_at"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), index=True)
@@ -114,6 +177,7 @@ class SystemLog(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (Index("ix_notifications_client_created", "client_id", "created_at"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), index=True)
@@ -129,9 +193,12 @@ class RefreshToken(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
-    token: Mapped[str] = mapped_column(String(512), unique=True, index=True)
-    expires_at: Mapped[datetime] = mapped_column(DateTime)
+    token_hash: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    # Every token rotated out of one login shares its family; reusing a rotated token revokes them all.
+    family_id: Mapped[str] = mapped_column(String(32), index=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
     revoked: Mapped[bool] = mapped_column(Boolean, default=False)
+    revoked_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
 
 
 class PasswordResetToken(Base):
@@ -142,3 +209,27 @@ class PasswordResetToken(Base):
     token: Mapped[str] = mapped_column(String(255), unique=True, index=True)
     expires_at: Mapped[datetime] = mapped_column(DateTime)
     used: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+# One gzipped NDJSON file of rows moved out of messages or system_logs.
+class ArchiveSegment(Base):
+    __tablename__ = "archive_segments"
+    __table_args__ = (Index("ix_archive_segments_client_kind_period", "client_id", "kind", "period"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"))
+    kind: Mapped[str] = mapped_column(String(20))
+    period: Mapped[str] = mapped_column(String(7))
+    # Relative to ARCHIVE_DIR.
+    path: Mapped[str] = mapped_column(String(255), unique=True)
+    rows: Mapped[int] = mapped_column(Integer)
+    first_id: Mapped[int] = mapped_column(Integer)
+    last_id: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class ArchivedConversation(Base):
+    __tablename__ = "archived_conversations"
+
+    conversation_id: Mapped[int] = mapped_column(ForeignKey("conversations.id"), primary_key=True)
+    segment_id: Mapped[int] = mapped_column(ForeignKey("archive_segments.id"), primary_key=True)
@@ -1,5 +0,0 @@
-from .integration import Integration
-
-__all__ = [
-    "Integration",
-]
\ No newline at end of file
@@ -0,0 +1,49 @@
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def alembic_config() -> Config:
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BACKEND_DIR / "migrations"))
+    # Keep the server's logging setup; alembic.ini's fileConfig would disable uvicorn's loggers.
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def head_revision() -> str | None:
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def current_revision(engine: Engine) -> str | None:
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def upgrade_to_head() -> None:
+    command.upgrade(alembic_config(), "head")
+
+
+def ensure_schema_current(engine: Engine) -> None:
+    current, head = current_revision(engine), head_revision()
+    if current == head:
+        return
+    if settings.db_auto_migrate:
+        upgrade_to_head()
+        return
+    raise SchemaOutOfDate(
+        f"database schema is at {current or 'no recorded revision'}, expected {head}; run `alembic upgrade head` "
+        "(databases created by create_all: `alembic stamp 0001` first)"
+    )
@@ -1,33 +1,13 @@
 from datetime import datetime, timedelta, timezone
 import base64
-from typing import Optional
+import hashlib
+import hmac
 
 from cryptography.fernet import Fernet
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
 
 from app.config import settings
-from app.db import get_db
-
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-
-
-# ---------------------------------------------------
-# PASSWORD
-# ---------------------------------------------------
-
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
-
-
-def hash_password(password: str):
-    password = password.encode("utf-8")[:72].decode("utf-8", errors="ignore")
-    return pwd_context.hash(password)
 
 
 # ---------------------------------------------------
@@ -59,31 +39,6 @@ def decode_token(token: str) -> dict:
         )
 
 
-# ---------------------------------------------------
-# CURRENT USER (SEM DEPENDER DE MODEL USER)
-# ---------------------------------------------------
-
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-):
-    payload = decode_token(token)
-    user_id: Optional[int] = payload.get("sub")
-
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-        )
-
-    # Retorna objeto simples mockado só para não quebrar integração
-    class UserObj:
-        def __init__(self, id: int):
-            self.id = id
-
-    return UserObj(int(user_id))
-
-
 # ---------------------------------------------------
 # ENCRYPTION
 # ---------------------------------------------------
@@ -101,4 +56,9 @@ def encrypt_secret(raw: str) -> str:
 
 def decrypt_secret(enc: str) -> str:
     f = _get_fernet()
-    return f.decrypt(enc.encode()).decode()
\ No newline at end of file
+    return f.decrypt(enc.encode()).decode()
+
+
+def fingerprint_secret(raw: str) -> str:
+    # Keyed so a leaked fingerprint column can't be matched against known bot tokens.
+    return hmac.new(settings.encryption_key.encode(), raw.encode(), hashlib.sha256).hexdigest()
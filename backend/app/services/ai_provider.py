@@ -0,0 +1,157 @@
+import asyncio
+from collections import deque
+import time
+from typing import Any, AsyncIterator
+
+from app.config import settings
+from app.services import metrics
+from app.services.cache import TTLCache
+
+try:
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+except Exception:  # pragma: no cover
+    AsyncOpenAI = DefaultAsyncHttpxClient = None
+
+
+class AIProvider:
+    name = "base"
+    requires_api_key = True
+
+    def __init__(self, max_concurrency: int | None = None):
+        self._slots = asyncio.Semaphore(max_concurrency or settings.ai_max_concurrency)
+
+    def ready(self, api_key: str | None) -> bool:
+        return bool(api_key) or not self.requires_api_key
+
+    def warm(self, api_keys: set[str | None]) -> int:
+        """Creates the clients for these keys ahead of the first call; returns how many exist."""
+        return 0
+
+    async def aclose(self) -> None:
+        """Releases the provider's connections; called on shutdown."""
+
+    async def complete(self, *, api_key: str | None, model: str, messages: list[dict[str, str]], temperature: float) -> str:
+        async with self._slots:
+            # Timed inside the slot: this is the provider's latency, not our own queueing.
+            started, outcome = time.perf_counter(), "error"
+            try:
+                reply = await self._complete(api_key=api_key, model=model, messages=messages, temperature=temperature)
+                outcome = "ok"
+                return reply
+            finally:
+                metrics.observe_ai(self.name, model, time.perf_counter() - started, outcome)
+
+    async def stream(self, *, api_key: str | None, model: str, messages: list[dict[str, str]], temperature: float) -> AsyncIterator[str]:
+        """Yields the reply as text deltas; the concurrency slot is held until the stream ends."""
+        async with self._slots:
+            started, outcome = time.perf_counter(), "error"
+            try:
+                async for delta in self._stream(api_key=api_key, model=model, messages=messages, temperature=temperature):
+                    yield delta
+                outcome = "ok"
+            finally:
+                metrics.observe_ai(self.name, model, time.perf_counter() - started, outcome)
+
+    async def _complete(self, *, api_key: str | None, model: str, messages: list[dict[str, str]], temperature: float) -> str:
+        raise NotImplementedError
+
+    async def _stream(self, *, api_key: str | None, model: str, messages: list[dict[str, str]], temperature: float) -> AsyncIterator[str]:
+        yield await self._complete(api_key=api_key, model=model, messages=messages, temperature=temperature)
+
+
+class OpenAIProvider(AIProvider):
+    name = "openai"
+
+    def __init__(self, max_concurrency: int | None = None):
+        super().__init__(max_concurrency)
+        # Every tenant's client shares one connection pool, so replies reuse warm TLS connections and a client
+        # dropped from the cache owns no sockets: eviction needs no close(), which could cut a call in flight.
+        self._http = DefaultAsyncHttpxClient() if DefaultAsyncHttpxClient is not None else None
+        self._clients = TTLCache(maxsize=settings.ai_client_pool_size, ttl=float("inf"))
+
+    def ready(self, api_key: str | None) -> bool:
+        return AsyncOpenAI is not None and super().ready(api_key)
+
+    def warm(self, api_keys: set[str | None]) -> int:
+        for api_key in api_keys:
+            if self.ready(api_key):
+                self.client_for(api_key)
+        return len(self._clients)
+
+    def client_for(self, api_key: str | None):
+        client = self._clients.get(api_key)
+        if client is None:
+            client = AsyncOpenAI(api_key=api_key, timeout=settings.ai_timeout_seconds, http_client=self._http)
+            self._clients.set(api_key, client)
+        return client
+
+    async def aclose(self) -> None:
+        self._clients.clear()
+        if self._http is not None:
+            await self._http.aclose()
+
+    async def _complete(self, *, api_key: str | None, model: str, messages: list[dict[str, str]], temperature: float) -> str:
+        completion = await self.client_for(api_key).responses.create(model=model, input=messages, temperature=temperature)
+        if completion.usage:
+            metrics.record_tokens(self.name, model, completion.usage.input_tokens, completion.usage.output_tokens)
+        return completion.output_text
+
+    async def _stream(self, *, api_key: str | None, model: str, messages: list[dict[str, str]], temperature: float) -> AsyncIterator[str]:
+        events = await self.client_for(api_key).responses.create(model=model, input=messages, temperature=temperature, stream=True)
+        async for event in events:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+            elif event.type == "response.completed" and event.response.usage:
+                metrics.record_tokens(self.name, model, event.response.usage.input_tokens, event.response.usage.output_tokens)
+
+
+class FakeProvider(AIProvider):
+    """Offline provider for tests and local runs: replies after ``latency`` seconds without any network."""
+
+    name = "fake"
+    requires_api_key = False
+
+    def __init__(self, latency: float = 0.0, reply: str | None = None, max_concurrency: int | None = None, keep_calls: int = 100):
+        super().__init__(max_concurrency)
+        self.latency = latency
+        self.reply = reply
+        # Only the latest calls, for tests to inspect: a long local run or a bench must not grow without bound.
+        self.calls: deque[dict[str, Any]] = deque(maxlen=keep_calls)
+
+    async def _complete(self, *, api_key: str | None, model: str, messages: list[dict[str, str]], temperature: float) -> str:
+        self.calls.append({"model": model, "messages": messages, "temperature": temperature})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._reply_for(model, messages)
+
+    async def _stream(self, *, api_key: str | None, model: str, messages: list[dict[str, str]], temperature: float) -> AsyncIterator[str]:
+        self.calls.append({"model": model, "messages": messages, "temperature": temperature, "stream": True})
+        words = self._reply_for(model, messages).split(" ")
+        for i, word in enumerate(words):
+            if self.latency:
+                await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+
+    def _reply_for(self, model: str, messages: list[dict[str, str]]) -> str:
+        reply = self.reply if self.reply is not None else f"Resposta automática: {messages[-1]['content']}"
+        # Rough four-characters-per-token estimate, so token metrics move in offline runs too.
+        metrics.record_tokens(self.name, model, sum(len(m["content"]) for m in messages) // 4, len(reply) // 4)
+        return reply
+
+
+_provider: AIProvider | None = None
+
+
+def get_provider() -> AIProvider:
+    global _provider
+    if _provider is None:
+        if settings.ai_provider == "fake":
+            _provider = FakeProvider(latency=settings.fake_ai_latency_ms / 1000)
+        else:
+            _provider = OpenAIProvider()
+    return _provider
+
+
+def set_provider(provider: AIProvider | None) -> None:
+    global _provider
+    _provider = provider
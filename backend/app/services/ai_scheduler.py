@@ -0,0 +1,154 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+import heapq
+import itertools
+import time
+from typing import AsyncIterator
+
+from app.config import settings
+from app.services import metrics
+from app.services.rate_limit import TokenBucket
+
+
+class Deferred(Exception):
+    """The tenant already has ``queue_limit`` AI calls waiting; this one is not queued."""
+
+
+@dataclass(frozen=True)
+class Policy:
+    # None: no rate limit, only the fair share of the provider slots.
+    requests_per_minute: int | None
+    burst: int | None
+    weight: int
+
+
+class _Tenant:
+    __slots__ = ("bucket", "finish", "queued", "in_flight", "served", "deferred", "wait_seconds", "max_wait_seconds")
+
+    def __init__(self):
+        self.bucket: TokenBucket | None = None
+        self.finish = 0.0
+        self.queued = 0
+        self.in_flight = 0
+        self.served = 0
+        self.deferred = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+
+class FairScheduler:
+    """Admits AI calls to the provider per tenant: a token bucket sized by the plan, then a weighted-fair queue.
+
+    The queue is start-time fair queueing over ``capacity`` concurrent provider calls: each call is
+    tagged ``finish = max(virtual time, tenant's last finish) + 1 / weight`` and free slots go to the
+    smallest tag. A tenant sending a burst only competes with its own backlog, so other tenants'
+    calls keep getting slots at their share; a tenant with ``queue_limit`` calls already waiting is
+    deferred instead of queued.
+    """
+
+    def __init__(self, capacity: int = 32, queue_limit: int = 50):
+        self.capacity = capacity
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self._virtual = 0.0
+        self._heap: list[tuple[float, int, float, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._tenants: dict[int, _Tenant] = {}
+
+    def _tenant(self, client_id: int, policy: Policy) -> _Tenant:
+        tenant = self._tenants.get(client_id)
+        if tenant is None:
+            tenant = self._tenants[client_id] = _Tenant()
+        if policy.requests_per_minute:
+            rate, burst = policy.requests_per_minute / 60, policy.burst or policy.requests_per_minute
+            if tenant.bucket is None:
+                tenant.bucket = TokenBucket(rate, burst)
+            elif tenant.bucket.rate != rate or tenant.bucket.capacity != burst:
+                tenant.bucket.resize(rate, burst)
+        else:
+            tenant.bucket = None
+        return tenant
+
+    async def _admit(self, tenant: _Tenant, weight: int) -> None:
+        start = max(self._virtual, tenant.finish)
+        tenant.finish = start + 1 / max(weight, 1)
+        if self.in_flight < self.capacity and not self._heap:
+            self.in_flight += 1
+            self._virtual = start
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (tenant.finish, next(self._seq), start, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled: give it to the next caller.
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        while self._heap and self.in_flight < self.capacity:
+            _, _, start, future = heapq.heappop(self._heap)
+            if future.done():
+                continue
+            self.in_flight += 1
+            self._virtual = start
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, client_id: int, policy: Policy) -> AsyncIterator[float]:
+        """Holds one provider slot for ``client_id``; yields the seconds spent waiting for it."""
+        tenant = self._tenant(client_id, policy)
+        label = metrics.tenant_label(client_id)
+        if tenant.queued >= self.queue_limit:
+            tenant.deferred += 1
+            metrics.ai_deferred.inc((label,))
+            raise Deferred()
+
+        tenant.queued += 1
+        metrics.ai_queue_depth.set((label,), tenant.queued)
+        started = time.perf_counter()
+        try:
+            if tenant.bucket:
+                await tenant.bucket.acquire()
+            await self._admit(tenant, policy.weight)
+        finally:
+            tenant.queued -= 1
+            metrics.ai_queue_depth.set((label,), tenant.queued)
+        waited = time.perf_counter() - started
+        tenant.served += 1
+        tenant.wait_seconds += waited
+        tenant.max_wait_seconds = max(tenant.max_wait_seconds, waited)
+        metrics.ai_queue_wait.observe((label,), waited)
+
+        tenant.in_flight += 1
+        try:
+            yield waited
+        finally:
+            tenant.in_flight -= 1
+            self._release()
+
+    def tenant_stats(self, client_id: int) -> dict[str, int | float]:
+        tenant = self._tenants.get(client_id) or _Tenant()
+        return {
+            "queued": tenant.queued,
+            "in_flight": tenant.in_flight,
+            "served": tenant.served,
+            "deferred": tenant.deferred,
+            "avg_wait_seconds": round(tenant.wait_seconds / tenant.served, 4) if tenant.served else 0.0,
+            "max_wait_seconds": round(tenant.max_wait_seconds, 4),
+        }
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": len(self._heap),
+            "tenants_waiting": sum(1 for t in self._tenants.values() if t.queued),
+        }
+
+
+scheduler = FairScheduler(capacity=settings.ai_max_concurrency, queue_limit=settings.ai_tenant_queue_limit)
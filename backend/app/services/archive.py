@@ -0,0 +1,167 @@
+import asyncio
+from datetime import datetime, timedelta
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Iterator
+
+from sqlalchemy import Table, delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import SessionLocal, run_db
+from app.models import ArchivedConversation, ArchiveSegment, Client, Conversation, Message, Plan, SystemLog
+
+logger = logging.getLogger(__name__)
+
+messages_table: Table = Message.__table__
+logs_table: Table = SystemLog.__table__
+
+
+def _encode(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _write(path: Path, rows: list[dict[str, Any]]) -> None:
+    # Written under a temporary name and fsynced before the rename, so the rows are only deleted once
+    # a complete file is on disk. A crash in between leaves an unreferenced file and the rows in place.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+            for row in rows:
+                out.write(json.dumps({k: _encode(v) for k, v in row.items()}, ensure_ascii=False).encode("utf-8") + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+
+def _archive_batches(db: Session, kind: str, client_id: int, table: Table, query, batch_size: int) -> int:
+    """Moves the rows matched by ``query`` to segment files, one short transaction per batch."""
+    root = Path(settings.archive_dir)
+    archived = 0
+    while True:
+        rows = [dict(row) for row in db.execute(query.order_by(table.c.id).limit(batch_size)).mappings()]
+        if not rows:
+            return archived
+
+        periods: dict[str, list[dict[str, Any]]] = {}
+        for row in rows:
+            periods.setdefault(row["created_at"].strftime("%Y-%m"), []).append(row)
+        for period, chunk in periods.items():
+            relative = f"{kind}/{client_id}/{period}/{chunk[0]['id']}-{chunk[-1]['id']}.ndjson.gz"
+            _write(root / relative, chunk)
+            segment = ArchiveSegment(
+                client_id=client_id, kind=kind, period=period, path=relative, rows=len(chunk), first_id=chunk[0]["id"], last_id=chunk[-1]["id"]
+            )
+            db.add(segment)
+            db.flush()
+            if kind == "messages":
+                conversation_ids = sorted({row["conversation_id"] for row in chunk})
+                db.execute(insert(ArchivedConversation), [{"conversation_id": cid, "segment_id": segment.id} for cid in conversation_ids])
+
+        db.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+        db.commit()
+        archived += len(rows)
+        if len(rows) < batch_size:
+            return archived
+
+
+def archive_client(db: Session, client_id: int, message_days: int | None, log_days: int | None, batch_size: int, now: datetime | None = None) -> dict[str, int]:
+    now = now or datetime.utcnow()
+    counts = {"messages": 0, "system_logs": 0}
+    if message_days is not None:
+        cutoff = now - timedelta(days=message_days)
+        query = (
+            select(messages_table)
+            .join(Conversation, Conversation.id == messages_table.c.conversation_id)
+            .where(Conversation.client_id == client_id, messages_table.c.created_at < cutoff)
+        )
+        counts["messages"] = _archive_batches(db, "messages", client_id, messages_table, query, batch_size)
+    if log_days is not None:
+        cutoff = now - timedelta(days=log_days)
+        query = select(logs_table).where(logs_table.c.client_id == client_id, logs_table.c.created_at < cutoff)
+        counts["system_logs"] = _archive_batches(db, "system_logs", client_id, logs_table, query, batch_size)
+    return counts
+
+
+def archive_all(db: Session, batch_size: int = 2000, now: datetime | None = None) -> dict[str, int]:
+    """Archives every tenant's messages and system logs past its plan's retention."""
+    policies = db.execute(
+        select(Client.id, Plan.message_retention_days, Plan.log_retention_days)
+        .join(Plan, Plan.id == Client.plan_id)
+        .where((Plan.message_retention_days.is_not(None)) | (Plan.log_retention_days.is_not(None)))
+        .order_by(Client.id)
+    ).all()
+    db.rollback()
+
+    totals = {"messages": 0, "system_logs": 0}
+    for client_id, message_days, log_days in policies:
+        for kind, count in archive_client(db, client_id, message_days, log_days, batch_size, now).items():
+            totals[kind] += count
+    return totals
+
+
+def conversation_segments(db: Session, conversation_id: int) -> list[str]:
+    return list(
+        db.scalars(
+            select(ArchiveSegment.path)
+            .join(ArchivedConversation, ArchivedConversation.segment_id == ArchiveSegment.id)
+            .where(ArchivedConversation.conversation_id == conversation_id)
+            .order_by(ArchiveSegment.first_id)
+        )
+    )
+
+
+def read_conversation(paths: list[str], conversation_id: int) -> Iterator[dict[str, Any]]:
+    """Yields the archived messages of a conversation in order, decompressing one line at a time."""
+    root = Path(settings.archive_dir)
+    for relative in paths:
+        try:
+            source = gzip.open(root / relative, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            logger.error("archive segment %s is missing", relative)
+            continue
+        with source:
+            for line in source:
+                row = json.loads(line)
+                if row["conversation_id"] == conversation_id:
+                    yield row
+
+
+def _archive_once() -> dict[str, int]:
+    db = SessionLocal()
+    try:
+        return archive_all(db, settings.archive_batch_size)
+    finally:
+        db.close()
+
+
+async def _archive_periodically(interval: float) -> None:
+    while True:
+        try:
+            archived = await run_db(_archive_once)
+            if any(archived.values()):
+                logger.info("archived rows: %s", archived)
+        except Exception:
+            logger.exception("archiving failed")
+        await asyncio.sleep(interval)
+
+
+_task: asyncio.Task | None = None
+
+
+def start(interval: float) -> None:
+    global _task
+    if interval > 0 and _task is None:
+        _task = asyncio.create_task(_archive_periodically(interval))
+
+
+async def stop() -> None:
+    global _task
+    if _task:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
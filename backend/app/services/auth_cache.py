@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+import hashlib
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from app.config import settings
+from app.db import on_commit
+from app.models import User
+from app.services.cache import TTLCache
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    client_id: int
+    role: str
+    status: str
+    email: str
+    name: str
+
+    @classmethod
+    def of(cls, user: User) -> "UserSnapshot":
+        return cls(id=user.id, client_id=user.client_id, role=user.role, status=user.status, email=user.email, name=user.name)
+
+
+verified_tokens = TTLCache(maxsize=settings.auth_cache_size, ttl=settings.auth_cache_ttl_seconds)
+
+
+def _key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get(token: str) -> UserSnapshot | None:
+    return verified_tokens.get(_key(token))
+
+
+def put(token: str, claims: dict, snapshot: UserSnapshot) -> None:
+    # Never outlive the token itself: a cached entry must expire no later than the JWT's exp.
+    ttl = min(settings.auth_cache_ttl_seconds, float(claims.get("exp", 0)) - time.time())
+    if ttl > 0:
+        verified_tokens.set(_key(token), snapshot, ttl=ttl)
+
+
+def invalidate_user(user_id: int) -> int:
+    return verified_tokens.pop_where(lambda _, snapshot: snapshot.id == user_id)
+
+
+@event.listens_for(User, "after_update")
+def _drop_changed_user(mapper, connection, target: User) -> None:
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("status", "role", "client_id")):
+        # Runs at flush time: dropping the entry now would let a concurrent request re-cache the old row before commit.
+        on_commit(object_session(target), "pending_auth_invalidations").append(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    for user_id in session.info.pop("pending_auth_invalidations", ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_pending(session: Session, previous_transaction) -> None:
+    if not previous_transaction.nested:
+        session.info.pop("pending_auth_invalidations", None)
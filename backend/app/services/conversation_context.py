@@ -0,0 +1,142 @@
+import asyncio
+from dataclasses import dataclass
+import logging
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Conversation, Message
+from app.services import ai_provider, ai_scheduler, tenant_context, usage
+
+logger = logging.getLogger(__name__)
+
+ROLES = {"customer": "user", "ai": "assistant", "human": "assistant", "system": "assistant"}
+SPEAKERS = {"customer": "Cliente", "ai": "Assistente", "human": "Atendente", "system": "Sistema"}
+
+
+def estimate_tokens(text: str) -> int:
+    # About four characters per token plus per-message framing; close enough for budgeting without a tokenizer.
+    return len(text) // 4 + 4
+
+
+@dataclass(frozen=True)
+class ConversationContext:
+    summary: str | None
+    turns: list[dict[str, str]]
+    # Some unsummarized turns did not fit the window, so the summary should absorb them.
+    overflow: bool
+
+
+def _recent_rows(db: Session, conversation_id: int, through_id: int | None, upto_message_id: int | None, limit: int):
+    query = db.query(Message.id, Message.sender, Message.content).filter(
+        Message.conversation_id == conversation_id, Message.id > (through_id or 0)
+    )
+    if upto_message_id is not None:
+        query = query.filter(Message.id <= upto_message_id)
+    return query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()
+
+
+def _window(rows, budget: int, max_messages: int) -> int:
+    """How many of ``rows`` (newest first) fit in ``budget``; the newest turn is always kept."""
+    size = 0
+    for _, _, content in rows[:max_messages]:
+        cost = estimate_tokens(content)
+        if size and cost > budget:
+            break
+        budget -= cost
+        size += 1
+    return size
+
+
+def load_context(db: Session, conversation_id: int, upto_message_id: int | None = None) -> ConversationContext:
+    """Summary plus the newest turns that fit in ``ai_context_tokens``, oldest first."""
+    summary, through_id = db.query(Conversation.summary, Conversation.summary_through_id).filter(Conversation.id == conversation_id).one()
+    max_messages = settings.ai_context_max_messages
+    rows = _recent_rows(db, conversation_id, through_id, upto_message_id, max_messages + 1)
+    budget = settings.ai_context_tokens - (estimate_tokens(summary) if summary else 0)
+    size = _window(rows, budget, max_messages)
+    turns = [{"role": ROLES.get(sender, "user"), "content": content} for _, sender, content in reversed(rows[:size])]
+    return ConversationContext(summary=summary, turns=turns, overflow=size < len(rows))
+
+
+def _turns_to_fold(db: Session, conversation_id: int):
+    # Fold down to half the window so a summary update happens every few turns, not on every message.
+    summary, through_id = db.query(Conversation.summary, Conversation.summary_through_id).filter(Conversation.id == conversation_id).one()
+    rows = _recent_rows(db, conversation_id, through_id, None, settings.ai_context_max_messages * 4)
+    keep = _window(rows, settings.ai_context_tokens // 2, settings.ai_context_max_messages // 2)
+    fold = list(reversed(rows[keep:]))
+    return (summary, through_id, fold) if fold else None
+
+
+def _summary_request(summary: str | None, rows) -> list[dict[str, str]]:
+    transcript = "\n".join(f"{SPEAKERS.get(sender, 'Cliente')}: {content}" for _, sender, content in rows)
+    return [
+        {
+            "role": "system",
+            "content": "Atualize o resumo da conversa com as novas mensagens, mantendo nomes, pedidos e decisões importantes. "
+            f"Responda apenas com o resumo, em no máximo {settings.ai_summary_tokens * 3 // 4} palavras.",
+        },
+        {"role": "user", "content": f"Resumo atual:\n{summary or '(vazio)'}\n\nNovas mensagens:\n{transcript}"},
+    ]
+
+
+async def refresh_summary(client_id: int, conversation_id: int) -> bool:
+    """Folds the turns that fell out of the window into the conversation summary with one provider call.
+
+    The call takes a slot of the tenant's AI scheduler like a reply does, so it spends the same rate budget,
+    but it is not counted in ``usage``: the plan limits replies sent to customers, and a summary is at most
+    one extra call every few turns of a long conversation. Once the plan limit is reached no reply needs the
+    summary, so none is made.
+    """
+    async with AsyncSessionLocal() as db:
+        pending = await db.run_sync(_turns_to_fold, conversation_id)
+        ctx = await db.run_sync(tenant_context.get_tenant_context, client_id)
+        provider = ai_provider.get_provider()
+        if not pending or not ctx or not provider.ready(ctx.api_key):
+            return False
+        if await db.run_sync(usage.get_ai_usage, client_id) >= ctx.max_ai_messages:
+            return False
+
+        summary, through_id, rows = pending
+        policy = ai_scheduler.Policy(ctx.ai_requests_per_minute, ctx.ai_burst, ctx.ai_weight)
+        try:
+            async with ai_scheduler.scheduler.slot(client_id, policy):
+                updated = await provider.complete(
+                    api_key=ctx.api_key, model=settings.openai_model, messages=_summary_request(summary, rows), temperature=0.2
+                )
+        except ai_scheduler.Deferred:
+            # The tenant's queue is full; the next reply that overflows the window schedules another attempt.
+            return False
+        current = Conversation.summary_through_id.is_(None) if through_id is None else Conversation.summary_through_id == through_id
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id, current)
+            .values(summary=updated.strip()[: settings.ai_summary_tokens * 4], summary_through_id=rows[-1][0])
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+
+_refreshing: set[int] = set()
+_tasks: set[asyncio.Task] = set()
+
+
+def schedule_refresh(client_id: int, conversation_id: int) -> None:
+    """Runs refresh_summary in the background, at most once at a time per conversation."""
+    if conversation_id in _refreshing:
+        return
+    _refreshing.add(conversation_id)
+
+    async def run() -> None:
+        try:
+            await refresh_summary(client_id, conversation_id)
+        except Exception:
+            logger.exception("summary refresh failed for conversation %s", conversation_id)
+        finally:
+            _refreshing.discard(conversation_id)
+
+    task = asyncio.get_running_loop().create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
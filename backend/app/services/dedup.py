@@ -0,0 +1,44 @@
+import threading
+
+from app.config import settings
+from app.services import metrics
+from app.services.cache import TTLCache
+
+
+class WebhookDedup:
+    """Recently seen webhook deliveries, so a re-delivery is dropped before any DB write or provider call.
+
+    The set is bounded (LRU + TTL). A re-delivery that outlives its entry, or that reaches another
+    process, is still rejected by the unique ``messages.dedup_key`` unless it was never answered.
+    """
+
+    def __init__(self, maxsize: int = 100000, ttl: float = 3600.0):
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.duplicates: dict[tuple[str, str], int] = {}
+
+    def claim(self, key: str) -> bool:
+        """True the first time ``key`` is seen; False (and counted) for a duplicate."""
+        if self._seen.add(key):
+            return True
+        self.count(key, "memory")
+        return False
+
+    def forget(self, key: str) -> None:
+        # Processing failed before the message was answered: let the platform's retry through.
+        self._seen.pop(key)
+
+    def count(self, key: str, layer: str) -> None:
+        platform = key.split(":", 1)[0]
+        with self._lock:
+            self.duplicates[(platform, layer)] = self.duplicates.get((platform, layer), 0) + 1
+        metrics.webhook_duplicates.inc((platform, layer))
+
+    def stats(self) -> dict:
+        by_platform: dict[str, dict[str, int]] = {}
+        for (platform, layer), count in self.duplicates.items():
+            by_platform.setdefault(platform, {})[layer] = count
+        return {"size": len(self._seen), "duplicates": sum(self.duplicates.values()), "by_platform": by_platform}
+
+
+webhooks = WebhookDedup(maxsize=settings.webhook_dedup_size, ttl=settings.webhook_dedup_ttl_seconds)
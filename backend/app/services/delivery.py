@@ -0,0 +1,385 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+import random
+from typing import Any
+
+import httpx
+from sqlalchemy import literal_column, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Conversation, Integration, Message
+from app.security import decrypt_secret
+from app.services import events
+from app.services.cache import TTLCache
+from app.services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Published send caps per sending account: Telegram about 30 messages/s per bot, the WhatsApp Cloud API
+# 80 messages/s per business phone number (default tier), the Instagram Send API 100 calls/s per account.
+RATE_LIMITS = {"telegram": 30.0, "whatsapp": 80.0, "instagram": 100.0}
+
+
+@dataclass(frozen=True)
+class Outbound:
+    platform: str
+    account: str
+    token: str
+    recipient: str
+    text: str
+
+
+@dataclass(frozen=True)
+class DeliveryJob:
+    message_id: int
+    client_id: int
+    conversation_id: int
+    outbound: Outbound
+
+
+class DeliveryError(Exception):
+    def __init__(self, detail: str, attempts: int):
+        super().__init__(detail)
+        self.attempts = attempts
+
+
+def _request(out: Outbound) -> tuple[str, dict[str, str], dict[str, Any]]:
+    if out.platform == "telegram":
+        return f"{settings.telegram_api_url}/bot{out.token}/sendMessage", {}, {"chat_id": out.recipient, "text": out.text}
+    headers = {"Authorization": f"Bearer {out.token}"}
+    if out.platform == "whatsapp":
+        body = {"messaging_product": "whatsapp", "to": out.recipient, "type": "text", "text": {"body": out.text}}
+    else:
+        body = {"recipient": {"id": out.recipient}, "message": {"text": out.text}, "messaging_type": "RESPONSE"}
+    return f"{settings.graph_api_url}/{out.account}/messages", headers, body
+
+
+def _external_id(platform: str, body: dict[str, Any]) -> str | None:
+    if platform == "telegram":
+        message_id = (body.get("result") or {}).get("message_id")
+        return str(message_id) if message_id is not None else None
+    if platform == "whatsapp":
+        return ((body.get("messages") or [{}])[0]).get("id")
+    return body.get("message_id")
+
+
+def _json(response: httpx.Response) -> dict[str, Any]:
+    try:
+        body = response.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    header = response.headers.get("Retry-After", "")
+    if header.isdigit():
+        return float(header)
+    try:
+        return float(_json(response)["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    # Exponential backoff with full jitter, so retries from many workers don't line up.
+    return random.uniform(0, min(settings.delivery_backoff_max_seconds, settings.delivery_backoff_seconds * 2 ** (attempt - 1)))
+
+
+credentials = TTLCache(maxsize=settings.tenant_cache_size, ttl=settings.tenant_cache_ttl_seconds)
+
+
+def _credentials(db: Session, client_id: int, platform: str) -> tuple[str, str] | None:
+    """(sending account, access token) of the tenant's connected integration for ``platform``."""
+    key = (client_id, platform)
+    cached = credentials.get(key)
+    if cached:
+        return cached
+
+    row = (
+        db.query(Integration)
+        .filter(Integration.client_id == client_id, Integration.platform == platform, Integration.status == "connected")
+        .first()
+    )
+    if not row:
+        return None
+    config = row.config or {}
+    if platform == "telegram":
+        value = (row.token_fingerprint or str(row.id), decrypt_secret(config["token"]))
+    elif platform == "whatsapp":
+        value = (config["phone_number_id"], decrypt_secret(config["access_token"]))
+    else:
+        value = (config["page_id"], decrypt_secret(config["access_token"]))
+    credentials.set(key, value)
+    return value
+
+
+def invalidate_credentials(client_id: int) -> None:
+    credentials.pop_where(lambda key, _: key[0] == client_id)
+
+
+def _load_job(db: Session, message_id: int) -> DeliveryJob | None:
+    row = db.query(Message, Conversation).join(Conversation, Conversation.id == Message.conversation_id).filter(Message.id == message_id).first()
+    if not row:
+        return None
+    message, conv = row
+    found = _credentials(db, conv.client_id, conv.channel)
+    if not found:
+        _mark(db, message_id, conv.client_id, conv.id, "failed", 0, error="Integration not connected")
+        return None
+    account, token = found
+    return DeliveryJob(message_id, conv.client_id, conv.id, Outbound(conv.channel, account, token, conv.external_user_id, message.content))
+
+
+def _mark(db: Session, message_id: int, client_id: int, conversation_id: int, status: str, attempts: int, external_id: str | None = None, error: str | None = None) -> None:
+    values = {"delivery_status": status, "delivery_attempts": attempts, "delivery_error": error}
+    if status == "sent":
+        values.update(external_id=external_id, delivered_at=datetime.utcnow())
+    db.query(Message).filter(Message.id == message_id).update(values, synchronize_session=False)
+    events.publish_after_commit(
+        db, events.client_topic(client_id), {"type": "delivery", "conversation_id": conversation_id, "message_id": message_id, "status": status}
+    )
+    db.commit()
+
+
+def _claim(db: Session, message_id: int) -> bool:
+    """Takes the delivery of a pending message, unless another worker holds a live claim on it."""
+    now = datetime.utcnow()
+    claimed = db.execute(
+        update(Message)
+        .where(
+            Message.id == message_id,
+            Message.delivery_status == "pending",
+            or_(Message.delivery_claimed_at.is_(None), Message.delivery_claimed_at < now - timedelta(seconds=settings.delivery_claim_seconds)),
+        )
+        .values(delivery_claimed_at=now)
+    ).rowcount
+    db.commit()
+    return claimed == 1
+
+
+def _release(db: Session, message_id: int) -> None:
+    """Drops this worker's claim on a message it could not finish, so the next sweep retries it."""
+    db.rollback()
+    db.query(Message).filter(Message.id == message_id, Message.delivery_status == "pending").update(
+        {"delivery_claimed_at": None}, synchronize_session=False
+    )
+    db.commit()
+
+
+def _stale_pending(db: Session, after_id: int, limit: int) -> list[tuple[int, int]]:
+    now = datetime.utcnow()
+    return [
+        (message_id, conversation_id)
+        for message_id, conversation_id in db.query(Message.id, Message.conversation_id)
+        .filter(
+            # A literal, not a bound parameter, or SQLite can't match it to the partial index.
+            Message.delivery_status == literal_column("'pending'"),
+            Message.created_at < now - timedelta(seconds=settings.delivery_pending_grace_seconds),
+            or_(Message.delivery_claimed_at.is_(None), Message.delivery_claimed_at < now - timedelta(seconds=settings.delivery_claim_seconds)),
+            Message.id > after_id,
+        )
+        .order_by(Message.id)
+        .limit(limit)
+    ]
+
+
+class Dispatcher:
+    """Delivers stored replies to the customer's channel from a fixed set of workers.
+
+    Messages are sharded by conversation so replies in one conversation go out in order. Each
+    platform gets one pooled HTTP client, and each sending account gets its own token bucket.
+    Replies that stay pending (queue full, submitted before start, a restart mid-delivery) are
+    picked up again by a periodic sweep; a claim on the row keeps workers from sending one twice.
+    """
+
+    def __init__(self, workers: int = 8, queue_size: int = 10000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queues: list[asyncio.Queue[int]] = []
+        self._tasks: list[asyncio.Task] = []
+        self._sweeper: asyncio.Task | None = None
+        # Queued or being delivered by this process, so the sweep doesn't queue them again.
+        self._inflight: set[int] = set()
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._buckets = TTLCache(maxsize=settings.routing_cache_size, ttl=3600)
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.swept = 0
+        self.throttled_seconds = 0.0
+
+    def _client(self, platform: str) -> httpx.AsyncClient:
+        client = self._clients.get(platform)
+        if client is None:
+            limits = httpx.Limits(max_connections=settings.delivery_max_connections, max_keepalive_connections=settings.delivery_max_connections)
+            client = httpx.AsyncClient(timeout=settings.delivery_timeout_seconds, limits=limits)
+            self._clients[platform] = client
+        return client
+
+    def warm(self) -> None:
+        for platform in RATE_LIMITS:
+            self._client(platform)
+
+    def _bucket(self, platform: str, account: str) -> TokenBucket:
+        key = (platform, account)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(RATE_LIMITS[platform])
+            self._buckets.set(key, bucket)
+        return bucket
+
+    async def send(self, out: Outbound) -> tuple[str | None, int]:
+        """Sends one message, retrying 429/5xx and network errors; returns (platform message id, attempts)."""
+        url, headers, body = _request(out)
+        bucket = self._bucket(out.platform, out.account)
+        max_attempts = settings.delivery_max_attempts
+        for attempt in range(1, max_attempts + 1):
+            self.throttled_seconds += await bucket.acquire()
+            retry_after = None
+            try:
+                response = await self._client(out.platform).post(url, headers=headers, json=body)
+            except httpx.TransportError as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            else:
+                if response.is_success:
+                    return _external_id(out.platform, _json(response)), attempt
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code != 429 and response.status_code < 500:
+                    raise DeliveryError(error, attempt)
+                retry_after = _retry_after(response)
+                if response.status_code == 429 and retry_after:
+                    bucket.pause(retry_after)
+            if attempt == max_attempts:
+                raise DeliveryError(error, attempt)
+            self.retries += 1
+            await asyncio.sleep(retry_after if retry_after is not None else _backoff(attempt))
+
+    async def deliver(self, message_id: int) -> None:
+        async with AsyncSessionLocal() as db:
+            if not await db.run_sync(_claim, message_id):
+                # Already sent, or another worker is sending it.
+                self.skipped += 1
+                return
+            try:
+                await self._deliver_claimed(db, message_id)
+            except Exception:
+                await db.run_sync(_release, message_id)
+                raise
+
+    async def _deliver_claimed(self, db: AsyncSession, message_id: int) -> None:
+        job = await db.run_sync(_load_job, message_id)
+        if job is None:
+            self.failed += 1
+            return
+        try:
+            external_id, attempts = await self.send(job.outbound)
+        except DeliveryError as exc:
+            self.failed += 1
+            logger.warning("delivery of message %s failed after %s attempts: %s", message_id, exc.attempts, exc)
+            await db.run_sync(_mark, message_id, job.client_id, job.conversation_id, "failed", exc.attempts, error=str(exc)[:255])
+        else:
+            self.sent += 1
+            await db.run_sync(_mark, message_id, job.client_id, job.conversation_id, "sent", attempts, external_id=external_id)
+
+    async def _run(self, queue: asyncio.Queue[int]) -> None:
+        while True:
+            message_id = await queue.get()
+            try:
+                await self.deliver(message_id)
+            except Exception:
+                logger.exception("delivery of message %s crashed", message_id)
+            finally:
+                self._inflight.discard(message_id)
+                queue.task_done()
+
+    async def sweep(self) -> int:
+        """Resubmits replies still pending after the grace period; returns how many were queued."""
+        queued, last_id = 0, 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                rows = await db.run_sync(_stale_pending, last_id, settings.delivery_sweep_batch_size)
+            for message_id, conversation_id in rows:
+                if message_id in self._inflight:
+                    continue
+                if not self.submit(message_id, conversation_id):
+                    # Queue full (or stopped): the rest waits for the next sweep.
+                    self.swept += queued
+                    return queued
+                queued += 1
+            if len(rows) < settings.delivery_sweep_batch_size:
+                self.swept += queued
+                return queued
+            last_id = rows[-1][0]
+
+    async def _sweep_periodically(self, interval: float) -> None:
+        while True:
+            try:
+                queued = await self.sweep()
+                if queued:
+                    logger.info("resubmitted %s pending deliveries", queued)
+            except Exception:
+                logger.exception("delivery sweep failed")
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._run(queue)) for queue in self._queues]
+        if settings.delivery_sweep_interval_seconds > 0:
+            self._sweeper = asyncio.create_task(self._sweep_periodically(settings.delivery_sweep_interval_seconds))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._sweeper:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        if self._tasks:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("stopping with deliveries still in flight; they stay pending until a sweep resubmits them")
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks, self._queues = [], []
+            self._inflight.clear()
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def submit(self, message_id: int, conversation_id: int) -> bool:
+        """Queues a stored message for delivery; if the dispatcher is not running or full it stays "pending" for the sweep."""
+        if not self._tasks:
+            return False
+        try:
+            self._queues[conversation_id % len(self._queues)].put_nowait(message_id)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("delivery queue full, message %s left pending", message_id)
+            return False
+        self._inflight.add(message_id)
+        return True
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "queued": sum(q.qsize() for q in self._queues),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "swept": self.swept,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
+
+
+dispatcher = Dispatcher(workers=settings.delivery_workers, queue_size=settings.delivery_queue_size)
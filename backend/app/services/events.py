@@ -0,0 +1,135 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Hashable
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event as orm_event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import on_commit
+
+
+def _running_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class Subscription:
+    """A subscriber's bounded queue; when it is full the oldest event is dropped instead of blocking publishers."""
+
+    def __init__(self, bus: "EventBus", topics: tuple[Hashable, ...], maxsize: int):
+        self.bus = bus
+        self.topics = topics
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, event: dict[str, Any]) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> dict[str, Any] | None:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: dict[Hashable, set[Subscription]] = {}
+
+    def subscribe(self, *topics: Hashable, maxsize: int | None = None) -> Subscription:
+        subscription = Subscription(self, topics, maxsize or self.queue_size)
+        for topic in topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def has_subscribers(self, topic: Hashable) -> bool:
+        return bool(self._subscribers.get(topic))
+
+    def publish(self, topic: Hashable, event: dict[str, Any]) -> int:
+        """Delivers ``event`` to every subscriber of ``topic``; safe to call from sync routes on worker threads."""
+        subscribers = list(self._subscribers.get(topic, ()))
+        loop = _running_loop()
+        for subscription in subscribers:
+            if subscription.loop is loop:
+                subscription.offer(event)
+            else:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+        return len(subscribers)
+
+    def stats(self) -> dict[str, int]:
+        subscriptions = {s for subs in self._subscribers.values() for s in subs}
+        return {
+            "topics": len(self._subscribers),
+            "subscriptions": len(subscriptions),
+            "dropped": sum(s.dropped for s in subscriptions),
+        }
+
+
+bus = EventBus(queue_size=settings.event_queue_size)
+
+
+def conversation_topic(conversation_id: int) -> tuple[str, int]:
+    return ("conversation", conversation_id)
+
+
+def client_topic(client_id: int) -> tuple[str, int]:
+    return ("client", client_id)
+
+
+def publish_after_commit(session, topic: Hashable, event: dict[str, Any]) -> None:
+    """Publishes once ``session`` commits, so subscribers never see rows that were rolled back."""
+    on_commit(session, "pending_events").append((topic, event))
+
+
+@orm_event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    for topic, event in session.info.pop("pending_events", ()):
+        bus.publish(topic, event)
+
+
+@orm_event.listens_for(Session, "after_soft_rollback")
+def _drop_pending(session: Session, previous_transaction) -> None:
+    if not previous_transaction.nested:
+        session.info.pop("pending_events", None)
+
+
+async def _sse_events(request: Request, subscription: Subscription) -> AsyncIterator[str]:
+    try:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.get(timeout=settings.sse_keepalive_seconds)
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+    finally:
+        subscription.close()
+
+
+def sse_response(request: Request, subscription: Subscription) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_events(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
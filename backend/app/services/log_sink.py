@@ -0,0 +1,179 @@
+from datetime import datetime
+import logging
+import threading
+from typing import Any
+
+from sqlalchemy import event as orm_event, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import SessionLocal, on_commit
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedSink:
+    """Queues ORM rows in memory and writes them with bulk INSERTs from a background thread.
+
+    A flush happens every ``interval`` seconds or as soon as ``batch_size`` rows are pending. Producers
+    never write themselves (they may be on the event loop): once ``max_pending`` rows are waiting, new
+    rows are dropped and counted in ``log_sink_dropped_total``. A batch that fails to insert goes back to
+    the queue; rows that keep failing on their own are dropped after ``max_attempts``.
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = 200, max_pending: int = 5000, interval: float = 1.0, max_attempts: int = 5):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.interval = interval
+        self.max_attempts = max_attempts
+        # (model, values, failed attempts so far)
+        self._pending: list[tuple[type, dict[str, Any], int]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def _drop(self, model: type, count: int = 1) -> None:
+        self.dropped += count
+        metrics.log_sink_dropped.inc((model.__tablename__,), count)
+
+    def submit(self, model: type, **values: Any) -> None:
+        values.setdefault("created_at", datetime.utcnow())
+        with self._lock:
+            size = len(self._pending)
+            if size < self.max_pending:
+                self._pending.append((model, values, 0))
+        if size >= self.max_pending:
+            self._drop(model)
+            self._wake.set()
+        elif size + 1 >= self.batch_size:
+            self._wake.set()
+
+    def _insert(self, rows: list[tuple[type, dict[str, Any], int]]) -> None:
+        grouped: dict[type, list[dict[str, Any]]] = {}
+        for model, values, _ in rows:
+            grouped.setdefault(model, []).append(values)
+        db = self.session_factory()
+        try:
+            for model, group in grouped.items():
+                db.execute(insert(model), group)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write(self, batch: list[tuple[type, dict[str, Any], int]]) -> list[tuple[type, dict[str, Any], int]]:
+        """Writes ``batch``; returns the rows that could not be written."""
+        try:
+            self._insert(batch)
+            return []
+        except OperationalError:
+            # The database is unreachable: every row is fine, try the whole batch again later.
+            logger.exception("buffered sink flush failed, %s rows requeued", len(batch))
+            return batch
+        except Exception:
+            logger.exception("buffered sink flush failed, retrying %s rows one by one", len(batch))
+        failed = []
+        for row in batch:
+            try:
+                self._insert([row])
+            except Exception:
+                failed.append((row[0], row[1], row[2] + 1))
+        return failed
+
+    def _requeue(self, rows: list[tuple[type, dict[str, Any], int]]) -> None:
+        retry = []
+        for model, values, attempts in rows:
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                self._drop(model)
+                logger.error("dropping %s row after %s failed inserts: %s", model.__tablename__, attempts, values)
+            else:
+                retry.append((model, values, attempts))
+        with self._lock:
+            # Back at the front, in order; the oldest go first if the queue filled up meanwhile.
+            overflow = max(0, len(retry) + len(self._pending) - self.max_pending)
+            for model, _, _ in retry[:overflow]:
+                self._drop(model)
+            self._pending = retry[overflow:] + self._pending
+        self.retried += len(retry) - overflow
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            failed = self._write(batch)
+            if failed:
+                self._requeue(failed)
+            written = len(batch) - len(failed)
+            self.written += written
+            return written
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self.flush() == 0 and self._pending:
+                # Nothing went through: wait a full interval before trying again instead of spinning.
+                self._stopping.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._pending:
+            logger.error("stopping with %s buffered rows not written", len(self._pending))
+
+    def stats(self) -> dict[str, int]:
+        return {"pending": len(self._pending), "written": self.written, "failed": self.failed, "retried": self.retried, "dropped": self.dropped}
+
+
+sink: BufferedSink | None = None
+if settings.log_sink_mode == "buffered":
+    sink = BufferedSink(
+        batch_size=settings.log_sink_batch_size,
+        max_pending=settings.log_sink_max_pending,
+        interval=settings.log_sink_flush_seconds,
+    )
+
+
+def submit_after_commit(session: Session, model: type, **values: Any) -> None:
+    """Hands the row to the sink once ``session`` commits; a rollback drops it, like a row added to the session."""
+    values.setdefault("created_at", datetime.utcnow())
+    on_commit(session, "pending_sink_rows").append((model, values))
+
+
+@orm_event.listens_for(Session, "after_commit")
+def _submit_pending(session: Session) -> None:
+    rows = session.info.pop("pending_sink_rows", ())
+    if sink:
+        for model, values in rows:
+            sink.submit(model, **values)
+
+
+@orm_event.listens_for(Session, "after_soft_rollback")
+def _drop_pending(session: Session, previous_transaction) -> None:
+    if not previous_transaction.nested:
+        session.info.pop("pending_sink_rows", None)
@@ -0,0 +1,257 @@
+"""In-process metrics in the Prometheus text format.
+
+Each request gets a ``RequestMetrics`` record in a context variable. The SQLAlchemy hooks add
+statement counts and time to it, ``set_tenant`` labels it once the tenant is known, and
+``MetricsMiddleware`` turns it into series labelled by route template and tenant.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+import threading
+import time
+from typing import Any, Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple[str, ...], amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in values]
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, labels: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # Per label set: [count per bucket (not cumulative; +Inf last), sum, count]
+        self._values: dict[tuple[str, ...], list[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels((*self.labels, 'le'), (*key, le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+http_requests = Counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status", "tenant"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route", "tenant"))
+db_statements = Counter("db_statements_total", "SQL statements executed.", ("route", "tenant"))
+db_time = Counter("db_statement_seconds_total", "Time spent executing SQL statements.", ("route", "tenant"))
+ai_latency = Histogram("ai_provider_duration_seconds", "AI provider call latency.", ("provider", "model", "tenant", "outcome"))
+ai_tokens = Counter("ai_tokens_total", "Tokens sent to and received from the AI provider.", ("provider", "model", "tenant", "kind"))
+ai_queue_depth = Gauge("ai_queue_depth", "AI calls waiting for the tenant's rate limit or a provider slot.", ("tenant",))
+ai_queue_wait = Histogram("ai_queue_wait_seconds", "Time AI calls waited before reaching the provider.", ("tenant",))
+ai_deferred = Counter("ai_deferred_total", "AI calls refused because the tenant's queue was full.", ("tenant",))
+webhook_duplicates = Counter("webhook_duplicates_total", "Re-delivered webhook messages dropped, by the check that caught them.", ("platform", "layer"))
+log_sink_dropped = Counter("log_sink_dropped_total", "Buffered log and notification rows dropped (sink full or rows that kept failing).", ("table",))
+component_stats = Gauge("app_component_stat", "Process-wide cache, queue and pool stats, read at scrape time.", ("component", "stat"))
+
+REGISTRY = (http_requests, http_latency, db_statements, db_time, ai_latency, ai_tokens, ai_queue_depth, ai_queue_wait, ai_deferred, webhook_duplicates, log_sink_dropped, component_stats)
+
+
+_stats_sources: list[Callable[[], dict[str, dict | None]]] = []
+
+
+def register_stats(source: Callable[[], dict[str, dict | None]]) -> None:
+    """Exports ``source()`` ({component: stats}) as ``app_component_stat``; nested stat keys are joined with dots."""
+    _stats_sources.append(source)
+
+
+def _flatten(stats: dict, prefix: str = ""):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def _collect_stats() -> None:
+    for source in _stats_sources:
+        for component, stats in source().items():
+            for stat, value in _flatten(stats or {}):
+                component_stats.set((component, stat), value)
+
+
+class RequestMetrics:
+    __slots__ = ("route", "tenant", "statements", "sql_seconds")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.tenant: int | None = None
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+# Shared by reference with threads and tasks started from the request, so they can add to it.
+current: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+_tenants: set[int] = set()
+_tenants_lock = threading.Lock()
+
+
+def tenant_label(client_id: int | None) -> str:
+    """Tenant label, capped at ``metrics_max_tenants`` distinct values so series counts stay bounded."""
+    if client_id is None:
+        return "none"
+    if not settings.metrics_per_tenant:
+        return "all"
+    if client_id not in _tenants:
+        with _tenants_lock:
+            if len(_tenants) >= settings.metrics_max_tenants:
+                return "other"
+            _tenants.add(client_id)
+    return str(client_id)
+
+
+def set_tenant(client_id: int) -> None:
+    record = current.get()
+    if record is not None:
+        record.tenant = client_id
+
+
+def _current_tenant() -> str:
+    record = current.get()
+    return tenant_label(record.tenant if record else None)
+
+
+def observe_ai(provider: str, model: str, seconds: float, outcome: str) -> None:
+    ai_latency.observe((provider, model, _current_tenant(), outcome), seconds)
+
+
+def record_tokens(provider: str, model: str, input_tokens: int | None, output_tokens: int | None) -> None:
+    tenant = _current_tenant()
+    if input_tokens:
+        ai_tokens.inc((provider, model, tenant, "input"), input_tokens)
+    if output_tokens:
+        ai_tokens.inc((provider, model, tenant, "output"), output_tokens)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = getattr(context, "_metrics_started", None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    record = current.get()
+    if record is not None:
+        record.statements += 1
+        record.sql_seconds += elapsed
+    else:
+        # Dispatcher, log sink and other work outside any request.
+        db_statements.inc(("background", "none"))
+        db_time.inc(("background", "none"), elapsed)
+
+
+def instrument(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering, unlike BaseHTTPMiddleware)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        record = RequestMetrics("unmatched")
+        token = current.set(record)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current.reset(token)
+            route = scope.get("route")
+            # The route template, never the raw path: ids in paths would make one series per conversation.
+            route = route.path if route is not None else record.route
+            tenant = tenant_label(record.tenant)
+            method = scope["method"]
+            http_requests.inc((method, route, str(status[0]), tenant))
+            http_latency.observe((method, route, tenant), elapsed)
+            if record.statements:
+                db_statements.inc((route, tenant), record.statements)
+                db_time.inc((route, tenant), record.sql_seconds)
+
+
+def render() -> str:
+    _collect_stats()
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,123 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
+import threading
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_contexts: dict[int, CryptContext] = {}
+
+
+def context(rounds: int) -> CryptContext:
+    # min == max == default: a hash with any other cost is reported as needing an update on login.
+    ctx = _contexts.get(rounds)
+    if ctx is None:
+        ctx = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds
+        )
+        _contexts[rounds] = ctx
+    return ctx
+
+
+def _truncate(password: str) -> str:
+    # bcrypt only looks at the first 72 bytes.
+    return password.encode("utf-8")[:72].decode("utf-8", errors="ignore")
+
+
+def bcrypt_hash(password: str, rounds: int) -> str:
+    return context(rounds).hash(_truncate(password))
+
+
+def _warm(rounds: int) -> None:
+    context(rounds)
+
+
+def bcrypt_verify(password: str, hashed: str, rounds: int) -> tuple[bool, str | None]:
+    """(valid, new hash if the stored one used another cost)."""
+    return context(rounds).verify_and_update(_truncate(password), hashed)
+
+
+class PasswordHasher:
+    """Runs bcrypt in its own process pool so a login storm can't starve the request threadpool.
+
+    At most ``max_pending`` hashes may be running or queued; beyond that callers get a 429 right away.
+    If a worker dies (OOM killer, crash) the pool is broken for good, so it is replaced and the call
+    retried once.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, rounds: int = 12):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: forking a process that already runs threads and an event loop is unsafe.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _discard(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Concurrent callers all see the same broken pool; only the first replaces it.
+            if self._executor is not broken:
+                return
+            self._executor = None
+            self.restarts += 1
+        logger.warning("password hashing pool broke, starting a new one")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(status_code=429, detail="Too many authentication requests, try again shortly", headers={"Retry-After": "1"})
+            self.pending += 1
+        try:
+            pool = self._pool()
+            try:
+                return await asyncio.wrap_future(pool.submit(fn, *args))
+            except BrokenProcessPool:
+                self._discard(pool)
+                return await asyncio.wrap_future(self._pool().submit(fn, *args))
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(bcrypt_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        return await self._run(bcrypt_verify, password, hashed, self.rounds)
+
+    def start(self) -> None:
+        # Spawning takes a moment; do it at startup rather than on the first login.
+        pool = self._pool()
+        for _ in range(self.workers):
+            pool.submit(_warm, self.rounds)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, int]:
+        return {"workers": self.workers, "pending": self.pending, "max_pending": self.max_pending, "completed": self.completed, "rejected": self.rejected, "restarts": self.restarts}
+
+
+hasher = PasswordHasher(workers=settings.password_hash_workers, max_pending=settings.password_hash_max_pending, rounds=settings.bcrypt_rounds)
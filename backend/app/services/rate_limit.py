@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Takes one token, waiting for it if the bucket is empty; returns the time spent waiting."""
+        async with self._lock:
+            self._refill()
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait:
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+            return wait
+
+    def resize(self, rate: float, capacity: float | None = None) -> None:
+        self._refill()
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = min(self.tokens, self.capacity)
+
+    def pause(self, seconds: float) -> None:
+        # The platform said "slow down": nobody sends on this account for ``seconds``.
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
@@ -0,0 +1,93 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from typing import Any
+
+from app.config import settings
+from app.services.cache import TTLCache
+
+
+def normalize(text: str) -> str:
+    """Ignores accents, case, punctuation and extra spaces, so "Horário?" and "horario" share an entry."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+class ReplyCache:
+    """Per-tenant LRU/TTL caches of AI replies to short opening questions.
+
+    Entries are keyed by a version of the prompt config (model, temperature, system prompt) and the
+    normalized question, so a config change never serves replies produced under the old prompt.
+    """
+
+    def __init__(self, per_tenant: int = 200, tenants: int = 1000, ttl: float = 3600.0, max_chars: int = 200):
+        self.per_tenant = per_tenant
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self._tenants = TTLCache(maxsize=tenants, ttl=float("inf"))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, request: dict[str, Any], prompt: str) -> tuple[str, str] | None:
+        """Keys on the tenant's own ``prompt`` and the customer question, for first-turn requests only.
+
+        A reply to "sim" or "quanto custa?" depends on the earlier turns and the conversation summary, so
+        a request carrying either is never cached or served from the cache.
+        """
+        messages = request["messages"]
+        if len(messages) != 2 or messages[0]["content"] != prompt or messages[-1]["role"] != "user":
+            return None
+        question = normalize(messages[-1]["content"])
+        if not question or len(question) > self.max_chars:
+            return None
+        version = hashlib.sha256(f"{request['model']}|{request['temperature']}|{prompt}".encode()).hexdigest()[:16]
+        return version, question
+
+    def _tenant(self, client_id: int, create: bool = False) -> TTLCache | None:
+        with self._lock:
+            cache = self._tenants.get(client_id)
+            if cache is None and create:
+                cache = TTLCache(maxsize=self.per_tenant, ttl=self.ttl)
+                self._tenants.set(client_id, cache)
+            return cache
+
+    def get(self, client_id: int, key: tuple[str, str]) -> str | None:
+        cache = self._tenant(client_id)
+        reply = cache.get(key) if cache else None
+        with self._lock:
+            if reply is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return reply
+
+    def set(self, client_id: int, key: tuple[str, str], reply: str) -> None:
+        self._tenant(client_id, create=True).set(key, reply)
+
+    def invalidate_tenant(self, client_id: int) -> None:
+        self._tenants.pop(client_id)
+
+    def stats(self) -> dict[str, int | float]:
+        total = self.hits + self.misses
+        return {
+            "tenants": len(self._tenants),
+            "entries": sum(len(cache) for cache in self._tenants.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def tenant_stats(self, client_id: int) -> dict[str, int | float] | None:
+        cache = self._tenant(client_id)
+        return cache.stats() if cache else None
+
+
+replies = ReplyCache(
+    per_tenant=settings.ai_reply_cache_per_tenant,
+    tenants=settings.ai_reply_cache_tenants,
+    ttl=settings.ai_reply_cache_ttl_seconds,
+    max_chars=settings.ai_reply_cache_max_chars,
+)
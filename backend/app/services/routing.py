@@ -0,0 +1,189 @@
+from dataclasses import dataclass
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ChannelRoute, Integration
+from app.security import decrypt_secret, fingerprint_secret
+from app.services.cache import TTLCache
+
+
+class RouteConflict(Exception):
+    """The external account is already routed to another integration."""
+
+
+@dataclass(frozen=True)
+class TelegramRoute:
+    integration_id: int
+    client_id: int
+    secret: str | None
+
+
+telegram_routes = TTLCache(maxsize=settings.routing_cache_size, ttl=settings.routing_cache_ttl_seconds)
+
+
+def resolve_telegram(db: Session, token: str | None) -> TelegramRoute | None:
+    if not token:
+        return None
+
+    fingerprint = fingerprint_secret(token)
+    route = telegram_routes.get(fingerprint)
+    if route:
+        return route
+
+    row = (
+        db.query(Integration)
+        .filter(
+            Integration.token_fingerprint == fingerprint,
+            Integration.platform == "telegram",
+            Integration.status == "connected",
+        )
+        .first()
+    )
+    if not row:
+        return None
+
+    route = TelegramRoute(integration_id=row.id, client_id=row.client_id, secret=row.config.get("secret"))
+    telegram_routes.set(fingerprint, route)
+    return route
+
+
+def claim_telegram(db: Session, integration: Integration, token: str) -> str | None:
+    """Routes the bot ``token`` to ``integration``; returns the fingerprint it replaces, to invalidate after commit.
+
+    Raises RouteConflict when another integration already receives that bot's updates.
+    """
+    fingerprint = fingerprint_secret(token)
+    owner = db.scalar(select(Integration.id).where(Integration.token_fingerprint == fingerprint))
+    if owner is not None and owner != integration.id:
+        raise RouteConflict("telegram bot is already connected")
+    previous = integration.token_fingerprint
+    integration.token_fingerprint = fingerprint
+    return previous
+
+
+def invalidate_telegram(fingerprint: str | None = None, integration_id: int | None = None) -> None:
+    if fingerprint:
+        telegram_routes.pop(fingerprint)
+    if integration_id is not None:
+        telegram_routes.pop_where(lambda _, route: route.integration_id == integration_id)
+
+
+@dataclass(frozen=True)
+class MetaRoute:
+    integration_id: int
+    client_id: int
+
+
+# Config key holding the account id that Meta webhooks carry, per platform.
+META_ACCOUNT_KEYS = {"whatsapp": "phone_number_id", "instagram": "page_id"}
+
+meta_routes = TTLCache(maxsize=settings.routing_cache_size, ttl=settings.routing_cache_ttl_seconds)
+
+
+def resolve_meta(db: Session, platform: str, external_id: str) -> MetaRoute | None:
+    key = (platform, external_id)
+    route = meta_routes.get(key)
+    if route:
+        return route
+
+    row = db.execute(
+        select(ChannelRoute.integration_id, ChannelRoute.client_id).where(ChannelRoute.platform == platform, ChannelRoute.external_id == external_id)
+    ).first()
+    if not row:
+        return None
+
+    route = MetaRoute(integration_id=row.integration_id, client_id=row.client_id)
+    meta_routes.set(key, route)
+    return route
+
+
+def whatsapp_verify_token_known(db: Session, verify_token: str) -> bool:
+    if not verify_token:
+        return False
+    found = db.scalar(
+        select(ChannelRoute.id).where(ChannelRoute.platform == "whatsapp", ChannelRoute.verify_token_hash == fingerprint_secret(verify_token)).limit(1)
+    )
+    return found is not None
+
+
+def sync_routes(db: Session, integration: Integration) -> None:
+    """Points the routing table at the integration's current account, or removes its route once disconnected.
+
+    Raises RouteConflict when another integration already receives that account's webhooks.
+    """
+    account_key = META_ACCOUNT_KEYS.get(integration.platform)
+    if not account_key:
+        return
+    config = integration.config or {}
+    external_id = str(config.get(account_key) or "") if integration.status == "connected" else ""
+    if external_id:
+        owner = db.scalar(select(ChannelRoute.integration_id).where(ChannelRoute.platform == integration.platform, ChannelRoute.external_id == external_id))
+        if owner is not None and owner != integration.id:
+            raise RouteConflict(f"{integration.platform} account {external_id} is already connected")
+
+    db.execute(delete(ChannelRoute).where(ChannelRoute.integration_id == integration.id))
+    if external_id:
+        verify_token = config.get("verify_token")
+        db.add(
+            ChannelRoute(
+                platform=integration.platform,
+                external_id=external_id,
+                integration_id=integration.id,
+                client_id=integration.client_id,
+                verify_token_hash=fingerprint_secret(verify_token) if verify_token else None,
+            )
+        )
+
+
+def invalidate_meta(integration_id: int) -> None:
+    meta_routes.pop_where(lambda _, route: route.integration_id == integration_id)
+
+
+def preload(db: Session, limit: int) -> int:
+    """Fills the Telegram and Meta route caches for up to ``limit`` accounts each, for warm-up."""
+    limit = min(limit, settings.routing_cache_size)
+    telegram = db.execute(
+        select(Integration.id, Integration.client_id, Integration.token_fingerprint, Integration.config)
+        .where(Integration.platform == "telegram", Integration.status == "connected", Integration.token_fingerprint.is_not(None))
+        .limit(limit)
+    ).all()
+    for integration_id, client_id, fingerprint, config in telegram:
+        telegram_routes.set(fingerprint, TelegramRoute(integration_id=integration_id, client_id=client_id, secret=(config or {}).get("secret")))
+
+    meta = db.execute(select(ChannelRoute.platform, ChannelRoute.external_id, ChannelRoute.integration_id, ChannelRoute.client_id).limit(limit)).all()
+    for platform, external_id, integration_id, client_id in meta:
+        meta_routes.set((platform, external_id), MetaRoute(integration_id=integration_id, client_id=client_id))
+    return len(telegram) + len(meta)
+
+
+def backfill_telegram_fingerprints(db: Session, batch_size: int = 500) -> int:
+    """Fingerprints connected Telegram integrations that have none; a bot another integration already routes is skipped."""
+    updated = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(Integration)
+            .filter(
+                Integration.platform == "telegram",
+                Integration.status == "connected",
+                Integration.token_fingerprint.is_(None),
+                Integration.id > last_id,
+            )
+            .order_by(Integration.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        for row in rows:
+            last_id = row.id
+            try:
+                claim_telegram(db, row, decrypt_secret(row.config.get("token", "")))
+            except Exception:
+                continue
+            updated += 1
+        db.commit()
+    telegram_routes.clear()
+    return updated
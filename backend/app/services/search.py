@@ -0,0 +1,123 @@
+"""Ranked full-text search over a tenant's messages.
+
+SQLite uses the ``messages_fts`` FTS5 table and Postgres a GIN index on ``to_tsvector('simple', content)``;
+both are kept in step with ``messages`` by the database itself (see migration 0010), so every writer is
+covered. Other databases get no index and fall back to a substring scan, newest first. User input is
+reduced to word terms, all required, the last one as a prefix.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+import html
+import re
+
+from sqlalchemy import Float, and_, cast, column, func, literal, literal_column, or_, select, table
+from sqlalchemy.orm import Session
+
+from app.models import Conversation, Message
+
+MAX_TERMS = 8
+# Private-use characters mark the matches, so the snippet can be HTML-escaped before they become <mark> tags.
+_START, _STOP = "\ue000", "\ue001"
+_TERM = re.compile(r"\w+")
+
+fts_table = table("messages_fts", column("rowid"))
+# FTS5's MATCH, bm25() and snippet() take the table itself as their column argument.
+fts = literal_column("messages_fts")
+pg_config = literal_column("'simple'::regconfig")
+
+
+@dataclass(frozen=True)
+class Hit:
+    message_id: int
+    conversation_id: int
+    channel: str
+    external_user_id: str
+    sender: str
+    created_at: datetime
+    score: float
+    snippet: str
+
+
+def terms(query: str) -> list[str]:
+    return _TERM.findall(query.lower())[:MAX_TERMS]
+
+
+def _sqlite_query(words: list[str]):
+    match = " ".join(f'"{word}"' for word in words) + "*"
+    # bm25 is lower-is-better; negated so all backends sort by score descending.
+    score = -func.bm25(fts)
+    snippet = func.snippet(fts, 0, _START, _STOP, "…", 16)
+    query = select(Message, score.label("score"), snippet.label("snippet")).join(fts_table, fts_table.c.rowid == Message.id).where(fts.op("MATCH")(match))
+    return query, score, str
+
+
+def _postgres_query(words: list[str]):
+    tsquery = func.to_tsquery(pg_config, " & ".join(words) + ":*")
+    # Same expression as the index, or the planner can't use it.
+    vector = func.to_tsvector(pg_config, Message.content)
+    score = cast(func.ts_rank_cd(vector, tsquery), Float)
+    snippet = func.ts_headline(pg_config, Message.content, tsquery, f'StartSel="{_START}", StopSel="{_STOP}", MaxWords=24, MinWords=8, MaxFragments=2')
+    return select(Message, score.label("score"), snippet.label("snippet")).where(vector.op("@@")(tsquery)), score, str
+
+
+def _mark(content: str, words: list[str], width: int = 120) -> str:
+    """Marks the matched words in ``content`` and crops it around the first one, like the indexed snippets."""
+    pattern = re.compile("|".join(re.escape(word) for word in sorted(words, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(content)
+    start = max(0, first.start() - width // 3) if first else 0
+    excerpt = content[start : start + width]
+    excerpt = ("…" if start else "") + excerpt + ("…" if start + width < len(content) else "")
+    return pattern.sub(lambda m: f"{_START}{m.group(0)}{_STOP}", excerpt)
+
+
+def _fallback_query(words: list[str]):
+    # No full-text index here: the tenant's messages are scanned, and the snippet is marked in Python.
+    score = literal(0.0, Float)
+    matches = [func.lower(Message.content).contains(word, autoescape=True) for word in words]
+    return select(Message, score.label("score"), Message.content.label("snippet")).where(*matches), score, lambda content: _mark(content, words)
+
+
+# Each builder returns the query, its score expression and the function that finishes the snippet.
+QUERIES = {"sqlite": _sqlite_query, "postgresql": _postgres_query}
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def search_messages(
+    db: Session,
+    client_id: int,
+    words: list[str],
+    limit: int,
+    after: tuple[float, int] | None = None,
+    channel: str | None = None,
+    conversation_id: int | None = None,
+) -> list[Hit]:
+    """Best matches first; ``after`` is the (score, message id) of the last hit of the previous page."""
+    query, score, marked = QUERIES.get(db.get_bind().dialect.name, _fallback_query)(words)
+    query = query.add_columns(Conversation.channel, Conversation.external_user_id).join(
+        Conversation, Conversation.id == Message.conversation_id
+    ).where(Conversation.client_id == client_id)
+    if channel:
+        query = query.where(Conversation.channel == channel)
+    if conversation_id:
+        query = query.where(Message.conversation_id == conversation_id)
+    if after:
+        last_score, last_id = after
+        query = query.where(or_(score < last_score, and_(score == last_score, Message.id < last_id)))
+
+    rows = db.execute(query.order_by(score.desc(), Message.id.desc()).limit(limit)).all()
+    return [
+        Hit(
+            message_id=message.id,
+            conversation_id=message.conversation_id,
+            channel=channel_name,
+            external_user_id=external_user_id,
+            sender=message.sender,
+            created_at=message.created_at,
+            score=row_score,
+            snippet=_highlight(marked(row_snippet or "")),
+        )
+        for message, row_score, row_snippet, channel_name, external_user_id in rows
+    ]
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import secrets
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import SessionLocal, run_db
+from app.models import PasswordResetToken, RefreshToken
+
+logger = logging.getLogger(__name__)
+
+
+def token_hash(token: str) -> str:
+    # Refresh tokens carry 256 random bits, so a plain digest is enough to make the stored key useless if leaked.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue(db: Session, user_id: int, family_id: str | None = None) -> str:
+    """Adds a refresh token for ``user_id`` and returns the raw value; only its hash is stored."""
+    token = secrets.token_urlsafe(32)
+    db.add(
+        RefreshToken(
+            user_id=user_id,
+            token_hash=token_hash(token),
+            family_id=family_id or secrets.token_hex(16),
+            expires_at=datetime.utcnow() + timedelta(minutes=settings.refresh_token_minutes),
+        )
+    )
+    return token
+
+
+def revoke_family(db: Session, family_id: str) -> None:
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked.is_(False))
+        .values(revoked=True, revoked_at=datetime.utcnow())
+    )
+
+
+def rotate(db: Session, token: str) -> tuple[int, str] | None:
+    """Swaps a live refresh token for a new one of the same family; returns (user_id, new token).
+
+    Presenting a token that was already rotated means it leaked (or was replayed), so the whole
+    family is revoked and every session that descends from that login has to sign in again. A
+    reuse within ``refresh_token_reuse_grace_seconds`` is just two tabs refreshing at once and is
+    only refused.
+    """
+    row = db.scalar(select(RefreshToken).where(RefreshToken.token_hash == token_hash(token)))
+    now = datetime.utcnow()
+    if not row or row.expires_at < now:
+        return None
+    if row.revoked:
+        if row.revoked_at is None or row.revoked_at < now - timedelta(seconds=settings.refresh_token_reuse_grace_seconds):
+            revoke_family(db, row.family_id)
+            db.commit()
+            logger.warning("refresh token reuse for user %s, family %s revoked", row.user_id, row.family_id)
+        return None
+
+    claimed = db.execute(
+        update(RefreshToken).where(RefreshToken.id == row.id, RefreshToken.revoked.is_(False)).values(revoked=True, revoked_at=now)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        return None
+    return row.user_id, issue(db, row.user_id, row.family_id)
+
+
+def revoke(db: Session, token: str) -> None:
+    family_id = db.scalar(select(RefreshToken.family_id).where(RefreshToken.token_hash == token_hash(token)))
+    if family_id:
+        revoke_family(db, family_id)
+
+
+def _delete_batches(db: Session, model, condition, batch_size: int) -> int:
+    deleted = 0
+    while True:
+        ids = db.scalars(select(model.id).where(condition).limit(batch_size)).all()
+        if not ids:
+            return deleted
+        db.execute(delete(model).where(model.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+
+
+def purge(db: Session, batch_size: int = 1000) -> dict[str, int]:
+    """Deletes expired refresh tokens, revoked ones past the reuse-detection window and spent reset tokens.
+
+    Works in batches of ``batch_size`` rows, one short transaction each, so it never holds long locks.
+    """
+    now = datetime.utcnow()
+    revoked_before = now - timedelta(minutes=settings.refresh_token_revoked_retention_minutes)
+    refresh = _delete_batches(db, RefreshToken, or_(RefreshToken.expires_at < now, RefreshToken.revoked_at < revoked_before), batch_size)
+    reset = _delete_batches(db, PasswordResetToken, or_(PasswordResetToken.used.is_(True), PasswordResetToken.expires_at < now), batch_size)
+    return {"refresh_tokens": refresh, "password_reset_tokens": reset}
+
+
+def _purge_once() -> dict[str, int]:
+    db = SessionLocal()
+    try:
+        return purge(db, settings.token_purge_batch_size)
+    finally:
+        db.close()
+
+
+async def _purge_periodically(interval: float) -> None:
+    while True:
+        try:
+            deleted = await run_db(_purge_once)
+            if any(deleted.values()):
+                logger.info("purged tokens: %s", deleted)
+        except Exception:
+            logger.exception("token purge failed")
+        await asyncio.sleep(interval)
+
+
+_task: asyncio.Task | None = None
+
+
+def start_purge(interval: float) -> None:
+    global _task
+    if interval > 0 and _task is None:
+        _task = asyncio.create_task(_purge_periodically(interval))
+
+
+async def stop_purge() -> None:
+    global _task
+    if _task:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import AIConfig, Client, Plan
+from app.security import decrypt_secret
+from app.services.cache import TTLCache
+
+
+@dataclass(frozen=True)
+class TenantContext:
+    client_id: int
+    base_prompt: str
+    temperature: float
+    language: str
+    api_key: str | None
+    plan_name: str
+    max_ai_messages: int
+    ai_requests_per_minute: int | None = None
+    ai_burst: int | None = None
+    ai_weight: int = 1
+
+
+contexts = TTLCache(maxsize=settings.tenant_cache_size, ttl=settings.tenant_cache_ttl_seconds)
+
+
+def load_tenant_context(db: Session, client_id: int) -> TenantContext | None:
+    row = (
+        db.query(AIConfig, Plan)
+        .join(Client, Client.id == AIConfig.client_id)
+        .join(Plan, Plan.id == Client.plan_id)
+        .filter(AIConfig.client_id == client_id)
+        .first()
+    )
+    if not row:
+        return None
+
+    config, plan = row
+    return _context(config, plan)
+
+
+def _context(config: AIConfig, plan: Plan) -> TenantContext:
+    return TenantContext(
+        client_id=config.client_id,
+        base_prompt=config.base_prompt,
+        temperature=float(config.temperature),
+        language=config.language,
+        api_key=decrypt_secret(config.api_key_encrypted) if config.api_key_encrypted else settings.openai_api_key,
+        plan_name=plan.name,
+        max_ai_messages=plan.max_ai_messages,
+        ai_requests_per_minute=plan.ai_requests_per_minute,
+        ai_burst=plan.ai_burst,
+        ai_weight=plan.ai_weight or 1,
+    )
+
+
+def get_tenant_context(db: Session, client_id: int) -> TenantContext | None:
+    ctx = contexts.get(client_id)
+    if ctx is None:
+        ctx = load_tenant_context(db, client_id)
+        if ctx is not None:
+            contexts.set(client_id, ctx)
+    return ctx
+
+
+def preload(db: Session, limit: int) -> list[TenantContext]:
+    """Fills the cache for up to ``limit`` tenants in one query, for warm-up."""
+    rows = (
+        db.query(AIConfig, Plan)
+        .join(Client, Client.id == AIConfig.client_id)
+        .join(Plan, Plan.id == Client.plan_id)
+        .order_by(AIConfig.client_id)
+        .limit(min(limit, settings.tenant_cache_size))
+    )
+    loaded = [_context(config, plan) for config, plan in rows]
+    for ctx in loaded:
+        contexts.set(ctx.client_id, ctx)
+    return loaded
+
+
+def invalidate_tenant(client_id: int) -> None:
+    contexts.pop(client_id)
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import datetime
+import threading
+import time
+
+from sqlalchemy import and_, event as orm_event, func, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import dialect_insert, on_commit
+from app.models import AIUsageCounter, Conversation, Message
+
+
+def current_period(now: datetime | None = None) -> str:
+    return (now or datetime.utcnow()).strftime("%Y-%m")
+
+
+def increment_ai_usage(db: Session, client_id: int, amount: int = 1, period: str | None = None) -> None:
+    period = period or current_period()
+    insert = dialect_insert(db.get_bind())
+    if insert is not None:
+        stmt = insert(AIUsageCounter).values(client_id=client_id, period=period, ai_messages=amount)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AIUsageCounter.client_id, AIUsageCounter.period],
+            set_={"ai_messages": AIUsageCounter.ai_messages + stmt.excluded.ai_messages},
+        )
+        db.execute(stmt)
+        return
+
+    bumped = db.execute(
+        update(AIUsageCounter)
+        .where(AIUsageCounter.client_id == client_id, AIUsageCounter.period == period)
+        .values(ai_messages=AIUsageCounter.ai_messages + amount)
+    )
+    if not bumped.rowcount:
+        db.add(AIUsageCounter(client_id=client_id, period=period, ai_messages=amount))
+        db.flush()
+
+
+class UsageBatcher:
+    """Buffers usage increments in memory and writes them once ``batch_size`` or ``interval`` is reached.
+
+    Increments only join the buffer once the transaction that stored the message commits, and a batch
+    written into a transaction that rolls back goes back into the buffer, so neither side is lost.
+    """
+
+    def __init__(self, batch_size: int, interval: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending: dict[tuple[int, str], int] = defaultdict(int)
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, client_id: int, period: str, amount: int = 1) -> bool:
+        with self._lock:
+            self._pending[(client_id, period)] += amount
+            self._count += amount
+            return self._due()
+
+    def _due(self) -> bool:
+        return self._count >= self.batch_size or (self._count > 0 and time.monotonic() - self._last_flush >= self.interval)
+
+    def due(self) -> bool:
+        with self._lock:
+            return self._due()
+
+    def pending(self, client_id: int, period: str) -> int:
+        with self._lock:
+            return self._pending.get((client_id, period), 0)
+
+    def drain(self) -> dict[tuple[int, str], int]:
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._count = 0
+            self._last_flush = time.monotonic()
+        return pending
+
+    def flush(self, db: Session) -> None:
+        """Writes the buffer in ``db``'s transaction; if that transaction rolls back, it is put back."""
+        drained = on_commit(db, "drained_usage")
+        for (client_id, period), amount in self.drain().items():
+            increment_ai_usage(db, client_id, amount, period)
+            drained.append((client_id, period, amount))
+
+
+batcher = UsageBatcher(settings.ai_usage_batch_size, settings.ai_usage_flush_seconds)
+
+
+@orm_event.listens_for(Session, "after_commit")
+def _count_committed(session: Session) -> None:
+    session.info.pop("drained_usage", None)
+    for client_id, period, amount in session.info.pop("pending_usage", ()):
+        batcher.add(client_id, period, amount)
+
+
+@orm_event.listens_for(Session, "after_soft_rollback")
+def _requeue_drained(session: Session, previous_transaction) -> None:
+    if previous_transaction.nested:
+        return
+    # The messages of pending increments were rolled back too; the drained batch belongs to earlier commits.
+    session.info.pop("pending_usage", None)
+    for client_id, period, amount in session.info.pop("drained_usage", ()):
+        batcher.add(client_id, period, amount)
+
+
+def record_ai_message(db: Session, client_id: int) -> None:
+    """Counts a persisted AI message; it is counted only if the caller's transaction commits."""
+    if settings.ai_usage_batch_size <= 1:
+        increment_ai_usage(db, client_id)
+        return
+    on_commit(db, "pending_usage").append((client_id, current_period(), 1))
+    if batcher.due():
+        batcher.flush(db)
+
+
+def get_ai_usage(db: Session, client_id: int, period: str | None = None) -> int:
+    period = period or current_period()
+    stored = (
+        db.query(AIUsageCounter.ai_messages)
+        .filter(AIUsageCounter.client_id == client_id, AIUsageCounter.period == period)
+        .scalar()
+    )
+    return (stored or 0) + batcher.pending(client_id, period)
+
+
+def backfill_ai_usage(db: Session, period: str | None = None) -> int:
+    """Rebuilds the counters of ``period`` from the messages table; used once when enabling counters."""
+    period = period or current_period()
+    start = datetime.strptime(period, "%Y-%m")
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    rows = (
+        db.query(Conversation.client_id, func.count(Message.id))
+        .join(Message, Message.conversation_id == Conversation.id)
+        .filter(and_(Message.sender == "ai", Message.created_at >= start, Message.created_at < end))
+        .group_by(Conversation.client_id)
+        .all()
+    )
+    for client_id, count in rows:
+        counter = (
+            db.query(AIUsageCounter)
+            .filter(AIUsageCounter.client_id == client_id, AIUsageCounter.period == period)
+            .first()
+        )
+        if counter:
+            counter.ai_messages = count
+        else:
+            db.add(AIUsageCounter(client_id=client_id, period=period, ai_messages=count))
+    db.commit()
+    return len(rows)
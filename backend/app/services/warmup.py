@@ -0,0 +1,138 @@
+"""Warm-up run at startup, so the first requests a worker takes don't pay for cold connections and empty caches.
+
+``/api/ready`` reports ready only once ``run`` has finished; ``/api/health`` stays a plain liveness check.
+"""
+import asyncio
+from contextlib import AsyncExitStack
+import logging
+import time
+from typing import Any
+
+from sqlalchemy.orm import configure_mappers
+
+from app.config import settings
+from app.db import SessionLocal, async_engine, engine, run_db
+from app.services import ai_provider, delivery, routing, tenant_context
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 5.0
+
+STEPS = ("db_pool", "async_db_pool", "mappers", "caches", "clients")
+
+
+class State:
+    def __init__(self):
+        self.ready = False
+        self.checks: dict[str, str] = dict.fromkeys(STEPS, "pending")
+        self.steps: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.attempts = 0
+        self.seconds: float | None = None
+
+    def report(self) -> dict[str, Any]:
+        # Public endpoint: step names and outcomes only. Timings, counts and errors go to the log.
+        return {"status": "ready" if self.ready else "warming", "checks": self.checks}
+
+
+state = State()
+
+
+def _pool_size(pool) -> int:
+    # QueuePool has a size; SQLite in-memory and NullPool don't keep connections around.
+    size = getattr(pool, "size", None)
+    return size() if callable(size) else 1
+
+
+def _warm_sync_pool() -> int:
+    connections = [engine.connect() for _ in range(_pool_size(engine.pool))]
+    try:
+        for connection in connections:
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+async def _warm_async_pool() -> int:
+    async with AsyncExitStack() as stack:
+        connections = [await stack.enter_async_context(async_engine.connect()) for _ in range(_pool_size(async_engine.pool))]
+        for connection in connections:
+            await connection.exec_driver_sql("SELECT 1")
+    return len(connections)
+
+
+def _preload() -> tuple[int, int, set[str | None]]:
+    db = SessionLocal()
+    try:
+        contexts = tenant_context.preload(db, settings.warmup_tenants)
+        routes = routing.preload(db, settings.routing_cache_size)
+    finally:
+        db.close()
+    return len(contexts), routes, {ctx.api_key for ctx in contexts} | {settings.openai_api_key}
+
+
+async def run() -> None:
+    state.attempts += 1
+    state.checks = dict.fromkeys(STEPS, "pending")
+    started = time.perf_counter()
+
+    async def step(name: str, fn, *args):
+        step_started = time.perf_counter()
+        try:
+            result = await fn(*args)
+        except Exception:
+            state.checks[name] = "failed"
+            raise
+        state.steps[name] = round(time.perf_counter() - step_started, 4)
+        state.checks[name] = "ok"
+        return result
+
+    state.counts["db_connections"] = await step("db_pool", run_db, _warm_sync_pool)
+    state.counts["async_db_connections"] = await step("async_db_pool", _warm_async_pool)
+    await step("mappers", run_db, configure_mappers)
+    tenants, routes, api_keys = await step("caches", run_db, _preload)
+    state.counts["tenant_contexts"] = tenants
+    state.counts["routes"] = routes
+
+    async def clients() -> int:
+        if settings.delivery_enabled:
+            delivery.dispatcher.warm()
+        return ai_provider.get_provider().warm(api_keys)
+
+    state.counts["ai_clients"] = await step("clients", clients)
+    state.seconds = round(time.perf_counter() - started, 4)
+    state.ready = True
+
+
+async def _run_until_ready() -> None:
+    while True:
+        try:
+            await run()
+            logger.info("warm-up finished in %.2fs: steps %s, loaded %s", state.seconds, state.steps, state.counts)
+            return
+        except Exception:
+            failed = [name for name, status in state.checks.items() if status == "failed"]
+            logger.exception("warm-up failed at %s (attempt %s); retrying in %.0fs", failed, state.attempts, RETRY_SECONDS)
+        await asyncio.sleep(RETRY_SECONDS)
+
+
+_task: asyncio.Task | None = None
+
+
+def start() -> None:
+    global _task
+    if not settings.warmup_enabled:
+        state.ready = True
+    elif _task is None:
+        _task = asyncio.create_task(_run_until_ready())
+
+
+async def stop() -> None:
+    global _task
+    state.ready = False
+    if _task:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,309 @@
+"""Webhook load test: boots the API against a scratch database and replays synthetic platform traffic.
+
+    python -m bench.webhooks --tenants 20 --rate 50 --duration 20 --output results.json
+    python -m bench.webhooks --rate 50 --compare results.json
+
+The AI provider is the offline fake (--ai-latency-ms) and replies are delivered to app.fake_platforms
+(--platform-latency-ms), both in this process. Each route runs as its own phase at a fixed arrival
+rate (open loop: latency is measured from the scheduled send time, so a slow server can't hide its
+queueing). DB statements per request count everything the phase caused, including AI replies and
+deliveries that finish after the HTTP response.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import hashlib
+import hmac
+import json
+import os
+from pathlib import Path
+import random
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Any, Callable
+
+import httpx
+import uvicorn
+
+ROUTES = {
+    "telegram": "/api/webhook/telegram",
+    "whatsapp": "/api/webhook/whatsapp",
+    "instagram": "/api/webhook/instagram",
+}
+META_SECRET = "bench-meta-secret"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(app: Any, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def _configure(args: argparse.Namespace, platforms_url: str) -> None:
+    # Must run before anything under app/ is imported: settings are read once at import time.
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    os.environ.update(
+        DATABASE_URL=args.database_url or f"sqlite:///{scratch}/bench.db",
+        DB_AUTO_MIGRATE="true",
+        AI_PROVIDER="fake",
+        FAKE_AI_LATENCY_MS=str(args.ai_latency_ms),
+        FAKE_PLATFORM_LATENCY_MS=str(args.platform_latency_ms),
+        TELEGRAM_API_URL=platforms_url,
+        GRAPH_API_URL=platforms_url,
+        META_APP_SECRET=META_SECRET,
+        ARCHIVE_DIR=f"{scratch}/archive",
+    )
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, *args: Any) -> None:
+        with self._lock:
+            self.count += 1
+
+
+class Tenant:
+    def __init__(self, index: int):
+        self.index = index
+        self.telegram_token = f"{900000 + index}:bench-token"
+        self.telegram_secret = f"bench-secret-{index}"
+        self.phone_number_id = f"bench-phone-{index}"
+        self.page_id = f"bench-page-{index}"
+
+
+async def _setup_tenants(client: httpx.AsyncClient, count: int) -> list[Tenant]:
+    tenants = []
+    for index in range(count):
+        tenant = Tenant(index)
+        email = f"bench{index}@example.com"
+        (await client.post("/api/register", json={"name": f"Bench {index}", "email": email, "password": "bench-password", "company_name": f"Bench {index}"})).raise_for_status()
+        login = (await client.post("/api/login", json={"email": email, "password": "bench-password"})).raise_for_status().json()
+        headers = {"Authorization": f"Bearer {login['access_token']}"}
+        # Highest AI quota, so the run measures the pipeline rather than plan limits.
+        for path, body in (
+            ("/api/billing/plan/enterprise", None),
+            ("/api/integrations/telegram", {"token": tenant.telegram_token, "secret_token": tenant.telegram_secret}),
+            ("/api/integrations/whatsapp", {"phone_number_id": tenant.phone_number_id, "access_token": f"wa-{index}"}),
+            ("/api/integrations/instagram", {"page_id": tenant.page_id, "access_token": f"ig-{index}"}),
+        ):
+            (await client.post(path, json=body, headers=headers)).raise_for_status()
+        tenants.append(tenant)
+    return tenants
+
+
+def _signed(payload: dict) -> tuple[bytes, dict[str, str]]:
+    body = json.dumps(payload).encode()
+    signature = "sha256=" + hmac.new(META_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return body, {"Content-Type": "application/json", "X-Hub-Signature-256": signature}
+
+
+def _telegram(tenant: Tenant, n: int, user: str, text: str) -> tuple[bytes, dict[str, str]]:
+    payload = {"update_id": n, "token": tenant.telegram_token, "message": {"text": text, "from": {"id": user}}}
+    return json.dumps(payload).encode(), {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": tenant.telegram_secret}
+
+
+def _whatsapp(tenant: Tenant, n: int, user: str, text: str) -> tuple[bytes, dict[str, str]]:
+    value = {"metadata": {"phone_number_id": tenant.phone_number_id}, "messages": [{"id": f"wamid.bench.{n}", "from": user, "text": {"body": text}}]}
+    return _signed({"object": "whatsapp_business_account", "entry": [{"changes": [{"field": "messages", "value": value}]}]})
+
+
+def _instagram(tenant: Tenant, n: int, user: str, text: str) -> tuple[bytes, dict[str, str]]:
+    messaging = {"sender": {"id": user}, "message": {"mid": f"mid.bench.{n}", "text": text}}
+    return _signed({"object": "instagram", "entry": [{"id": tenant.page_id, "messaging": [messaging]}]})
+
+
+BUILDERS: dict[str, Callable[[Tenant, int, str, str], tuple[bytes, dict[str, str]]]] = {
+    "telegram": _telegram,
+    "whatsapp": _whatsapp,
+    "instagram": _instagram,
+}
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+async def _drain(sent: list, expected: int, timeout: float) -> float:
+    """Waits until every reply reached the fake platform (or deliveries stop arriving); returns the wait."""
+    start = time.perf_counter()
+    last, idle_since = len(sent), start
+    while len(sent) < expected and time.perf_counter() - start < timeout:
+        await asyncio.sleep(0.1)
+        if len(sent) != last:
+            last, idle_since = len(sent), time.perf_counter()
+        elif time.perf_counter() - idle_since > 5:
+            break
+    return time.perf_counter() - start
+
+
+async def _run_phase(client: httpx.AsyncClient, platform: str, tenants: list[Tenant], args: argparse.Namespace, counter: StatementCounter, sent: list) -> dict[str, Any]:
+    build = BUILDERS[platform]
+    total = int(args.rate * args.duration)
+    interval = 1 / args.rate
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    sequence = random.Random(args.seed)
+
+    async def one(n: int, scheduled: float) -> None:
+        tenant = tenants[n % len(tenants)]
+        user = f"{platform}-user-{sequence.randrange(args.users_per_tenant)}"
+        body, headers = build(tenant, n, user, f"Pergunta {n}: qual o horário de atendimento?")
+        try:
+            response = await client.post(ROUTES[platform], content=body, headers=headers)
+            status = str(response.status_code)
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+        latencies.append(time.perf_counter() - scheduled)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    sent.clear()
+    statements_before = counter.count
+    start = time.perf_counter()
+    tasks = []
+    for n in range(total):
+        scheduled = start + n * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(n, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    ok = statuses.get("200", 0)
+    drain = await _drain(sent, ok, args.drain_timeout)
+    statements = counter.count - statements_before
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "status": statuses,
+        "throughput_rps": round(total / elapsed, 2),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        "db_statements_per_request": round(statements / total, 2) if total else 0.0,
+        "replies_delivered": len(sent),
+        "drain_seconds": round(drain, 2),
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_report(results: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    print(f"{'route':32} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'stmts/req':>10} {'delivered':>10}")
+    for route, r in results["routes"].items():
+        line = (
+            f"{route:32} {r['throughput_rps']:>8} {r['latency_ms']['p50']:>9} {r['latency_ms']['p95']:>9} {r['latency_ms']['p99']:>9} "
+            f"{r['db_statements_per_request']:>10} {r['replies_delivered']:>10}"
+        )
+        print(line)
+        previous = (baseline or {}).get("routes", {}).get(route)
+        if previous:
+            deltas = []
+            for label, now, before in (
+                ("p95", r["latency_ms"]["p95"], previous["latency_ms"]["p95"]),
+                ("p99", r["latency_ms"]["p99"], previous["latency_ms"]["p99"]),
+                ("stmts/req", r["db_statements_per_request"], previous["db_statements_per_request"]),
+            ):
+                change = f"{(now - before) / before * 100:+.1f}%" if before else "n/a"
+                deltas.append(f"{label} {change}")
+            print(f"{'':32} vs {baseline['config'].get('git_revision') or 'baseline'}: " + ", ".join(deltas))
+        if set(r["status"]) != {"200"}:
+            print(f"{'':32} status: {r['status']}")
+
+
+async def _main(args: argparse.Namespace) -> dict[str, Any]:
+    platforms_port, app_port = _free_port(), _free_port()
+    _configure(args, f"http://127.0.0.1:{platforms_port}")
+
+    from sqlalchemy import event
+
+    from app import fake_platforms
+    from app.db import async_engine, engine
+    from app.main import app
+
+    counter = StatementCounter()
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", counter.record)
+
+    servers = [_serve(fake_platforms.app, platforms_port), _serve(app, app_port)]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=args.request_timeout) as client:
+            while (await client.get("/api/ready")).status_code != 200:
+                await asyncio.sleep(0.05)
+            tenants = await _setup_tenants(client, args.tenants)
+            routes = {}
+            for platform in args.platforms:
+                routes[f"POST {ROUTES[platform]}"] = await _run_phase(client, platform, tenants, args, counter, fake_platforms.sent)
+    finally:
+        for server in servers:
+            server.should_exit = True
+
+    return {
+        "config": {
+            "git_revision": _git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "database": "postgresql" if (args.database_url or "").startswith("postgresql") else "sqlite",
+            **{k: v for k, v in vars(args).items() if k not in ("output", "compare", "database_url")},
+        },
+        "routes": routes,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.webhooks", description=__doc__.splitlines()[0])
+    parser.add_argument("--tenants", type=int, default=10)
+    parser.add_argument("--users-per-tenant", type=int, default=50, help="distinct senders (conversations) per tenant")
+    parser.add_argument("--rate", type=float, default=20.0, help="webhook requests per second, per route")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of traffic per route")
+    parser.add_argument("--platforms", type=lambda v: v.split(","), default=list(ROUTES), help="comma-separated subset of telegram,whatsapp,instagram")
+    parser.add_argument("--ai-latency-ms", type=int, default=300)
+    parser.add_argument("--platform-latency-ms", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=200, help="max open connections to the API")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="max seconds to wait for replies after the last request")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="an empty database to use instead of a scratch SQLite file")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="a previous --output file to print deltas against")
+    args = parser.parse_args(argv)
+    unknown = set(args.platforms) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown platforms: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(_main(args))
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    _print_report(results, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""token fingerprint and usage counters
+
+Adds integrations.token_fingerprint (Telegram routing) and the ai_usage_counters table, which came
+after the create_all schema that 0001 reproduces. Databases created by create_all once either existed
+already have them, so each object is only created when missing.
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-18 00:14:41.870213
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001a'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'token_fingerprint' not in {c['name'] for c in inspector.get_columns('integrations')}:
+        op.add_column('integrations', sa.Column('token_fingerprint', sa.String(length=64), nullable=True))
+    if 'ix_integrations_token_fingerprint' not in {i['name'] for i in inspector.get_indexes('integrations')}:
+        op.create_index('ix_integrations_token_fingerprint', 'integrations', ['token_fingerprint'], unique=False)
+
+    if not inspector.has_table('ai_usage_counters'):
+        op.create_table('ai_usage_counters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(length=7), nullable=False),
+        sa.Column('ai_messages', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('client_id', 'period', name='uq_ai_usage_client_period')
+        )
+        op.create_index('ix_ai_usage_counters_client_id', 'ai_usage_counters', ['client_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ai_usage_counters_client_id', table_name='ai_usage_counters')
+    op.drop_table('ai_usage_counters')
+    op.drop_index('ix_integrations_token_fingerprint', table_name='integrations')
+    with op.batch_alter_table('integrations') as batch_op:
+        batch_op.drop_column('token_fingerprint')
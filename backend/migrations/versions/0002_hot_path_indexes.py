@@ -0,0 +1,61 @@
+"""hot path indexes
+
+Composite indexes for the webhook/dashboard lookups and a unique key on conversations so they can be
+upserted without races. Duplicate conversations left by earlier races are merged into the oldest one first.
+
+Revision ID: 0002
+Revises: 0001a
+Create Date: 2026-10-18 00:12:05.819850
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        UPDATE messages SET conversation_id = (
+            SELECT MIN(keep.id) FROM conversations keep, conversations dup
+            WHERE dup.id = messages.conversation_id
+              AND keep.client_id = dup.client_id
+              AND keep.channel = dup.channel
+              AND keep.external_user_id = dup.external_user_id
+        )
+        WHERE conversation_id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM conversations GROUP BY client_id, channel, external_user_id
+            ) AS kept
+        )
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM conversations WHERE id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM conversations GROUP BY client_id, channel, external_user_id
+            ) AS kept
+        )
+        """
+    )
+
+    op.create_index('uq_conversations_client_channel_user', 'conversations', ['client_id', 'channel', 'external_user_id'], unique=True)
+    op.create_index('ix_conversations_client_created', 'conversations', ['client_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_messages_conversation_created', 'messages', ['conversation_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_messages_sender_created', 'messages', ['sender', 'created_at'], unique=False)
+    op.create_index('ix_system_logs_client_created', 'system_logs', ['client_id', 'created_at'], unique=False)
+    op.create_index('ix_notifications_client_created', 'notifications', ['client_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notifications_client_created', table_name='notifications')
+    op.drop_index('ix_system_logs_client_created', table_name='system_logs')
+    op.drop_index('ix_messages_sender_created', table_name='messages')
+    op.drop_index('ix_messages_conversation_created', table_name='messages')
+    op.drop_index('ix_conversations_client_created', table_name='conversations')
+    op.drop_index('uq_conversations_client_channel_user', table_name='conversations')
@@ -0,0 +1,27 @@
+"""conversation summary
+
+Rolling summary of older turns per conversation, used to keep the AI prompt within a token budget.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:30:41.204117
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('conversations', sa.Column('summary_through_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('summary_through_id')
+        batch_op.drop_column('summary')
@@ -0,0 +1,33 @@
+"""message delivery status
+
+Tracks whether each outbound reply reached the customer's channel.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:58:12.640392
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('delivery_status', sa.String(length=20), nullable=True))
+    op.add_column('messages', sa.Column('delivery_attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('messages', sa.Column('delivery_error', sa.String(length=255), nullable=True))
+    op.add_column('messages', sa.Column('delivered_at', sa.DateTime(), nullable=True))
+    op.add_column('messages', sa.Column('external_id', sa.String(length=100), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('external_id')
+        batch_op.drop_column('delivered_at')
+        batch_op.drop_column('delivery_error')
+        batch_op.drop_column('delivery_attempts')
+        batch_op.drop_column('delivery_status')
@@ -0,0 +1,27 @@
+"""message dedup key
+
+Unique platform-scoped id of inbound deliveries, so webhook re-deliveries can't store a message twice.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 01:24:37.118204
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('dedup_key', sa.String(length=150), nullable=True))
+    op.create_index('uq_messages_dedup_key', 'messages', ['dedup_key'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_messages_dedup_key', table_name='messages')
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('dedup_key')
@@ -0,0 +1,75 @@
+"""hashed refresh tokens
+
+Refresh tokens are stored as a fixed-size SHA-256 key instead of the whole JWT, grouped into
+rotation families. Existing tokens are hashed in place, so sessions survive the upgrade.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 02:10:44.502318
+"""
+import hashlib
+import secrets
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+tokens = sa.table(
+    'refresh_tokens',
+    sa.column('id', sa.Integer),
+    sa.column('token', sa.String),
+    sa.column('token_hash', sa.String),
+    sa.column('family_id', sa.String),
+)
+
+
+def upgrade() -> None:
+    op.add_column('refresh_tokens', sa.Column('token_hash', sa.String(length=64), nullable=True))
+    op.add_column('refresh_tokens', sa.Column('family_id', sa.String(length=32), nullable=True))
+    op.add_column('refresh_tokens', sa.Column('revoked_at', sa.DateTime(), nullable=True))
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(tokens.c.id, tokens.c.token).where(tokens.c.id > last_id).order_by(tokens.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        for row_id, token in rows:
+            bind.execute(
+                tokens.update()
+                .where(tokens.c.id == row_id)
+                .values(token_hash=hashlib.sha256(token.encode()).hexdigest(), family_id=secrets.token_hex(16))
+            )
+        last_id = rows[-1][0]
+
+    op.drop_index('ix_refresh_tokens_token', table_name='refresh_tokens')
+    with op.batch_alter_table('refresh_tokens') as batch_op:
+        batch_op.drop_column('token')
+        batch_op.alter_column('token_hash', existing_type=sa.String(length=64), nullable=False)
+        batch_op.alter_column('family_id', existing_type=sa.String(length=32), nullable=False)
+    op.create_index('ix_refresh_tokens_token_hash', 'refresh_tokens', ['token_hash'], unique=True)
+    op.create_index('ix_refresh_tokens_family_id', 'refresh_tokens', ['family_id'], unique=False)
+    op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'], unique=False)
+    op.create_index('ix_refresh_tokens_revoked_at', 'refresh_tokens', ['revoked_at'], unique=False)
+
+
+def downgrade() -> None:
+    # The raw tokens can't be recovered from their hashes; every session has to sign in again.
+    op.execute('DELETE FROM refresh_tokens')
+    op.drop_index('ix_refresh_tokens_revoked_at', table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_expires_at', table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_family_id', table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_token_hash', table_name='refresh_tokens')
+    with op.batch_alter_table('refresh_tokens') as batch_op:
+        batch_op.drop_column('revoked_at')
+        batch_op.drop_column('family_id')
+        batch_op.drop_column('token_hash')
+        batch_op.add_column(sa.Column('token', sa.String(length=512), nullable=False))
+    op.create_index('ix_refresh_tokens_token', 'refresh_tokens', ['token'], unique=True)
@@ -0,0 +1,60 @@
+"""retention and archive
+
+Per-plan retention of messages and system logs, and the index of archived segment files.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 02:47:19.830561
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+plans = sa.table('plans', sa.column('name', sa.String), sa.column('message_retention_days', sa.Integer), sa.column('log_retention_days', sa.Integer))
+
+DEFAULT_RETENTION = {'starter': (90, 30), 'growth': (365, 90), 'enterprise': (730, 365)}
+
+
+def upgrade() -> None:
+    op.add_column('plans', sa.Column('message_retention_days', sa.Integer(), nullable=True))
+    op.add_column('plans', sa.Column('log_retention_days', sa.Integer(), nullable=True))
+    for name, (message_days, log_days) in DEFAULT_RETENTION.items():
+        op.execute(plans.update().where(plans.c.name == name).values(message_retention_days=message_days, log_retention_days=log_days))
+
+    op.create_table('archive_segments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('period', sa.String(length=7), nullable=False),
+    sa.Column('path', sa.String(length=255), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('first_id', sa.Integer(), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('path')
+    )
+    op.create_index('ix_archive_segments_client_kind_period', 'archive_segments', ['client_id', 'kind', 'period'], unique=False)
+
+    op.create_table('archived_conversations',
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('segment_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+    sa.ForeignKeyConstraint(['segment_id'], ['archive_segments.id'], ),
+    sa.PrimaryKeyConstraint('conversation_id', 'segment_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('archived_conversations')
+    op.drop_index('ix_archive_segments_client_kind_period', table_name='archive_segments')
+    op.drop_table('archive_segments')
+    with op.batch_alter_table('plans') as batch_op:
+        batch_op.drop_column('log_retention_days')
+        batch_op.drop_column('message_retention_days')
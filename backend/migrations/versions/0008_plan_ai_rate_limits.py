@@ -0,0 +1,37 @@
+"""plan ai rate limits
+
+Per-plan token bucket (requests per minute, burst) and fair-share weight for AI calls.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 03:31:06.275904
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+plans = sa.table(
+    'plans', sa.column('name', sa.String), sa.column('ai_requests_per_minute', sa.Integer), sa.column('ai_burst', sa.Integer), sa.column('ai_weight', sa.Integer)
+)
+
+DEFAULT_LIMITS = {'starter': (30, 10, 1), 'growth': (120, 30, 2), 'enterprise': (600, 100, 4)}
+
+
+def upgrade() -> None:
+    op.add_column('plans', sa.Column('ai_requests_per_minute', sa.Integer(), nullable=True))
+    op.add_column('plans', sa.Column('ai_burst', sa.Integer(), nullable=True))
+    op.add_column('plans', sa.Column('ai_weight', sa.Integer(), server_default='1', nullable=False))
+    for name, (per_minute, burst, weight) in DEFAULT_LIMITS.items():
+        op.execute(plans.update().where(plans.c.name == name).values(ai_requests_per_minute=per_minute, ai_burst=burst, ai_weight=weight))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('plans') as batch_op:
+        batch_op.drop_column('ai_weight')
+        batch_op.drop_column('ai_burst')
+        batch_op.drop_column('ai_requests_per_minute')
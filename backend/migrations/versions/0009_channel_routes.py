@@ -0,0 +1,79 @@
+"""channel routes
+
+Meta webhooks (WhatsApp phone number id, Instagram page id) are routed through an indexed table
+instead of a filter on a JSON field of integrations.config. Connected integrations are backfilled.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 04:12:37.918204
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.security import fingerprint_secret
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+ACCOUNT_KEYS = {'whatsapp': 'phone_number_id', 'instagram': 'page_id'}
+
+integrations = sa.table(
+    'integrations',
+    sa.column('id', sa.Integer),
+    sa.column('client_id', sa.Integer),
+    sa.column('platform', sa.String),
+    sa.column('status', sa.String),
+    sa.column('config', sa.JSON),
+)
+
+
+def upgrade() -> None:
+    routes = op.create_table('channel_routes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('platform', sa.String(length=20), nullable=False),
+    sa.Column('external_id', sa.String(length=200), nullable=False),
+    sa.Column('integration_id', sa.Integer(), nullable=False),
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('verify_token_hash', sa.String(length=64), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.ForeignKeyConstraint(['integration_id'], ['integrations.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_channel_routes_platform_external', 'channel_routes', ['platform', 'external_id'], unique=True)
+    op.create_index(op.f('ix_channel_routes_integration_id'), 'channel_routes', ['integration_id'], unique=False)
+    op.create_index(op.f('ix_channel_routes_verify_token_hash'), 'channel_routes', ['verify_token_hash'], unique=False)
+
+    rows = op.get_bind().execute(
+        sa.select(integrations.c.id, integrations.c.client_id, integrations.c.platform, integrations.c.config)
+        .where(integrations.c.platform.in_(list(ACCOUNT_KEYS)), integrations.c.status == 'connected')
+        .order_by(integrations.c.id)
+    ).all()
+    seen = set()
+    backfill = []
+    for integration_id, client_id, platform, config in rows:
+        config = config or {}
+        external_id = str(config.get(ACCOUNT_KEYS[platform]) or '')
+        # The old lookup took the first match, so the oldest integration keeps a shared account id.
+        if not external_id or (platform, external_id) in seen:
+            continue
+        seen.add((platform, external_id))
+        verify_token = config.get('verify_token')
+        backfill.append({
+            'platform': platform,
+            'external_id': external_id,
+            'integration_id': integration_id,
+            'client_id': client_id,
+            'verify_token_hash': fingerprint_secret(verify_token) if verify_token else None,
+        })
+    if backfill:
+        op.bulk_insert(routes, backfill)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_channel_routes_verify_token_hash'), table_name='channel_routes')
+    op.drop_index(op.f('ix_channel_routes_integration_id'), table_name='channel_routes')
+    op.drop_index('uq_channel_routes_platform_external', table_name='channel_routes')
+    op.drop_table('channel_routes')
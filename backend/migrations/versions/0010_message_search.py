@@ -0,0 +1,62 @@
+"""message search
+
+Full-text index over messages.content. SQLite: an external-content FTS5 table kept in step by
+triggers and rebuilt from the existing rows. Postgres: a GIN index on to_tsvector('simple', content).
+
+Neither is in the model metadata (env.py leaves them out of autogenerate). On SQLite a later batch
+migration that recreates ``messages`` drops the triggers and must create them again.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 05:02:19.634177
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+SQLITE_TRIGGERS = {
+    'messages_fts_insert': (
+        "AFTER INSERT ON messages BEGIN "
+        "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END"
+    ),
+    'messages_fts_delete': (
+        "AFTER DELETE ON messages BEGIN "
+        "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+    ),
+    'messages_fts_update': (
+        "AFTER UPDATE OF content ON messages BEGIN "
+        "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END"
+    ),
+}
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE messages_fts USING fts5("
+            "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        for name, body in SQLITE_TRIGGERS.items():
+            op.execute(f"CREATE TRIGGER {name} {body}")
+        op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.create_index(
+            'ix_messages_content_fts', 'messages', [sa.text("to_tsvector('simple'::regconfig, content)")], unique=False, postgresql_using='gin'
+        )
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for name in SQLITE_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+        op.execute("DROP TABLE IF EXISTS messages_fts")
+    elif dialect == 'postgresql':
+        op.drop_index('ix_messages_content_fts', table_name='messages')
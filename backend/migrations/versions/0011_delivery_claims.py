@@ -0,0 +1,31 @@
+"""delivery claims
+
+messages.delivery_claimed_at lets one worker own a delivery at a time, so replies left pending can be
+swept and resubmitted by any worker without being sent twice. The partial index covers the sweep.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 09:21:44.518032
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('delivery_claimed_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'ix_messages_pending_delivery', 'messages', ['created_at'], unique=False,
+        sqlite_where=sa.text("delivery_status = 'pending'"), postgresql_where=sa.text("delivery_status = 'pending'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_pending_delivery', table_name='messages')
+    # Plain DROP COLUMN, not a batch copy: recreating messages on SQLite would drop the search triggers (0010).
+    op.drop_column('messages', 'delivery_claimed_at')
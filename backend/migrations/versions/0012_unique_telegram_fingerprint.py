@@ -0,0 +1,39 @@
+"""unique telegram fingerprint
+
+One Telegram bot token can only route to one integration. Fingerprints are cleared when an
+integration is disconnected, and the index on integrations.token_fingerprint becomes unique.
+Disconnected rows lose their fingerprint first. When several connected integrations share a bot,
+the oldest keeps it and the others are cleared; saving the token again under them is rejected.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 14:08:31.402577
+"""
+from alembic import op
+
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("UPDATE integrations SET token_fingerprint = NULL WHERE token_fingerprint IS NOT NULL AND status <> 'connected'")
+    op.execute(
+        """
+        UPDATE integrations SET token_fingerprint = NULL
+        WHERE token_fingerprint IS NOT NULL AND id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM integrations WHERE token_fingerprint IS NOT NULL GROUP BY token_fingerprint
+            ) AS kept
+        )
+        """
+    )
+    op.drop_index('ix_integrations_token_fingerprint', table_name='integrations')
+    op.create_index('ix_integrations_token_fingerprint', 'integrations', ['token_fingerprint'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_integrations_token_fingerprint', table_name='integrations')
+    op.create_index('ix_integrations_token_fingerprint', 'integrations', ['token_fingerprint'], unique=False)
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import uuid
+
+# Settings are read once at import time, so the scratch database must be configured before app/ is imported.
+_scratch = tempfile.mkdtemp(prefix="tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_scratch}/test.db",
+    DB_AUTO_MIGRATE="true",
+    AI_PROVIDER="fake",
+    DELIVERY_ENABLED="false",
+    DELIVERY_SWEEP_INTERVAL_SECONDS="0",
+    TELEGRAM_API_URL="http://platforms.test",
+    GRAPH_API_URL="http://platforms.test",
+    META_APP_SECRET="test-meta-secret",
+    ARCHIVE_DIR=f"{_scratch}/archive",
+)
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import ai_provider
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def register_tenant(client) -> dict:
+    """Registers a new company; returns its login response plus ready-made auth headers."""
+    email = f"{uuid.uuid4().hex[:12]}@example.com"
+    password = "secret123"
+    assert client.post("/api/register", json={"name": "Ana Teste", "email": email, "password": password}).status_code == 200
+    login = client.post("/api/login", json={"email": email, "password": password}).json()
+    return {**login, "headers": {"Authorization": f"Bearer {login['access_token']}"}}
+
+
+@pytest.fixture
+def tenant(client):
+    """A freshly registered company."""
+    return register_tenant(client)
+
+
+@pytest.fixture
+def other_tenant(client):
+    """A second company, for checks that one tenant never sees or takes over another's data."""
+    return register_tenant(client)
+
+
+class FailingOnce(ai_provider.FakeProvider):
+    async def _complete(self, **request):
+        if not self.calls:
+            self.calls.append(request)
+            raise RuntimeError("provider unavailable")
+        return await super()._complete(**request)
+
+
+@pytest.fixture
+def failing_provider(monkeypatch):
+    """A fake provider whose first call raises, as an unreachable provider would."""
+    provider = FailingOnce()
+    monkeypatch.setattr(ai_provider, "_provider", provider)
+    return provider
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from app.services.ai_scheduler import Deferred, FairScheduler, Policy
+
+UNLIMITED = Policy(None, None, 1)
+
+
+def test_admits_up_to_capacity_and_queues_the_rest():
+    async def scenario():
+        scheduler = FairScheduler(capacity=2, queue_limit=10)
+        release = asyncio.Event()
+        admitted = []
+
+        async def call(n):
+            async with scheduler.slot(1, UNLIMITED):
+                admitted.append(n)
+                await release.wait()
+
+        tasks = [asyncio.create_task(call(n)) for n in range(3)]
+        await asyncio.sleep(0.01)
+        assert admitted == [0, 1]
+        assert scheduler.stats()["queued"] == 1
+        assert scheduler.tenant_stats(1)["queued"] == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert admitted == [0, 1, 2]
+        assert scheduler.stats()["in_flight"] == 0
+        assert scheduler.tenant_stats(1)["served"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_defers_a_tenant_whose_queue_is_full_without_affecting_others():
+    async def scenario():
+        scheduler = FairScheduler(capacity=1, queue_limit=2)
+        release = asyncio.Event()
+
+        async def call(client_id):
+            async with scheduler.slot(client_id, UNLIMITED):
+                await release.wait()
+
+        # One call holds the only slot, two more wait: tenant 1 is at its queue limit.
+        tasks = [asyncio.create_task(call(1)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert scheduler.tenant_stats(1)["queued"] == 2
+
+        with pytest.raises(Deferred):
+            async with scheduler.slot(1, UNLIMITED):
+                pass
+        assert scheduler.tenant_stats(1)["deferred"] == 1
+
+        other = asyncio.create_task(call(2))
+        await asyncio.sleep(0.01)
+        assert scheduler.tenant_stats(2)["queued"] == 1
+
+        release.set()
+        await asyncio.gather(*tasks, other)
+        stats = scheduler.tenant_stats(2)
+        assert (stats["served"], stats["deferred"]) == (1, 0)
+
+    asyncio.run(scenario())
+
+
+def test_a_burst_from_one_tenant_does_not_starve_another():
+    async def scenario():
+        scheduler = FairScheduler(capacity=1, queue_limit=50)
+        order = []
+
+        async def call(client_id):
+            async with scheduler.slot(client_id, UNLIMITED):
+                order.append(client_id)
+                await asyncio.sleep(0)
+
+        burst = [asyncio.create_task(call(1)) for _ in range(10)]
+        await asyncio.sleep(0)
+        late = asyncio.create_task(call(2))
+        await asyncio.gather(*burst, late)
+        # Tenant 2 arrived after ten queued calls of tenant 1 but is served among the first few.
+        assert order.index(2) <= 2
+
+    asyncio.run(scenario())
+
+
+def test_weight_gives_a_larger_share_of_the_slots():
+    async def scenario():
+        scheduler = FairScheduler(capacity=1, queue_limit=50)
+        order = []
+        gate = asyncio.Event()
+
+        async def call(client_id, policy):
+            async with scheduler.slot(client_id, policy):
+                order.append(client_id)
+                await gate.wait()
+
+        blocker = asyncio.create_task(call(0, UNLIMITED))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(call(1, Policy(None, None, 1))) for _ in range(6)]
+        tasks += [asyncio.create_task(call(2, Policy(None, None, 2))) for _ in range(6)]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(blocker, *tasks)
+        first_six = order[1:7]
+        assert first_six.count(2) == 4 and first_six.count(1) == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        scheduler = FairScheduler(capacity=1, queue_limit=10)
+        release = asyncio.Event()
+
+        async def call():
+            async with scheduler.slot(1, UNLIMITED):
+                await release.wait()
+
+        holder = asyncio.create_task(call())
+        waiter = asyncio.create_task(call())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.tenant_stats(1)["queued"] == 0
+
+        release.set()
+        await holder
+        assert scheduler.stats() == {"capacity": 1, "in_flight": 0, "queued": 0, "tenants_waiting": 0}
+
+    asyncio.run(scenario())
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import ArchiveSegment, Conversation, Message, SystemLog
+from app.services import archive
+
+NOW = datetime(2026, 6, 1, 12, 0)
+
+
+@pytest.fixture
+def history(tenant):
+    """A conversation with three messages past 90 days' retention and one recent, plus one old log."""
+    client_id = tenant["user"]["client_id"]
+    with SessionLocal() as db:
+        conversation = Conversation(client_id=client_id, channel="telegram", external_user_id="42")
+        db.add(conversation)
+        db.flush()
+        old = [
+            Message(conversation_id=conversation.id, sender=sender, content=content, created_at=NOW - timedelta(days=200, minutes=-i))
+            for i, (sender, content) in enumerate([("customer", "Oi"), ("ai", "Olá! Como posso ajudar?"), ("customer", "Qual o horário?")])
+        ]
+        recent = Message(conversation_id=conversation.id, sender="customer", content="Ainda estão abertos?", created_at=NOW - timedelta(days=1))
+        db.add_all([*old, recent, SystemLog(client_id=client_id, category="message", action="message_received", details="antigo", created_at=NOW - timedelta(days=60))])
+        db.commit()
+        return client_id, conversation.id, [m.id for m in old], recent.id
+
+
+def remaining(conversation_id):
+    with SessionLocal() as db:
+        return [id for (id,) in db.query(Message.id).filter(Message.conversation_id == conversation_id).order_by(Message.id)]
+
+
+def test_round_trip(client, tenant, history):
+    client_id, conversation_id, old_ids, recent_id = history
+    with SessionLocal() as db:
+        assert archive.archive_client(db, client_id, 90, 30, batch_size=2, now=NOW) == {"messages": 3, "system_logs": 1}
+        old_logs = db.query(SystemLog).filter(SystemLog.client_id == client_id, SystemLog.created_at < NOW - timedelta(days=30)).count()
+        segments = db.query(ArchiveSegment.path, ArchiveSegment.rows).filter(ArchiveSegment.client_id == client_id, ArchiveSegment.kind == "messages").all()
+
+    assert remaining(conversation_id) == [recent_id]
+    assert old_logs == 0
+    # batch_size=2: one segment per batch, each a complete gzipped NDJSON file.
+    assert [rows for _, rows in segments] == [2, 1]
+    lines = []
+    for path, _ in segments:
+        with gzip.open(Path(settings.archive_dir) / path, "rt", encoding="utf-8") as source:
+            lines += [json.loads(line) for line in source]
+    assert [row["id"] for row in lines] == old_ids
+
+    response = client.get(f"/api/conversations/{conversation_id}/archive", headers=tenant["headers"])
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"message": "Oi", "timestamp": (NOW - timedelta(days=200)).isoformat(), "from": "user"},
+        {"message": "Olá! Como posso ajudar?", "timestamp": (NOW - timedelta(days=200, minutes=-1)).isoformat(), "from": "ai"},
+        {"message": "Qual o horário?", "timestamp": (NOW - timedelta(days=200, minutes=-2)).isoformat(), "from": "user"},
+    ]
+
+
+def test_rows_stay_when_the_segment_cannot_be_written(tenant, history, monkeypatch):
+    client_id, conversation_id, old_ids, recent_id = history
+
+    def disk_full(path, rows):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(archive, "_write", disk_full)
+    with SessionLocal() as db:
+        with pytest.raises(OSError):
+            archive.archive_client(db, client_id, 90, None, batch_size=10, now=NOW)
+        db.rollback()
+        assert db.query(ArchiveSegment).filter(ArchiveSegment.client_id == client_id).count() == 0
+
+    assert remaining(conversation_id) == [*old_ids, recent_id]
@@ -0,0 +1,35 @@
+from app.config import settings
+
+
+def refresh(client, token):
+    return client.post("/api/refresh", json={"refresh_token": token})
+
+
+def test_refresh_rotates_the_token(client, tenant):
+    first = refresh(client, tenant["refresh_token"])
+    assert first.status_code == 200
+    assert first.json()["refresh_token"] != tenant["refresh_token"]
+    assert refresh(client, first.json()["refresh_token"]).status_code == 200
+
+
+def test_reusing_a_rotated_token_revokes_the_family(client, tenant, monkeypatch):
+    monkeypatch.setattr(settings, "refresh_token_reuse_grace_seconds", 0)
+    rotated = refresh(client, tenant["refresh_token"]).json()["refresh_token"]
+
+    assert refresh(client, tenant["refresh_token"]).status_code == 401
+    # The replay revoked every descendant of the login, including the token the legitimate client holds.
+    assert refresh(client, rotated).status_code == 401
+
+
+def test_concurrent_refresh_within_grace_is_only_refused(client, tenant, monkeypatch):
+    monkeypatch.setattr(settings, "refresh_token_reuse_grace_seconds", 60)
+    rotated = refresh(client, tenant["refresh_token"]).json()["refresh_token"]
+
+    assert refresh(client, tenant["refresh_token"]).status_code == 401
+    assert refresh(client, rotated).status_code == 200
+
+
+def test_logout_revokes_the_family(client, tenant):
+    rotated = refresh(client, tenant["refresh_token"]).json()["refresh_token"]
+    assert client.post("/api/logout", json={"refresh_token": rotated}, headers=tenant["headers"]).status_code == 200
+    assert refresh(client, rotated).status_code == 401
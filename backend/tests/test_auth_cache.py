@@ -0,0 +1,27 @@
+import time
+
+from app.db import SessionLocal
+from app.models import User
+from app.services import auth_cache
+
+
+def cache(user: User) -> str:
+    token = f"token-{user.id}-{time.time()}"
+    auth_cache.put(token, {"exp": time.time() + 60}, auth_cache.UserSnapshot.of(user))
+    return token
+
+
+def test_status_change_drops_the_cached_user_only_once_committed(tenant):
+    with SessionLocal() as db:
+        user = db.get(User, tenant["user"]["id"])
+        token = cache(user)
+
+        user.status = "inactive"
+        db.flush()
+        assert auth_cache.get(token) is not None
+        db.rollback()
+        assert auth_cache.get(token) is not None
+
+        user.status = "inactive"
+        db.commit()
+        assert auth_cache.get(token) is None
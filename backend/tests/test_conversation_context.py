@@ -0,0 +1,69 @@
+import pytest
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Conversation, Message
+from app.services import ai_provider, conversation_context
+
+
+@pytest.fixture
+def window(monkeypatch):
+    monkeypatch.setattr(settings, "ai_context_max_messages", 4)
+    monkeypatch.setattr(settings, "ai_context_tokens", 1200)
+
+
+def conversation(client_id: int, *contents: str) -> tuple[int, list[int]]:
+    """A conversation alternating customer and AI turns, one per content."""
+    with SessionLocal() as db:
+        conv = Conversation(client_id=client_id, channel="telegram", external_user_id=f"ctx-{client_id}")
+        db.add(conv)
+        db.flush()
+        messages = [Message(conversation_id=conv.id, sender="customer" if i % 2 == 0 else "ai", content=c) for i, c in enumerate(contents)]
+        db.add_all(messages)
+        db.commit()
+        return conv.id, [m.id for m in messages]
+
+
+def load(conversation_id: int, upto_message_id: int | None = None) -> conversation_context.ConversationContext:
+    with SessionLocal() as db:
+        return conversation_context.load_context(db, conversation_id, upto_message_id)
+
+
+def test_window_keeps_the_newest_turns_oldest_first(tenant, window):
+    conversation_id, _ = conversation(tenant["user"]["client_id"], *(f"mensagem {n}" for n in range(6)))
+
+    context = load(conversation_id)
+    assert [turn["content"] for turn in context.turns] == ["mensagem 2", "mensagem 3", "mensagem 4", "mensagem 5"]
+    assert [turn["role"] for turn in context.turns] == ["user", "assistant", "user", "assistant"]
+    assert context.overflow
+
+
+def test_token_budget_truncates_but_always_keeps_the_newest_turn(tenant, window, monkeypatch):
+    monkeypatch.setattr(settings, "ai_context_tokens", 20)
+    conversation_id, ids = conversation(tenant["user"]["client_id"], "curta", "x" * 40, "y" * 200)
+
+    assert [turn["content"] for turn in load(conversation_id).turns] == ["y" * 200]
+    # Capped at an earlier message, as when replying to the first message of a batch.
+    context = load(conversation_id, upto_message_id=ids[1])
+    assert [turn["content"] for turn in context.turns] == ["curta", "x" * 40]
+    assert not context.overflow
+
+
+def test_refresh_folds_old_turns_and_advances_summary_through_id(client, tenant, window, monkeypatch):
+    monkeypatch.setattr(ai_provider, "_provider", ai_provider.FakeProvider(reply="Cliente pediu uma pizza grande."))
+    client_id = tenant["user"]["client_id"]
+    conversation_id, ids = conversation(client_id, *(f"mensagem {n}" for n in range(10)))
+
+    assert client.portal.call(conversation_context.refresh_summary, client_id, conversation_id)
+    with SessionLocal() as db:
+        summary, through_id = db.query(Conversation.summary, Conversation.summary_through_id).filter(Conversation.id == conversation_id).one()
+    # Folded down to half the window: the two newest turns stay verbatim.
+    assert (summary, through_id) == ("Cliente pediu uma pizza grande.", ids[7])
+
+    context = load(conversation_id)
+    assert context.summary == summary
+    assert [turn["content"] for turn in context.turns] == ["mensagem 8", "mensagem 9"]
+    assert not context.overflow
+
+    # Nothing new fell out of the window: no provider call and no change.
+    assert not client.portal.call(conversation_context.refresh_summary, client_id, conversation_id)
@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+import uuid
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Conversation, Message
+from app.services import delivery
+from app.services.delivery import Dispatcher
+
+
+class Platform:
+    """Scripted Telegram API: answers each sendMessage with the next queued status code."""
+
+    def __init__(self, *statuses: int):
+        self.statuses = list(statuses)
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            return httpx.Response(200, json={"ok": True, "result": {"message_id": len(self.requests)}})
+        return httpx.Response(status, json={"ok": False, "description": "scripted failure"})
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "delivery_backoff_seconds", 0.001)
+    monkeypatch.setattr(settings, "delivery_backoff_max_seconds", 0.001)
+    monkeypatch.setattr(settings, "delivery_max_attempts", 3)
+    monkeypatch.setattr(settings, "delivery_sweep_interval_seconds", 0)
+
+
+@pytest.fixture
+def conversation_id(client, tenant):
+    token = f"{uuid.uuid4().int % 10**9}:{uuid.uuid4().hex}"
+    assert client.post("/api/integrations/telegram", json={"token": token}, headers=tenant["headers"]).status_code == 200
+    with SessionLocal() as db:
+        conversation = Conversation(client_id=tenant["user"]["client_id"], channel="telegram", external_user_id="42")
+        db.add(conversation)
+        db.commit()
+        return conversation.id
+
+
+def pending_reply(conversation_id: int, age: float = 0.0, claimed_age: float | None = None) -> int:
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        message = Message(
+            conversation_id=conversation_id,
+            sender="ai",
+            content="Olá!",
+            delivery_status="pending",
+            created_at=now - timedelta(seconds=age),
+            delivery_claimed_at=now - timedelta(seconds=claimed_age) if claimed_age is not None else None,
+        )
+        db.add(message)
+        db.commit()
+        return message.id
+
+
+def reply(message_id: int) -> Message:
+    with SessionLocal() as db:
+        return db.get(Message, message_id)
+
+
+def dispatcher_for(platform: Platform) -> Dispatcher:
+    dispatcher = Dispatcher(workers=2, queue_size=10)
+    dispatcher._clients["telegram"] = httpx.AsyncClient(transport=httpx.MockTransport(platform))
+    return dispatcher
+
+
+def test_retries_server_errors_then_marks_sent(client, conversation_id):
+    platform = Platform(500, 429, 200)
+    dispatcher = dispatcher_for(platform)
+    message_id = pending_reply(conversation_id)
+
+    client.portal.call(dispatcher.deliver, message_id)
+
+    message = reply(message_id)
+    assert (message.delivery_status, message.delivery_attempts, message.external_id) == ("sent", 3, "3")
+    assert dispatcher.stats()["retries"] == 2
+    assert platform.requests[0].url.path.endswith("/sendMessage")
+
+
+def test_client_error_fails_without_retrying(client, conversation_id):
+    platform = Platform(400)
+    dispatcher = dispatcher_for(platform)
+    message_id = pending_reply(conversation_id)
+
+    client.portal.call(dispatcher.deliver, message_id)
+
+    message = reply(message_id)
+    assert (message.delivery_status, message.delivery_attempts) == ("failed", 1)
+    assert message.delivery_error.startswith("HTTP 400")
+    assert len(platform.requests) == 1
+
+
+def test_gives_up_after_max_attempts(client, conversation_id):
+    platform = Platform(503, 503, 503, 503)
+    dispatcher = dispatcher_for(platform)
+    message_id = pending_reply(conversation_id)
+
+    client.portal.call(dispatcher.deliver, message_id)
+
+    message = reply(message_id)
+    assert (message.delivery_status, message.delivery_attempts) == ("failed", 3)
+    assert len(platform.requests) == 3
+
+
+def test_skips_a_reply_another_worker_is_sending_or_already_sent(client, conversation_id):
+    platform = Platform()
+    dispatcher = dispatcher_for(platform)
+    claimed = pending_reply(conversation_id, claimed_age=1)
+    sent = pending_reply(conversation_id)
+    client.portal.call(dispatcher.deliver, sent)
+
+    client.portal.call(dispatcher.deliver, claimed)
+    client.portal.call(dispatcher.deliver, sent)
+
+    assert reply(claimed).delivery_status == "pending"
+    assert dispatcher.stats()["skipped"] == 2
+    assert len(platform.requests) == 1
+
+
+def test_a_crash_after_the_claim_releases_it(client, conversation_id, monkeypatch):
+    platform = Platform()
+    dispatcher = dispatcher_for(platform)
+    message_id = pending_reply(conversation_id)
+
+    def broken(db, message_id):
+        raise RuntimeError("credentials unreadable")
+
+    load_job = delivery._load_job
+    monkeypatch.setattr(delivery, "_load_job", broken)
+    with pytest.raises(RuntimeError):
+        client.portal.call(dispatcher.deliver, message_id)
+
+    message = reply(message_id)
+    assert (message.delivery_status, message.delivery_claimed_at) == ("pending", None)
+    monkeypatch.setattr(delivery, "_load_job", load_job)
+    client.portal.call(dispatcher.deliver, message_id)
+    assert reply(message_id).delivery_status == "sent"
+
+
+def test_sweep_resubmits_replies_left_pending(client, conversation_id):
+    platform = Platform()
+    dispatcher = dispatcher_for(platform)
+    grace = settings.delivery_pending_grace_seconds
+    stale = pending_reply(conversation_id, age=grace + 5)
+    abandoned = pending_reply(conversation_id, age=grace + 5, claimed_age=settings.delivery_claim_seconds + 5)
+    recent = pending_reply(conversation_id)
+
+    async def sweep_and_drain():
+        dispatcher.start()
+        try:
+            return await dispatcher.sweep()
+        finally:
+            await dispatcher.stop()
+
+    assert client.portal.call(sweep_and_drain) == 2
+    assert reply(stale).delivery_status == "sent"
+    assert reply(abandoned).delivery_status == "sent"
+    assert reply(recent).delivery_status == "pending"
+    assert dispatcher.stats()["swept"] == 2
+
+
+def test_submit_before_start_leaves_the_reply_pending(client, conversation_id):
+    dispatcher = dispatcher_for(Platform())
+    message_id = pending_reply(conversation_id)
+
+    assert dispatcher.submit(message_id, conversation_id) is False
+    assert reply(message_id).delivery_status == "pending"
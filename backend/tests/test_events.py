@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from starlette.websockets import WebSocketDisconnect
+import pytest
+
+from app.db import SessionLocal
+from app.main import notify
+from app.services import events
+
+
+def drain(subscription: events.Subscription) -> list[dict]:
+    seen = []
+    while not subscription.queue.empty():
+        seen.append(subscription.queue.get_nowait())
+    return seen
+
+
+def test_published_after_commit_and_dropped_on_rollback(client, tenant):
+    client_id = tenant["user"]["client_id"]
+
+    async def scenario():
+        subscription = events.bus.subscribe(events.client_topic(client_id))
+        try:
+            with SessionLocal() as db:
+                notify(db, client_id, "test", "descartada")
+                db.rollback()
+                notify(db, client_id, "test", "confirmada")
+                assert drain(subscription) == []
+                db.commit()
+            return [event["content"] for event in drain(subscription)]
+        finally:
+            subscription.close()
+
+    assert client.portal.call(scenario) == ["confirmada"]
+
+
+def test_full_queue_drops_the_oldest_event():
+    async def scenario():
+        bus = events.EventBus(queue_size=2)
+        subscription = bus.subscribe("topic")
+        for n in range(3):
+            bus.publish("topic", {"type": "n", "n": n})
+        return [event["n"] for event in drain(subscription)], bus.stats()["dropped"]
+
+    assert asyncio.run(scenario()) == ([1, 2], 1)
+
+
+class Viewer:
+    """Stands in for the request of an SSE client that disconnects after ``polls`` checks."""
+
+    def __init__(self, polls: int):
+        self.polls = polls
+
+    async def is_disconnected(self) -> bool:
+        self.polls -= 1
+        return self.polls < 0
+
+
+def test_sse_frames_events_and_keepalives_then_unsubscribes(monkeypatch):
+    monkeypatch.setattr(events.settings, "sse_keepalive_seconds", 0.01)
+
+    async def scenario():
+        bus = events.EventBus()
+        subscription = bus.subscribe("topic")
+        bus.publish("topic", {"type": "message", "content": "Oi"})
+        frames = [frame async for frame in events._sse_events(Viewer(polls=2), subscription)]
+        return frames, bus.has_subscribers("topic")
+
+    frames, subscribed = asyncio.run(scenario())
+    assert frames[0] == "retry: 3000\n\n"
+    assert frames[1] == 'event: message\ndata: {"type": "message", "content": "Oi"}\n\n'
+    assert frames[2] == ": keepalive\n\n"
+    assert not subscribed
+
+
+def test_sse_endpoint_requires_a_token(client):
+    assert client.get("/api/events").status_code == 401
+
+
+def test_websocket_pushes_committed_events(client, tenant):
+    client_id = tenant["user"]["client_id"]
+    with client.websocket_connect(f"/api/ws?access_token={tenant['access_token']}") as socket:
+        deadline = time.monotonic() + 5
+        while not events.bus.has_subscribers(events.client_topic(client_id)):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        with SessionLocal() as db:
+            notify(db, client_id, "test", "pelo websocket")
+            db.commit()
+
+        event = socket.receive_json()
+        while event["type"] == "keepalive":
+            event = socket.receive_json()
+        assert (event["type"], event["content"]) == ("notification", "pelo websocket")
+
+
+def test_websocket_rejects_an_invalid_token(client):
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/api/ws?access_token=invalid"):
+            pass
+    assert closed.value.code == 4401
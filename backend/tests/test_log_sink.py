@@ -0,0 +1,81 @@
+import time
+import uuid
+
+import pytest
+
+from app.db import SessionLocal
+from app.models import SystemLog
+from app.services import log_sink
+
+
+@pytest.fixture
+def sinks():
+    started = []
+
+    def start(**options) -> log_sink.BufferedSink:
+        sink = log_sink.BufferedSink(**options)
+        sink.start()
+        started.append(sink)
+        return sink
+
+    yield start
+    for sink in started:
+        sink.stop()
+
+
+def submit(sink, client_id: int, count: int) -> str:
+    marker = uuid.uuid4().hex
+    for n in range(count):
+        sink.submit(SystemLog, client_id=client_id, level="info", category="test", action="sink", details=f"{marker}-{n}")
+    return marker
+
+
+def stored(marker: str) -> int:
+    with SessionLocal() as db:
+        return db.query(SystemLog).filter(SystemLog.details.like(f"{marker}-%")).count()
+
+
+def eventually(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_flushes_as_soon_as_a_batch_is_full(tenant, sinks):
+    sink = sinks(batch_size=3, interval=3600)
+    marker = submit(sink, tenant["user"]["client_id"], 3)
+    assert eventually(lambda: stored(marker) == 3)
+    assert sink.stats()["written"] == 3
+
+
+def test_flushes_a_partial_batch_on_the_interval(tenant, sinks):
+    sink = sinks(batch_size=100, interval=0.05)
+    marker = submit(sink, tenant["user"]["client_id"], 1)
+    assert eventually(lambda: stored(marker) == 1)
+
+
+def test_stop_drains_what_is_still_buffered(tenant):
+    sink = log_sink.BufferedSink(batch_size=100, interval=3600)
+    sink.start()
+    marker = submit(sink, tenant["user"]["client_id"], 2)
+    assert stored(marker) == 0
+
+    sink.stop()
+    assert stored(marker) == 2
+    assert sink.stats()["pending"] == 0
+
+
+def test_rows_reach_the_sink_only_once_committed(tenant, monkeypatch):
+    sink = log_sink.BufferedSink(batch_size=100, interval=3600)
+    monkeypatch.setattr(log_sink, "sink", sink)
+    client_id = tenant["user"]["client_id"]
+    with SessionLocal() as db:
+        log_sink.submit_after_commit(db, SystemLog, client_id=client_id, level="info", category="test", action="sink", details="descartada")
+        db.rollback()
+        log_sink.submit_after_commit(db, SystemLog, client_id=client_id, level="info", category="test", action="sink", details="confirmada")
+        assert sink.stats()["pending"] == 0
+        db.commit()
+    assert [values["details"] for _, values, _ in sink._pending] == ["confirmada"]
@@ -0,0 +1,28 @@
+from app.config import settings
+
+
+def test_endpoint_is_hidden_until_a_token_is_configured(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", None)
+    assert client.get("/api/metrics").status_code == 404
+
+
+def test_scrapes_need_the_configured_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+    assert client.get("/api/metrics").status_code == 401
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    response = client.get("/api/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert response.status_code == 200
+    assert "# TYPE http_requests_total counter" in response.text
+
+
+def test_process_wide_stats_are_only_in_the_metrics(client, tenant, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+
+    stats = client.get("/api/cache-stats", headers=tenant["headers"]).json()
+    assert set(stats) == {"ai_replies", "ai_scheduler"}
+    assert stats["ai_scheduler"]["served"] == 0
+
+    scrape = client.get("/api/metrics", headers={"Authorization": "Bearer scrape-token"}).text
+    assert 'app_component_stat{component="auth",stat="hits"}' in scrape
+    assert 'app_component_stat{component="ai_scheduler",stat="capacity"}' in scrape
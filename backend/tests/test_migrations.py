@@ -0,0 +1,120 @@
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app.db import Base
+from app.schema_version import alembic_config, head_revision
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/migrations.db")
+    yield engine
+    engine.dispose()
+
+
+def migrate(engine, action, revision):
+    config = alembic_config()
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        action(config, revision)
+
+
+def revision(engine):
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def schema_diff(engine):
+    def include_object(obj, name, type_, reflected, compare_to):
+        # Same exclusions as migrations/env.py: the full-text objects are managed by hand.
+        if type_ == "table":
+            return not (name or "").startswith("messages_fts")
+        return name != "ix_messages_content_fts"
+
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={"include_object": include_object, "render_as_batch": True})
+        return compare_metadata(context, Base.metadata)
+
+
+def triggers(engine):
+    with engine.connect() as connection:
+        return {name for (name,) in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+
+
+def test_upgrade_from_empty_matches_the_models(engine):
+    migrate(engine, command.upgrade, "head")
+    assert revision(engine) == head_revision()
+    assert schema_diff(engine) == []
+
+
+def test_downgrade_to_base_and_back(engine):
+    migrate(engine, command.upgrade, "head")
+    migrate(engine, command.downgrade, "base")
+    assert revision(engine) is None
+    assert set(inspect(engine).get_table_names()) == {"alembic_version"}
+
+    migrate(engine, command.upgrade, "head")
+    assert revision(engine) == head_revision()
+    assert schema_diff(engine) == []
+
+
+def test_downgrading_the_latest_revision_keeps_the_search_triggers(engine):
+    migrate(engine, command.upgrade, "head")
+    before = triggers(engine)
+    assert before
+
+    migrate(engine, command.downgrade, "-1")
+    assert triggers(engine) == before
+    migrate(engine, command.upgrade, "head")
+    assert triggers(engine) == before
+    assert schema_diff(engine) == []
+
+
+def test_hot_path_indexes_merge_duplicate_conversations(engine):
+    migrate(engine, command.upgrade, "0001a")
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO conversations (id, client_id, channel, external_user_id, status, created_at) VALUES "
+                "(1, 1, 'telegram', '42', 'bot', '2026-01-01'), (2, 1, 'telegram', '42', 'bot', '2026-01-02'), "
+                "(3, 1, 'telegram', '43', 'bot', '2026-01-03')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO messages (id, conversation_id, sender, content, created_at) VALUES "
+                "(1, 1, 'customer', 'Oi', '2026-01-01'), (2, 2, 'customer', 'Oi de novo', '2026-01-02'), "
+                "(3, 3, 'customer', 'Olá', '2026-01-03')"
+            )
+        )
+        # Records every message the merge rewrites: only those of the duplicate conversation should be.
+        connection.execute(text("CREATE TABLE rewritten (message_id INTEGER)"))
+        connection.execute(text("CREATE TRIGGER log_rewrite AFTER UPDATE ON messages BEGIN INSERT INTO rewritten VALUES (new.id); END"))
+
+    migrate(engine, command.upgrade, "0002")
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT id, conversation_id FROM messages ORDER BY id")).all() == [(1, 1), (2, 1), (3, 3)]
+        assert connection.execute(text("SELECT id FROM conversations ORDER BY id")).all() == [(1,), (3,)]
+        assert connection.execute(text("SELECT message_id FROM rewritten")).all() == [(2,)]
+
+
+def test_unique_telegram_fingerprint_keeps_the_oldest_connected_bot(engine):
+    migrate(engine, command.upgrade, "0011")
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO integrations (id, client_id, platform, status, config, token_fingerprint, created_at) VALUES "
+                "(1, 1, 'telegram', 'disconnected', '{}', 'bot-a', '2026-01-01'), (2, 2, 'telegram', 'connected', '{}', 'bot-a', '2026-01-02'), "
+                "(3, 3, 'telegram', 'connected', '{}', 'bot-a', '2026-01-03'), (4, 4, 'telegram', 'connected', '{}', 'bot-b', '2026-01-04')"
+            )
+        )
+
+    migrate(engine, command.upgrade, "0012")
+
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT id, token_fingerprint FROM integrations ORDER BY id")).all()
+    assert rows == [(1, None), (2, "bot-a"), (3, None), (4, "bot-b")]
@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from fastapi import HTTPException
+import pytest
+
+from app.db import SessionLocal
+from app.models import Conversation, Message
+from app.pagination import decode_cursor, decode_score_cursor, encode_cursor, encode_score_cursor
+
+TIE = datetime(2026, 3, 1, 9, 30)
+
+
+def test_cursors_round_trip():
+    assert decode_cursor(encode_cursor(TIE, 42)) == (TIE, 42)
+    assert decode_score_cursor(encode_score_cursor(-1.25e-06, 7)) == (-1.25e-06, 7)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "bm90aGluZw", "MjAyNi0wMy0wMXxhYmM", "é"])
+def test_invalid_cursors_are_rejected(cursor):
+    for decode in (decode_cursor, decode_score_cursor):
+        with pytest.raises(HTTPException) as error:
+            decode(cursor)
+        assert error.value.status_code == 400
+
+
+def conversations(client_id: int, count: int) -> list[int]:
+    """Newest first, as the list returns them; all but the last share one created_at."""
+    with SessionLocal() as db:
+        rows = [
+            Conversation(client_id=client_id, channel="telegram", external_user_id=f"page-{n}", created_at=TIE if n else datetime(2026, 2, 1))
+            for n in range(count)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [row.id for row in sorted(rows, key=lambda row: (row.created_at, row.id), reverse=True)]
+
+
+def test_conversation_pages_walk_ties_without_gaps_or_repeats(client, tenant):
+    expected = conversations(tenant["user"]["client_id"], 5)
+
+    seen, cursor = [], None
+    while True:
+        response = client.get("/api/conversations", params={"limit": 2, "messages": 0, **({"cursor": cursor} if cursor else {})}, headers=tenant["headers"])
+        assert response.status_code == 200
+        seen += [int(id) for id in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+
+
+def test_full_last_page_has_no_cursor(client, tenant):
+    conversations(tenant["user"]["client_id"], 2)
+    response = client.get("/api/conversations", params={"limit": 2}, headers=tenant["headers"])
+    assert len(response.json()) == 2
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_message_pages_walk_ties_backwards(client, tenant):
+    with SessionLocal() as db:
+        conv = Conversation(client_id=tenant["user"]["client_id"], channel="telegram", external_user_id="pages")
+        db.add(conv)
+        db.flush()
+        rows = [Message(conversation_id=conv.id, sender="customer", content=f"mensagem {n}", created_at=TIE) for n in range(5)]
+        db.add_all(rows)
+        db.commit()
+        conversation_id = conv.id
+
+    pages, before = [], None
+    while True:
+        params = {"limit": 2, **({"before": before} if before else {})}
+        page = client.get(f"/api/conversations/{conversation_id}/messages", params=params, headers=tenant["headers"]).json()
+        pages.append([m["message"] for m in page["messages"]])
+        before = page["next_cursor"]
+        if not before:
+            break
+    # Each page is in reading order; pages go back in time.
+    assert pages == [["mensagem 3", "mensagem 4"], ["mensagem 1", "mensagem 2"], ["mensagem 0"]]
+
+
+def test_endpoints_reject_an_invalid_cursor(client, tenant):
+    assert client.get("/api/conversations", params={"cursor": "not-a-cursor"}, headers=tenant["headers"]).status_code == 400
+    with SessionLocal() as db:
+        conv = Conversation(client_id=tenant["user"]["client_id"], channel="telegram", external_user_id="bad-cursor")
+        db.add(conv)
+        db.commit()
+        conversation_id = conv.id
+    response = client.get(f"/api/conversations/{conversation_id}/messages", params={"before": "not-a-cursor"}, headers=tenant["headers"])
+    assert response.status_code == 400
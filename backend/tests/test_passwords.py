@@ -0,0 +1,22 @@
+import asyncio
+
+from app.services.passwords import PasswordHasher
+
+
+def test_recovers_from_a_worker_that_died():
+    async def scenario():
+        hasher = PasswordHasher(workers=1, rounds=4)
+        try:
+            hashed = await hasher.hash("secret123")
+            broken = hasher._pool()
+            for process in list(broken._processes.values()):
+                process.kill()
+                process.join()
+
+            assert (await hasher.verify("secret123", hashed))[0]
+            assert hasher._pool() is not broken
+            assert hasher.stats()["restarts"] == 1
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(scenario())
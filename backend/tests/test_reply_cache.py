@@ -0,0 +1,63 @@
+import pytest
+
+from app.config import settings
+from app.db import AsyncSessionLocal, SessionLocal
+from app.main import generate_ai_reply
+from app.models import Conversation, Message
+from app.services import ai_provider
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(settings, "ai_reply_cache", True)
+    provider = ai_provider.FakeProvider()
+    monkeypatch.setattr(ai_provider, "_provider", provider)
+    return provider
+
+
+def conversation(client_id: int, external_user_id: str, *history: tuple[str, str]) -> int:
+    with SessionLocal() as db:
+        conversation = Conversation(client_id=client_id, channel="telegram", external_user_id=external_user_id)
+        db.add(conversation)
+        db.flush()
+        db.add_all(Message(conversation_id=conversation.id, sender=sender, content=content) for sender, content in history)
+        db.commit()
+        return conversation.id
+
+
+def ask(client, client_id: int, conversation_id: int, text: str) -> str:
+    with SessionLocal() as db:
+        message = Message(conversation_id=conversation_id, sender="customer", content=text)
+        db.add(message)
+        db.commit()
+        message_id = message.id
+
+    async def generate():
+        async with AsyncSessionLocal() as db:
+            reply = await generate_ai_reply(db, client_id, text, conversation_id, message_id)
+            await db.commit()
+            return reply
+
+    return client.portal.call(generate)
+
+
+def test_opening_question_is_answered_from_the_cache(client, tenant, provider):
+    client_id = tenant["user"]["client_id"]
+
+    first = ask(client, client_id, conversation(client_id, "500"), "Qual o horário?")
+    second = ask(client, client_id, conversation(client_id, "600"), "qual o horario")
+
+    assert second == first
+    assert len(provider.calls) == 1
+
+
+def test_same_short_answer_after_different_histories_is_not_shared(client, tenant, provider):
+    client_id = tenant["user"]["client_id"]
+    pizza = conversation(client_id, "500", ("customer", "Quero uma pizza grande"), ("ai", "Confirma a pizza grande?"))
+    cancel = conversation(client_id, "600", ("customer", "Quero cancelar meu pedido"), ("ai", "Confirma o cancelamento?"))
+
+    ask(client, client_id, pizza, "sim")
+    ask(client, client_id, cancel, "sim")
+
+    assert len(provider.calls) == 2
+    assert provider.calls[-1]["messages"][1]["content"] == "Quero cancelar meu pedido"
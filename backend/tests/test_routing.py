@@ -0,0 +1,63 @@
+import uuid
+
+import pytest
+
+from app.db import SessionLocal
+from app.services import routing
+
+
+def save_whatsapp(client, tenant, phone_number_id, verify_token="wa-verify"):
+    return client.post(
+        "/api/integrations/whatsapp",
+        json={"phone_number_id": phone_number_id, "access_token": "wa-token", "verify_token": verify_token},
+        headers=tenant["headers"],
+    )
+
+
+def resolve(phone_number_id):
+    with SessionLocal() as db:
+        return routing.resolve_meta(db, "whatsapp", phone_number_id)
+
+
+@pytest.fixture
+def phone_number_id():
+    return uuid.uuid4().hex[:15]
+
+
+def test_routes_follow_the_connected_phone_number(client, tenant, phone_number_id):
+    assert save_whatsapp(client, tenant, phone_number_id).status_code == 200
+    route = resolve(phone_number_id)
+    assert route.client_id == tenant["user"]["client_id"]
+
+    replacement = uuid.uuid4().hex[:15]
+    assert save_whatsapp(client, tenant, replacement).status_code == 200
+    assert resolve(phone_number_id) is None
+    assert resolve(replacement) == route
+
+    assert client.delete("/api/integrations/whatsapp", headers=tenant["headers"]).status_code == 200
+    assert resolve(replacement) is None
+
+
+def test_account_connected_to_another_client_is_a_conflict(client, tenant, other_tenant, phone_number_id):
+    assert save_whatsapp(client, tenant, phone_number_id).status_code == 200
+
+    taken = save_whatsapp(client, other_tenant, phone_number_id)
+    assert taken.status_code == 409
+    assert resolve(phone_number_id).client_id == tenant["user"]["client_id"]
+    # Saving again under the same client is an update, not a conflict.
+    assert save_whatsapp(client, tenant, phone_number_id).status_code == 200
+
+
+def test_verify_token_lookup(client, tenant, phone_number_id):
+    verify_token = f"verify-{phone_number_id}"
+    assert save_whatsapp(client, tenant, phone_number_id, verify_token).status_code == 200
+
+    def verify(token):
+        return client.get("/api/webhook/whatsapp", params={"mode": "subscribe", "challenge": "1234", "hub.verify_token": token})
+
+    answered = verify(verify_token)
+    assert (answered.status_code, answered.json()) == (200, 1234)
+    assert verify("wrong-token").status_code == 403
+
+    assert client.delete("/api/integrations/whatsapp", headers=tenant["headers"]).status_code == 200
+    assert verify(verify_token).status_code == 403
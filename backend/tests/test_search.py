@@ -0,0 +1,67 @@
+import uuid
+
+import pytest
+
+from app.db import SessionLocal
+from app.models import Conversation, Message
+from app.services import search
+
+
+@pytest.fixture(params=["fts5", "fallback"])
+def backend(request, monkeypatch):
+    if request.param == "fallback":
+        # Same database, but as one without a full-text index would be searched.
+        monkeypatch.setattr(search, "QUERIES", {})
+    return request.param
+
+
+def seed(client_id: int, channel: str, *contents: str) -> list[int]:
+    with SessionLocal() as db:
+        conversation = Conversation(client_id=client_id, channel=channel, external_user_id=uuid.uuid4().hex[:12])
+        db.add(conversation)
+        db.flush()
+        messages = [Message(conversation_id=conversation.id, sender="customer", content=content) for content in contents]
+        db.add_all(messages)
+        db.commit()
+        return [m.id for m in messages]
+
+
+def find(client, tenant, q, **params):
+    response = client.get("/api/search/messages", params={"q": q, **params}, headers=tenant["headers"])
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_only_the_tenants_own_messages_are_found(client, tenant, other_tenant, backend):
+    own = seed(tenant["user"]["client_id"], "telegram", "Quero um pedido de pizza")
+    seed(other_tenant["user"]["client_id"], "telegram", "Quero um pedido de pizza")
+
+    results = find(client, tenant, "pedido pizza")["results"]
+    assert [hit["id"] for hit in results] == own
+    assert "<mark>" in results[0]["snippet"]
+
+
+def test_channel_filter(client, tenant, backend):
+    client_id = tenant["user"]["client_id"]
+    seed(client_id, "telegram", "Qual o horário de entrega?")
+    whatsapp = seed(client_id, "whatsapp", "Qual o horário de entrega?")
+
+    results = find(client, tenant, "entrega", channel="whatsapp")["results"]
+    assert [(hit["id"], hit["platform"]) for hit in results] == [(whatsapp[0], "whatsapp")]
+
+
+def test_cursor_walks_every_match_once(client, tenant, backend):
+    ids = seed(tenant["user"]["client_id"], "telegram", *(f"Reserva número {n} para hoje" for n in range(5)), "Sem relação")
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = find(client, tenant, "reserva", limit=2, **({"cursor": cursor} if cursor else {}))
+        seen += [hit["id"] for hit in page["results"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert pages == 3
+    assert sorted(seen) == sorted(ids[:5])
+    assert len(seen) == len(set(seen))
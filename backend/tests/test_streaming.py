@@ -0,0 +1,66 @@
+import pytest
+
+from app.config import settings
+from app.db import AsyncSessionLocal, SessionLocal
+from app.main import _store_ai_reply, generate_ai_reply
+from app.models import Conversation, Message
+from app.services import ai_provider, events
+
+
+class BrokenStream(ai_provider.FakeProvider):
+    async def _stream(self, **request):
+        yield "Olá,"
+        raise RuntimeError("connection reset by provider")
+
+
+@pytest.fixture
+def question(tenant, monkeypatch):
+    monkeypatch.setattr(settings, "ai_streaming", True)
+    client_id = tenant["user"]["client_id"]
+    with SessionLocal() as db:
+        conversation = Conversation(client_id=client_id, channel="telegram", external_user_id="stream")
+        db.add(conversation)
+        db.flush()
+        message = Message(conversation_id=conversation.id, sender="customer", content="Oi")
+        db.add(message)
+        db.commit()
+        return client_id, conversation.id, message.id
+
+
+def watch(client, question) -> tuple[list[str], BaseException | None]:
+    """Replies to and stores ``question`` while subscribed to its conversation; returns the event types seen and any error."""
+    client_id, conversation_id, message_id = question
+
+    async def scenario():
+        subscription = events.bus.subscribe(events.conversation_topic(conversation_id))
+        error = None
+        try:
+            async with AsyncSessionLocal() as db:
+                try:
+                    reply = await generate_ai_reply(db, client_id, "Oi", conversation_id, message_id)
+                    await db.run_sync(_store_ai_reply, client_id, conversation_id, reply)
+                except RuntimeError as exc:
+                    error = exc
+            seen = []
+            while (event := await subscription.get(timeout=0.05)) is not None:
+                seen.append(event["type"])
+            return seen, error
+        finally:
+            subscription.close()
+
+    return client.portal.call(scenario)
+
+
+def test_stream_ends_with_ai_done_once_stored(client, question, monkeypatch):
+    monkeypatch.setattr(ai_provider, "_provider", ai_provider.FakeProvider(reply="Olá, tudo bem?"))
+    seen, error = watch(client, question)
+    assert error is None
+    assert seen[0] == "ai_start" and seen[-1] == "ai_done"
+    assert set(seen[1:-1]) == {"ai_delta"}
+
+
+def test_provider_error_mid_stream_ends_with_ai_error(client, question, monkeypatch):
+    monkeypatch.setattr(ai_provider, "_provider", BrokenStream())
+    seen, error = watch(client, question)
+    assert isinstance(error, RuntimeError)
+    assert seen == ["ai_start", "ai_delta", "ai_error"]
@@ -0,0 +1,77 @@
+import uuid
+
+import pytest
+
+from app.db import SessionLocal
+from app.models import Conversation, Integration, Message
+from app.security import encrypt_secret
+from app.services import routing
+
+
+@pytest.fixture
+def bot_token(client, tenant):
+    token = f"{uuid.uuid4().int % 10**9}:{uuid.uuid4().hex}"
+    assert client.post("/api/integrations/telegram", json={"token": token}, headers=tenant["headers"]).status_code == 200
+    return token
+
+
+def update(token, update_id, text="Oi", sender=42):
+    return {"token": token, "update_id": update_id, "message": {"text": text, "from": {"id": sender}}}
+
+
+def senders(client_id):
+    with SessionLocal() as db:
+        return [
+            sender
+            for (sender,) in db.query(Message.sender)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .filter(Conversation.client_id == client_id)
+            .order_by(Message.id)
+        ]
+
+
+def test_retry_after_a_provider_error_is_answered_once(client, tenant, bot_token, failing_provider):
+    with pytest.raises(RuntimeError):
+        client.post("/api/webhook/telegram", json=update(bot_token, 1))
+
+    assert client.post("/api/webhook/telegram", json=update(bot_token, 1)).json()["reply"]
+    assert client.post("/api/webhook/telegram", json=update(bot_token, 1)).json() == {"ok": True, "duplicate": True}
+    assert senders(tenant["user"]["client_id"]) == ["customer", "ai"]
+
+
+def test_updates_are_routed_by_bot_token(client, tenant, bot_token):
+    assert client.post("/api/webhook/telegram", json=update("123:unknown", 1)).status_code == 404
+
+    assert client.post("/api/webhook/telegram", json=update(bot_token, 1)).json()["reply"]
+    assert senders(tenant["user"]["client_id"]) == ["customer", "ai"]
+
+
+def test_bot_connected_to_another_client_is_a_conflict(client, tenant, other_tenant, bot_token):
+    taken = client.post("/api/integrations/telegram", json={"token": bot_token}, headers=other_tenant["headers"])
+    assert taken.status_code == 409
+    assert client.post("/api/webhook/telegram", json=update(bot_token, 1)).status_code == 200
+    assert senders(tenant["user"]["client_id"]) == ["customer", "ai"]
+
+    # Once disconnected, the bot is free for another client.
+    assert client.delete("/api/integrations/telegram", headers=tenant["headers"]).status_code == 200
+    assert client.post("/api/integrations/telegram", json={"token": bot_token}, headers=other_tenant["headers"]).status_code == 200
+    assert client.post("/api/webhook/telegram", json=update(bot_token, 2)).status_code == 200
+    assert senders(other_tenant["user"]["client_id"]) == ["customer", "ai"]
+
+
+def test_backfill_fingerprints_each_connected_bot_once(tenant, other_tenant):
+    token = f"{uuid.uuid4().int % 10**9}:{uuid.uuid4().hex}"
+    with SessionLocal() as db:
+        rows = [
+            Integration(client_id=tenant["user"]["client_id"], platform="telegram", status="connected", config={"token": encrypt_secret(token)}),
+            Integration(client_id=other_tenant["user"]["client_id"], platform="telegram", status="connected", config={"token": encrypt_secret(token)}),
+            Integration(client_id=other_tenant["user"]["client_id"], platform="telegram", status="disconnected", config={"token": encrypt_secret(token)}),
+        ]
+        db.add_all(rows)
+        db.commit()
+        ids = [row.id for row in rows]
+
+        assert routing.backfill_telegram_fingerprints(db, batch_size=1) >= 1
+        fingerprints = [db.get(Integration, id).token_fingerprint for id in ids]
+        assert fingerprints[0] is not None and fingerprints[1:] == [None, None]
+        assert routing.resolve_telegram(db, token).integration_id == ids[0]
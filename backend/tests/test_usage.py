@@ -0,0 +1,49 @@
+import pytest
+
+from app.config import settings
+from app.db import SessionLocal
+from app.services import usage
+
+
+@pytest.fixture
+def batcher(monkeypatch):
+    monkeypatch.setattr(settings, "ai_usage_batch_size", 3)
+    batcher = usage.UsageBatcher(batch_size=3, interval=3600)
+    monkeypatch.setattr(usage, "batcher", batcher)
+    return batcher
+
+
+def stored(client_id):
+    with SessionLocal() as db:
+        return usage.get_ai_usage(db, client_id) - usage.batcher.pending(client_id, usage.current_period())
+
+
+def test_increments_count_only_once_committed(tenant, batcher):
+    client_id = tenant["user"]["client_id"]
+    with SessionLocal() as db:
+        usage.record_ai_message(db, client_id)
+        assert batcher.pending(client_id, usage.current_period()) == 0
+        db.rollback()
+        usage.record_ai_message(db, client_id)
+        db.commit()
+    assert batcher.pending(client_id, usage.current_period()) == 1
+
+
+def test_batch_written_by_a_rolled_back_transaction_is_requeued(tenant, batcher):
+    client_id = tenant["user"]["client_id"]
+    with SessionLocal() as db:
+        for _ in range(3):
+            usage.record_ai_message(db, client_id)
+            db.commit()
+        assert batcher.pending(client_id, usage.current_period()) == 3
+
+        usage.record_ai_message(db, client_id)
+        assert batcher.pending(client_id, usage.current_period()) == 0
+        db.rollback()
+    assert batcher.pending(client_id, usage.current_period()) == 3
+    assert stored(client_id) == 0
+
+    with SessionLocal() as db:
+        usage.record_ai_message(db, client_id)
+        db.commit()
+    assert (stored(client_id), batcher.pending(client_id, usage.current_period())) == (3, 1)
@@ -0,0 +1,52 @@
+import logging
+
+import pytest
+
+from app.services import warmup
+
+
+def broken():
+    raise RuntimeError("could not connect to postgresql://app:s3cret@db/app")
+
+
+@pytest.fixture
+def state(monkeypatch):
+    state = warmup.State()
+    monkeypatch.setattr(warmup, "state", state)
+    return state
+
+
+def test_ready_lists_each_step_once_warm(client, state):
+    client.portal.call(warmup.run)
+
+    response = client.get("/api/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready", "checks": dict.fromkeys(warmup.STEPS, "ok")}
+
+
+def test_failed_step_is_reported_without_its_error(client, state, monkeypatch):
+    monkeypatch.setattr(warmup, "_preload", broken)
+    with pytest.raises(RuntimeError):
+        client.portal.call(warmup.run)
+
+    response = client.get("/api/ready")
+    assert response.status_code == 503
+    assert response.json()["checks"] == {"db_pool": "ok", "async_db_pool": "ok", "mappers": "ok", "caches": "failed", "clients": "pending"}
+    assert "s3cret" not in response.text
+
+
+def test_failure_is_logged_and_retried(client, state, monkeypatch, caplog):
+    calls = []
+
+    def fails_once():
+        calls.append(1)
+        if len(calls) == 1:
+            broken()
+        return 0, 0, set()
+
+    monkeypatch.setattr(warmup, "_preload", fails_once)
+    monkeypatch.setattr(warmup, "RETRY_SECONDS", 0)
+    with caplog.at_level(logging.ERROR, logger=warmup.__name__):
+        client.portal.call(warmup._run_until_ready)
+    assert "s3cret" in caplog.text
+    assert state.ready
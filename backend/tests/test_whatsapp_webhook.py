@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import json
+import uuid
+
+import pytest
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import Conversation, Message
+from app.services import dedup, metrics
+
+
+@pytest.fixture
+def phone_number_id(client, tenant):
+    phone_number_id = uuid.uuid4().hex[:15]
+    saved = client.post(
+        "/api/integrations/whatsapp",
+        json={"phone_number_id": phone_number_id, "access_token": "wa-token", "verify_token": "wa-verify"},
+        headers=tenant["headers"],
+    )
+    assert saved.status_code == 200
+    return phone_number_id
+
+
+def post_signed(client, payload):
+    body = json.dumps(payload).encode()
+    signature = "sha256=" + hmac.new(settings.meta_app_secret.encode(), body, hashlib.sha256).hexdigest()
+    return client.post("/api/webhook/whatsapp", content=body, headers={"X-Hub-Signature-256": signature, "Content-Type": "application/json"})
+
+
+def delivery(phone_number_id, *messages):
+    return {
+        "entry": [
+            {
+                "changes": [
+                    {
+                        "value": {
+                            "metadata": {"phone_number_id": phone_number_id},
+                            "messages": [{"id": wamid, "from": sender, "text": {"body": text}} for wamid, sender, text in messages],
+                        }
+                    }
+                ]
+            }
+        ]
+    }
+
+
+def test_batch_stores_each_message_once_and_replies_to_it(client, tenant, phone_number_id):
+    payload = delivery(
+        phone_number_id,
+        (f"wamid.{phone_number_id}.1", "5511900000001", "Oi"),
+        (f"wamid.{phone_number_id}.2", "5511900000002", "Qual o horário?"),
+        (f"wamid.{phone_number_id}.1", "5511900000001", "Oi"),
+    )
+    response = post_signed(client, payload)
+    assert response.status_code == 200
+    assert response.json() == {"ok": True, "processed": 2, "duplicates": 1}
+
+    with SessionLocal() as db:
+        rows = (
+            db.query(Conversation.external_user_id, Message.sender)
+            .join(Message, Message.conversation_id == Conversation.id)
+            .filter(Conversation.client_id == tenant["user"]["client_id"])
+            .all()
+        )
+    assert sorted(rows) == [("5511900000001", "ai"), ("5511900000001", "customer"), ("5511900000002", "ai"), ("5511900000002", "customer")]
+
+
+def test_redelivery_is_dropped_in_memory(client, phone_number_id):
+    payload = delivery(phone_number_id, (f"wamid.{phone_number_id}.1", "5511900000001", "Oi"))
+    assert post_signed(client, payload).json()["processed"] == 1
+
+    before = dedup.webhooks.stats()["by_platform"].get("whatsapp", {}).get("memory", 0)
+    assert post_signed(client, payload).json() == {"ok": True, "processed": 0, "duplicates": 1}
+    assert dedup.webhooks.stats()["by_platform"]["whatsapp"]["memory"] == before + 1
+    assert 'webhook_duplicates_total{platform="whatsapp",layer="memory"}' in metrics.render()
+
+
+def test_redelivery_missed_by_memory_is_dropped_by_the_database(client, phone_number_id):
+    key = f"wamid.{phone_number_id}.1"
+    payload = delivery(phone_number_id, (key, "5511900000001", "Oi"))
+    assert post_signed(client, payload).json()["processed"] == 1
+
+    # Another worker, or this one after its entry expired: only the unique dedup_key can catch it.
+    dedup.webhooks.forget(f"whatsapp:{phone_number_id}:{key}")
+    before = dedup.webhooks.stats()["by_platform"].get("whatsapp", {}).get("database", 0)
+    assert post_signed(client, payload).json() == {"ok": True, "processed": 0, "duplicates": 1}
+    assert dedup.webhooks.stats()["by_platform"]["whatsapp"]["database"] == before + 1
+
+    with SessionLocal() as db:
+        assert db.query(Message).filter(Message.dedup_key == f"whatsapp:{phone_number_id}:{key}").count() == 1
+
+
+def test_retry_of_a_message_that_was_never_answered_is_answered(client, tenant, phone_number_id, failing_provider):
+    key = f"wamid.{phone_number_id}.1"
+    payload = delivery(phone_number_id, (key, "5511900000001", "Oi"))
+    with pytest.raises(RuntimeError):
+        post_signed(client, payload)
+
+    assert post_signed(client, payload).json() == {"ok": True, "processed": 1, "duplicates": 0}
+    assert post_signed(client, payload).json() == {"ok": True, "processed": 0, "duplicates": 1}
+    with SessionLocal() as db:
+        senders = (
+            db.query(Message.sender)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .filter(Conversation.client_id == tenant["user"]["client_id"])
+            .order_by(Message.id)
+            .all()
+        )
+    assert senders == [("customer",), ("ai",)]
+
+
+def test_unsigned_delivery_is_rejected(client, phone_number_id):
+    payload = delivery(phone_number_id, (f"wamid.{phone_number_id}.1", "5511900000001", "Oi"))
+    assert client.post("/api/webhook/whatsapp", json=payload).status_code == 403